@@ -1,50 +1,251 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
+import concurrent.futures
+import json
+import os
+import queue
+import socket
 import time
 
-from retrieval.search import run_search, find_explanation
+from retrieval.search import (
+  async_run_search,
+  find_explanation,
+  find_session_explanation,
+  extract_github_base_url,
+  file_recommendations_to_json,
+  SEARCH_MODES,
+  SEARCH_MODE_BFS,
+  SEARCH_TIMEOUT_SECONDS,
+)
+from retrieval.admission import search_admission, AdmissionRejected
+from retrieval.multi_processor_utils import background_loop
+from retrieval.metrics import Trace, traced, render_metrics
+from retrieval.sessions import create_session, get_session
+from retrieval.jobs import submit_index_job, get_index_job, job_runner
 
 app = Flask(__name__)
 # Configure CORS to allow requests from http://localhost:3000
-CORS(app, resources={r"/search": {"origins": "http://localhost:3000"}, r"/comment": {"origins": "http://localhost:3000"}})
+CORS(app, resources={r"/search": {"origins": "http://localhost:3000", "expose_headers": ["X-Search-Session", "X-Search-Partial"]}, r"/search/stream": {"origins": "http://localhost:3000"}, r"/comment": {"origins": "http://localhost:3000"}, r"/repos.*": {"origins": "http://localhost:3000"}})
+
+# How often a waiting request checks whether its client is still connected.
+DISCONNECT_POLL_SECONDS = float(os.getenv("DISCONNECT_POLL_SECONDS", "0.5"))
+# Searches return partial results at their deadline on their own; one still running this long
+# after it is cancelled.
+SEARCH_DEADLINE_GRACE_SECONDS = float(os.getenv("SEARCH_DEADLINE_GRACE_SECONDS", "5"))
+
+
+class SearchAbandoned(Exception):
+    pass
+
+
+def client_disconnected():
+    """
+    Whether the client has closed its connection. gunicorn and the Werkzeug server expose
+    the socket, which reads as closed (b"") without consuming anything; other servers are
+    assumed to keep the client.
+    """
+    sock = request.environ.get('gunicorn.socket') or request.environ.get('werkzeug.socket')
+    if sock is None:
+        return False
+    try:
+        return sock.recv(1, socket.MSG_PEEK | socket.MSG_DONTWAIT) == b''
+    except (BlockingIOError, ValueError):
+        return False
+    except OSError:
+        return True
+
+
+def wait_for_search(future, deadline):
+    """
+    Wait for a search running on the background loop. It is cancelled, stopping its model
+    and GitHub requests, if the client disconnects (SearchAbandoned) or the deadline passes
+    (TimeoutError).
+    """
+    while True:
+        remaining = deadline - time.monotonic()
+        done, _ = concurrent.futures.wait([future], timeout=max(0, min(DISCONNECT_POLL_SECONDS, remaining)))
+        if done:
+            return future.result()
+        if client_disconnected():
+            future.cancel()
+            raise SearchAbandoned()
+        if remaining <= 0:
+            future.cancel()
+            raise TimeoutError()
+
+
+def parse_deadline(data):
+    """
+    The search's time budget in seconds from the request's optional "deadline", capped at
+    SEARCH_TIMEOUT_SECONDS, or None for the default. Raises ValueError if it is not a
+    positive number.
+    """
+    deadline = data.get('deadline')
+    if deadline is None:
+        return None
+    if isinstance(deadline, bool) or not isinstance(deadline, (int, float)) or not deadline > 0:
+        raise ValueError("deadline must be a positive number of seconds")
+    return min(float(deadline), SEARCH_TIMEOUT_SECONDS)
+
+
+def overloaded(error):
+    response = jsonify({'error': str(error)})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
 
 @app.route('/search', methods=['POST'])
 def search():
     data = request.get_json()
     github_url = data.get('github_url')
     query = data.get('query')
+    mode = data.get('mode', SEARCH_MODE_BFS)
+    trace = Trace() if data.get('trace') else None
     print(f"Received GitHub URL: {github_url}")
     print(f"Received Query: {query}")
+    if mode not in SEARCH_MODES:
+        return jsonify({'error': f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+    try:
+        deadline = parse_deadline(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        admission = search_admission.acquire()
+    except AdmissionRejected as e:
+        return overloaded(e)
 
     start = time.time()
-    result = run_search(github_url, query)
+    with admission:
+        search = async_run_search(github_url, query, mode, deadline=deadline)
+        future = background_loop.submit(traced(trace, search) if trace else search)
+        try:
+            result = wait_for_search(future, time.monotonic() + (deadline or SEARCH_TIMEOUT_SECONDS) + SEARCH_DEADLINE_GRACE_SECONDS)
+        except SearchAbandoned:
+            print(f"Search ({mode}) abandoned by the client after {time.time() - start} seconds.")
+            return jsonify({'error': 'Client disconnected.'}), 499
+        except TimeoutError:
+            print(f"Search ({mode}) timed out after {time.time() - start} seconds.")
+            return jsonify({'error': f"Search did not finish within {deadline or SEARCH_TIMEOUT_SECONDS:g} seconds."}), 504
     end = time.time()
-    print(f"Search took {end - start} seconds to run.")
+    print(f"Search ({mode}) took {end - start} seconds to run{' (partial)' if result.partial else ''}.")
 
     response = {}
     for file_recommendations in result.files:
-        response[file_recommendations.file_name] = []
-        for function_def in file_recommendations.snippets:
-            response[file_recommendations.file_name].append({
-                f"{function_def.line_start}:{function_def.line_end}": function_def.code
-            })
+        response[file_recommendations.file_name] = file_recommendations_to_json(file_recommendations)
 
-    return jsonify(response)
+    if trace:
+        # File names are the top-level keys otherwise, so a traced response nests them.
+        response = jsonify({'results': response, 'partial': result.partial, 'trace': trace.to_json()})
+    else:
+        response = jsonify(response)
+    # Follow-up /comment requests refer to these results by session ID.
+    response.headers['X-Search-Session'] = create_session(github_url, query, result)
+    if result.partial:
+        # The search hit its deadline; these are the best results it had by then.
+        response.headers['X-Search-Partial'] = 'true'
+    return response
+
+@app.route('/search/stream', methods=['POST'])
+def search_stream():
+    """
+    Same search as /search, streamed as newline-delimited JSON: a "directory" event per
+    directory visited, a "file" event per file as soon as its snippets are resolved, and
+    a final "done" (or "error") event. The done event carries the session_id /comment accepts,
+    whether the search stopped at its deadline with partial results, and with "trace": true
+    the trace as well.
+    """
+    data = request.get_json()
+    github_url = data.get('github_url')
+    query = data.get('query')
+    mode = data.get('mode', SEARCH_MODE_BFS)
+    trace = Trace() if data.get('trace') else None
+    print(f"Received GitHub URL: {github_url}")
+    print(f"Received Query: {query}")
+    if mode not in SEARCH_MODES:
+        return jsonify({'error': f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+    try:
+        deadline = parse_deadline(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    try:
+        admission = search_admission.acquire()
+    except AdmissionRejected as e:
+        return overloaded(e)
+
+    def generate():
+        events = queue.Queue()
+        start = time.time()
+        cutoff = time.monotonic() + (deadline or SEARCH_TIMEOUT_SECONDS) + SEARCH_DEADLINE_GRACE_SECONDS
+        search = async_run_search(github_url, query, mode, on_event=events.put, deadline=deadline)
+        future = background_loop.submit(traced(trace, search) if trace else search)
+        future.add_done_callback(lambda _: events.put(None))
+        try:
+            while True:
+                try:
+                    event = events.get(timeout=DISCONNECT_POLL_SECONDS)
+                except queue.Empty:
+                    # Nothing is written while the search is quiet, so check on the client directly.
+                    if client_disconnected():
+                        return
+                    if time.monotonic() >= cutoff:
+                        future.cancel()
+                        yield json.dumps({'type': 'error', 'message': 'Search timed out.'}) + "\n"
+                        return
+                    continue
+                if event is None:
+                    break
+                yield json.dumps(event) + "\n"
+
+            try:
+                result = future.result()
+                done = {'type': 'done', 'files': len(result.files), 'seconds': time.time() - start,
+                        'partial': result.partial, 'session_id': create_session(github_url, query, result)}
+                if trace:
+                    done['trace'] = trace.to_json()
+                yield json.dumps(done) + "\n"
+            except Exception as e:
+                print(f"Search failed: {e}")
+                yield json.dumps({'type': 'error', 'message': 'Search failed.'}) + "\n"
+        finally:
+            # Runs when the client disconnects too, so abandoned searches stop early.
+            future.cancel()
+            admission.release()
+            print(f"Search ({mode}) took {time.time() - start} seconds to run.")
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    # The generator never runs if the client leaves before the first read; free the slot anyway.
+    response.call_on_close(admission.release)
+    return response
 
 @app.route('/comment', methods=['POST'])
 def comment():
+    """
+    Explain a line of a search result. Send the session_id of the search (from its done
+    event or X-Search-Session header) with current_file and current_line; current_context,
+    the full results, is still accepted in place of a session_id.
+    """
     data = request.get_json()
-    print("Received data:", data)
     query = data.get('query')
-    current_context = data.get('current_context')
+    session_id = data.get('session_id')
     current_file = data.get('current_file')
     current_line = data.get('current_line')
     print(f"Received Query: {query}")
-    print(f"Received Current Context: {current_context}")
+    print(f"Received Session: {session_id}")
     print(f"Received Current File: {current_file}")
     print(f"Received Current Line: {current_line}")
 
-    find_explanation_response = find_explanation(query, current_context, current_file, current_line)
+    if session_id:
+        session = get_session(session_id)
+        if session is None:
+            return jsonify({'error': 'Unknown or expired session_id.'}), 404
+        find_explanation_response = find_session_explanation(query, session, current_file, current_line)
+    else:
+        find_explanation_response = find_explanation(query, data.get('current_context'), current_file, current_line)
+    if find_explanation_response is None:
+        return jsonify({'error': 'No search result covers that line.'}), 404
     print(find_explanation_response)
 
     mock_response = {
@@ -53,6 +254,43 @@ def comment():
 
     return jsonify(mock_response)
 
+@app.route('/repos', methods=['POST'])
+def index_repo():
+    """
+    Queue a repository for indexing (snapshot, symbol index and summaries) ahead of its
+    first search. Higher priorities run first; a repository already queued or being indexed
+    returns its existing job. Poll GET /repos/jobs/<id> for the status.
+    """
+    data = request.get_json()
+    github_url = data.get('github_url')
+    priority = data.get('priority', 0)
+    if not github_url or not isinstance(priority, int):
+        return jsonify({'error': 'github_url is required and priority must be an integer'}), 400
+    try:
+        base_url = extract_github_base_url(github_url)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    job = submit_index_job(base_url, priority)
+    print(f"Queued indexing of {base_url}: job {job['id']} ({job['status']})")
+    return jsonify(job), 202
+
+@app.route('/repos/jobs/<job_id>', methods=['GET'])
+def index_job(job_id):
+    job = get_index_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 if __name__ == '__main__':
+    # Resume indexing jobs queued before a restart without waiting for a /repos request. The
+    # reloader runs this file in a watching parent and a serving child (WERKZEUG_RUN_MAIN
+    # set); only the child may work the queue. gunicorn starts it in post_worker_init.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        job_runner.start()
     app.run(debug=True, host='127.0.0.1', port=3002)
 
@@ -0,0 +1,256 @@
+"""
+A local stand-in for the parts of the GitHub REST API the backend uses, serving directories
+on disk as repositories: commits/HEAD, git/trees (recursive), git/blobs, tarball and contents.
+
+Object SHAs are computed the way git does, so a directory edited between requests gets a new
+HEAD while the trees and blobs of earlier states stay available. Point the backend at it with
+GITHUB_API_URL=http://127.0.0.1:<port> (and REPO_SNAPSHOTS=0 to exercise the API paths).
+"""
+import argparse
+import base64
+import hashlib
+import io
+import json
+import os
+import tarfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse, parse_qs
+
+IGNORED_NAMES = {".git", "__pycache__"}
+
+
+def git_object_sha(kind, data):
+  return hashlib.sha1(f"{kind} {len(data)}\0".encode() + data).hexdigest()
+
+
+class RepoState:
+  """
+  The objects of one directory scan: trees by SHA (as lists of entries) and blob paths by SHA.
+  """
+  def __init__(self, root):
+    self.trees = {}
+    self.blobs = {}
+    self.sha = self._scan(root)
+
+  def _scan(self, path):
+    entries = []
+    for name in sorted(os.listdir(path)):
+      if name in IGNORED_NAMES:
+        continue
+      full_path = os.path.join(path, name)
+      if os.path.isdir(full_path):
+        entries.append({"name": name, "mode": "040000", "type": "tree", "sha": self._scan(full_path)})
+      elif os.path.isfile(full_path):
+        with open(full_path, "rb") as f:
+          data = f.read()
+        sha = git_object_sha("blob", data)
+        self.blobs[sha] = full_path
+        entries.append({"name": name, "mode": "100644", "type": "blob", "sha": sha, "size": len(data)})
+
+    # git orders tree entries as if directory names ended in "/".
+    entries.sort(key=lambda e: e["name"] + ("/" if e["type"] == "tree" else ""))
+    data = b"".join(
+      f"{e['mode'].lstrip('0')} {e['name']}\0".encode() + bytes.fromhex(e["sha"]) for e in entries
+    )
+    sha = git_object_sha("tree", data)
+    self.trees[sha] = entries
+    return sha
+
+
+def walk_tree(trees, tree_sha, prefix=""):
+  """
+  Yield (path, entry) for everything below a tree, parents before their children.
+  """
+  for entry in trees[tree_sha]:
+    path = prefix + entry["name"]
+    yield path, entry
+    if entry["type"] == "tree":
+      yield from walk_tree(trees, entry["sha"], path + "/")
+
+
+class FakeGitHubServer:
+  """
+  Serves {"owner/repo": directory} from a background thread. HEAD is rescanned on every
+  commits/HEAD request; the SHA of the root tree doubles as the commit SHA. Each response
+  is delayed by latency seconds, standing in for the network.
+  """
+  def __init__(self, repos, host="127.0.0.1", port=0, latency=0.0):
+    self.repos = repos
+    self.latency = latency
+    self.stats = Counter()
+    self._states = {}
+    self._objects = {}
+    self._lock = threading.Lock()
+    self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+    self._httpd.daemon_threads = True
+
+  @property
+  def base_url(self):
+    host, port = self._httpd.server_address[:2]
+    return f"http://{host}:{port}"
+
+  def start(self):
+    threading.Thread(target=self.serve_forever, daemon=True).start()
+    return self
+
+  def serve_forever(self):
+    self._httpd.serve_forever()
+
+  def stop(self):
+    self._httpd.shutdown()
+    self._httpd.server_close()
+
+  def head(self, repo):
+    state = RepoState(self.repos[repo])
+    with self._lock:
+      self._states[repo] = state
+      # Keep every scanned object so trees and blobs of earlier commits still resolve.
+      objects = self._objects.setdefault(repo, {"trees": {}, "blobs": {}})
+      objects["trees"].update(state.trees)
+      objects["blobs"].update(state.blobs)
+    return state
+
+  def current(self, repo):
+    with self._lock:
+      state = self._states.get(repo)
+    return state or self.head(repo)
+
+  def handle(self, path, query):
+    """
+    Return (status, payload, content_type) for a GET request.
+    """
+    parts = [unquote(p) for p in path.strip("/").split("/")]
+    if len(parts) < 4 or parts[0] != "repos" or f"{parts[1]}/{parts[2]}" not in self.repos:
+      return 404, {"message": "Not Found"}, None
+    repo, rest = f"{parts[1]}/{parts[2]}", parts[3:]
+    self.stats[rest[0] if rest[0] != "git" else "/".join(rest[:2])] += 1
+
+    if rest == ["commits", "HEAD"]:
+      return 200, self.head(repo).sha, "text/plain"
+    if rest[:2] == ["git", "trees"] and len(rest) == 3:
+      return self.tree(repo, rest[2], query.get("recursive") is not None)
+    if rest[:2] == ["git", "blobs"] and len(rest) == 3:
+      return self.blob(repo, rest[2])
+    if rest[0] == "tarball" and len(rest) == 2:
+      return self.tarball(repo, rest[1])
+    if rest[0] == "contents":
+      return self.contents(repo, "/".join(rest[1:]))
+    return 404, {"message": "Not Found"}, None
+
+  def tree(self, repo, sha, recursive):
+    self.current(repo)
+    with self._lock:
+      objects = self._objects[repo]
+      if sha not in objects["trees"]:
+        return 404, {"message": "Not Found"}, None
+      trees = dict(objects["trees"])
+
+    if recursive:
+      entries = [self._tree_entry(path, entry) for path, entry in walk_tree(trees, sha)]
+    else:
+      entries = [self._tree_entry(entry["name"], entry) for entry in trees[sha]]
+    return 200, {"sha": sha, "tree": entries, "truncated": False}, None
+
+  def _tree_entry(self, path, entry):
+    tree_entry = {"path": path, "mode": entry["mode"], "type": entry["type"], "sha": entry["sha"]}
+    if "size" in entry:
+      tree_entry["size"] = entry["size"]
+    return tree_entry
+
+  def blob(self, repo, sha):
+    self.current(repo)
+    with self._lock:
+      path = self._objects[repo]["blobs"].get(sha)
+    if not path or not os.path.isfile(path):
+      return 404, {"message": "Not Found"}, None
+    with open(path, "rb") as f:
+      data = f.read()
+    return 200, {"sha": sha, "size": len(data), "encoding": "base64",
+                 "content": base64.b64encode(data).decode("ascii")}, None
+
+  def tarball(self, repo, sha):
+    # Only HEAD is available, since older versions of the files are no longer on disk.
+    state = self.current(repo)
+    if sha != state.sha:
+      return 404, {"message": "Not Found"}, None
+    buffer = io.BytesIO()
+    prefix = f"{repo.replace('/', '-')}-{sha[:7]}"
+    with tarfile.open(fileobj=buffer, mode="w:gz") as tar:
+      for path, entry in walk_tree(state.trees, sha):
+        if entry["type"] == "blob":
+          tar.add(state.blobs[entry["sha"]], arcname=f"{prefix}/{path}")
+    return 200, buffer.getvalue(), "application/x-gzip"
+
+  def contents(self, repo, path):
+    root = os.path.realpath(self.repos[repo])
+    full_path = os.path.realpath(os.path.join(root, path))
+    if full_path != root and not full_path.startswith(root + os.sep) or not os.path.exists(full_path):
+      return 404, {"message": "Not Found"}, None
+
+    if os.path.isdir(full_path):
+      items = []
+      for name in sorted(os.listdir(full_path)):
+        if name in IGNORED_NAMES:
+          continue
+        item_type = "dir" if os.path.isdir(os.path.join(full_path, name)) else "file"
+        items.append({"name": name, "path": f"{path}/{name}".strip("/"), "type": item_type})
+      return 200, items, None
+
+    with open(full_path, "rb") as f:
+      data = f.read()
+    return 200, {"name": os.path.basename(full_path), "path": path, "type": "file", "encoding": "base64",
+                 "sha": git_object_sha("blob", data), "content": base64.b64encode(data).decode("ascii")}, None
+
+  def _handler_class(self):
+    server = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = "HTTP/1.1"
+
+      def do_GET(self):
+        if server.latency:
+          time.sleep(server.latency)
+        url = urlparse(self.path)
+        status, payload, content_type = server.handle(url.path, parse_qs(url.query, keep_blank_values=True))
+        if isinstance(payload, bytes):
+          data = payload
+        elif isinstance(payload, str):
+          data = payload.encode("utf-8")
+        else:
+          data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type or "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+      def log_message(self, format, *args):
+        pass
+
+    return Handler
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Serve local directories through a GitHub REST API stand-in.")
+  parser.add_argument("repos", nargs="+", help="owner/repo=path pairs")
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=8002)
+  parser.add_argument("--latency", type=float, default=0.0, help="Delay of every response in seconds.")
+  args = parser.parse_args()
+
+  repos = dict(pair.split("=", 1) for pair in args.repos)
+  server = FakeGitHubServer(repos, args.host, args.port, args.latency)
+  print(f"Serving {', '.join(repos)} at {server.base_url} (set GITHUB_API_URL to this URL)")
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.stop()
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,366 @@
+"""
+A local stand-in for the Fireworks chat completions API.
+
+Responses are replayed from a recordings file when the exact (model, prompt) pair was seen
+before, and otherwise generated by a deterministic lexical heuristic that reads the prompt
+formats in retrieval/prompts.py. With --record, misses are forwarded to the real API and the
+answers saved, so a benchmark run can be reproduced later without network access.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from retrieval.chunking import estimate_tokens
+from retrieval.lexical_index import tokenize
+from retrieval.prompts import (
+  RELEVANT_FILES_KEY,
+  RELEVANT_DIRECTORIES_KEY,
+  RELEVANT_FUNCTIONS_KEY,
+  RELEVANT_CLASSES_KEY,
+)
+
+UPSTREAM_BASE_URL = "https://api.fireworks.ai/inference/v1"
+EXPLANATION_ANSWER = "This line is part of the snippet you selected; it works together with the surrounding code to answer your query."
+
+_TRIAGE_RE = re.compile(
+  r"Here is a list of directories codebase:\n(.*?)\nHere is a list of files in the codebase:\n(.*?)\nThe query is: (.*?)\n",
+  re.S)
+_QUERY_RE = re.compile(r"<<<< USER QUERY >>>>\n(.*?)\n<<<< END USER QUERY >>>>", re.S)
+_FILE_SECTION_RE = re.compile(r"<<<< FILE: (.+?) >>>>\n(.*?)<<<< END FILE: \1 >>>>", re.S)
+_REPAIR_RE = re.compile(r"<<<< TEXT >>>>\n(.*?)\n<<<< END TEXT >>>>", re.S)
+_FILE_CONTENTS_RE = re.compile(r"<<<< FILE (?:CONTENTS|OUTLINE) >>>>\n(.*?)<<<< END FILE (?:CONTENTS|OUTLINE) >>>>", re.S)
+# Python, JavaScript/TypeScript and Go definitions, with a following Python docstring or a
+# preceding doc comment.
+_DEFINITION_RE = re.compile(
+  r"(?:^[ \t]*(?:/\*\*|//)[ \t]*([^\n]*?)(?:\*/)?[ \t]*\n)?"
+  r"^[ \t]*(?:(?:export|default|async|abstract|public|private|static)\s+)*"
+  r"(?:(def|function\*?|func|class|interface)\s+(?:\([^)]*\)\s*)?(\w+)"
+  r"|(?:const|let)\s+(\w+)\s*=\s*(?:async\s*)?(?:\([^)]*\)|\w+)(?:\s*:[^=\n]+)?\s*=>"
+  r"|(?!(?:if|for|while|switch|catch|return|function|constructor)\b)(\w+)(?:<[^>\n]*>)?\(.*\)[^\n;]*\{[ \t]*$)"
+  r"[^\n]*\n(?:\s*(?:\"\"\"|''')([^\n]*))?", re.M)
+CLASS_KEYWORDS = ("class", "interface")
+
+
+def prompt_key(model, prompt):
+  return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+
+def overlap(query_terms, text):
+  return len(query_terms & set(tokenize(text)))
+
+
+def rank_names(query_terms, entries, limit):
+  scored = [(overlap(query_terms, f"{name} {summary}"), i, name) for i, (name, summary) in enumerate(entries)]
+  scored = [s for s in scored if s[0] > 0]
+  scored.sort(key=lambda s: (-s[0], s[1]))
+  return [name for _, _, name in scored[:limit]]
+
+
+def parse_entries(listing):
+  # Entries are "name" or "name - summary".
+  return [tuple(line.split(" - ", 1)) if " - " in line else (line, "") for line in listing.splitlines() if line.strip()]
+
+
+def answer_directory_triage(directories, files, query):
+  query_terms = set(tokenize(query))
+  directories = parse_entries(directories)
+  files = parse_entries(files)
+  picked_files = rank_names(query_terms, files, 3)
+  picked_directories = rank_names(query_terms, directories, 3)
+  # The prompt asks to favor recall on directories, so fill the remaining slots in listing
+  # order, skipping directories whose summary already showed they do not match unless
+  # nothing matched at all.
+  remaining = [(name, summary) for name, summary in directories if name not in picked_directories]
+  if picked_directories or picked_files:
+    remaining = [(name, summary) for name, summary in remaining if not summary]
+  picked_directories += [name for name, _ in remaining][:3 - len(picked_directories)]
+  return {RELEVANT_DIRECTORIES_KEY: picked_directories, RELEVANT_FILES_KEY: picked_files}
+
+
+def answer_symbols(code, query, max_functions=3, max_classes=3, favor_recall=False):
+  query_terms = set(tokenize(query))
+  scored = []
+  for i, match in enumerate(_DEFINITION_RE.finditer(code)):
+    comment, keyword, name, arrow_name, method_name, docstring = match.groups()
+    kind = "class" if keyword in CLASS_KEYWORDS else "def"
+    name = name or arrow_name or method_name
+    doc = docstring or comment or ""
+    score = overlap(query_terms, name) + overlap(query_terms, doc)
+    if score:
+      scored.append((score, i, kind, name))
+  if not scored:
+    return {RELEVANT_FUNCTIONS_KEY: [], RELEVANT_CLASSES_KEY: []}
+
+  # Favoring precision keeps only the best-matching names; an outline pass keeps any match.
+  threshold = 1 if favor_recall else max(s[0] for s in scored)
+  scored.sort(key=lambda s: (-s[0], s[1]))
+  functions = [name for score, _, kind, name in scored if kind == "def" and score >= threshold]
+  classes = [name for score, _, kind, name in scored if kind == "class" and score >= threshold]
+  return {
+    RELEVANT_FUNCTIONS_KEY: list(dict.fromkeys(functions))[:max_functions],
+    RELEVANT_CLASSES_KEY: list(dict.fromkeys(classes))[:max_classes],
+  }
+
+
+def close_json(text):
+  """
+  Repair a JSON object cut short: drop anything before its first brace and close whatever
+  strings, arrays and objects are still open.
+  """
+  text = text[text.find("{"):] if "{" in text else "{}"
+  closers = []
+  in_string = escaped = False
+  for char in text:
+    if in_string:
+      if escaped:
+        escaped = False
+      elif char == "\\":
+        escaped = True
+      elif char == '"':
+        in_string = False
+    elif char == '"':
+      in_string = True
+    elif char in "{[":
+      closers.append("}" if char == "{" else "]")
+    elif char in "}]" and closers:
+      closers.pop()
+  return text + ('"' if in_string else "") + "".join(reversed(closers))
+
+
+def malform(content, n):
+  """
+  The n-th malformed answer: alternately wrapped in prose and a code fence, as models do
+  without a JSON mode, and cut short before its closing brace.
+  """
+  if n % 2:
+    return f"Here are the most relevant results:\n```json\n{content}\n```\nLet me know if you need more."
+  return content[:-1]
+
+
+def heuristic_answer(prompt):
+  """
+  Answer a search prompt by matching query words against the names it offers.
+  """
+  repair = _REPAIR_RE.search(prompt)
+  if repair:
+    return close_json(repair.group(1))
+
+  triage = _TRIAGE_RE.search(prompt)
+  if triage:
+    return json.dumps(answer_directory_triage(*triage.groups()))
+
+  query_match = _QUERY_RE.search(prompt)
+  if not query_match:
+    return EXPLANATION_ANSWER
+  query = query_match.group(1).strip()
+  if "<<<< LINE USER IS POINTING TO >>>>" in prompt:
+    return EXPLANATION_ANSWER
+
+  sections = _FILE_SECTION_RE.findall(prompt)
+  if sections:
+    return json.dumps({file_name: answer_symbols(code, query) for file_name, code in sections})
+
+  contents = _FILE_CONTENTS_RE.search(prompt)
+  code = contents.group(1) if contents else ""
+  if "<<<< FILE OUTLINE >>>>" in prompt:
+    return json.dumps(answer_symbols(code, query, max_functions=8, max_classes=4, favor_recall=True))
+  return json.dumps(answer_symbols(code, query))
+
+
+class FakeModelServer:
+  """
+  OpenAI-compatible /v1/chat/completions endpoint served from a background thread.
+  Each response is delayed by latency + latency_per_1k_tokens per thousand prompt tokens.
+  With fail_every=n, every n-th request is rejected with a 429 to exercise retries, and with
+  malformed_every=n every n-th JSON answer to a request without a response_format is
+  malformed (a request with one is answered as if decoding were constrained to JSON).
+  """
+  def __init__(self, host="127.0.0.1", port=0, latency=0.0, latency_per_1k_tokens=0.0,
+               recordings_path=None, record=False, upstream_base_url=UPSTREAM_BASE_URL, fail_every=0,
+               malformed_every=0):
+    self.fail_every = fail_every
+    self.malformed_every = malformed_every
+    self._received = 0
+    self._json_answers = 0
+    self.latency = latency
+    self.latency_per_1k_tokens = latency_per_1k_tokens
+    self.recordings_path = recordings_path
+    self.record = record
+    self.upstream_base_url = upstream_base_url
+    self.recordings = {}
+    if recordings_path and os.path.exists(recordings_path):
+      with open(recordings_path) as f:
+        self.recordings = json.load(f)
+    self.stats = {"requests": 0, "replayed": 0, "recorded": 0, "generated": 0, "rejected": 0, "malformed": 0}
+    self._lock = threading.Lock()
+    self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+    self._httpd.daemon_threads = True
+    self._thread = None
+
+  @property
+  def base_url(self):
+    host, port = self._httpd.server_address[:2]
+    return f"http://{host}:{port}/v1"
+
+  def start(self):
+    self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+    self._thread.start()
+    return self
+
+  def serve_forever(self):
+    self._httpd.serve_forever()
+
+  def stop(self):
+    self._httpd.shutdown()
+    self._httpd.server_close()
+
+  def should_reject(self):
+    with self._lock:
+      self._received += 1
+      reject = bool(self.fail_every) and self._received % self.fail_every == 0
+      if reject:
+        self.stats["rejected"] += 1
+      return reject
+
+  def maybe_malform(self, body, content):
+    if not self.malformed_every or body.get("response_format") or not content.startswith("{"):
+      return content
+    with self._lock:
+      self._json_answers += 1
+      n = self._json_answers // self.malformed_every
+      if self._json_answers % self.malformed_every:
+        return content
+      self.stats["malformed"] += 1
+    return malform(content, n)
+
+  def _count(self, name):
+    with self._lock:
+      self.stats["requests"] += 1
+      self.stats[name] += 1
+
+  def _fetch_upstream(self, body):
+    response = requests.post(
+      f"{self.upstream_base_url}/chat/completions",
+      json={**body, "stream": False},
+      headers={"Authorization": f"Bearer {os.environ['FIREWORKS_API_KEY']}"},
+      timeout=120,
+    )
+    response.raise_for_status()
+    return response.json()["choices"][0]["message"]["content"]
+
+  def complete(self, body):
+    model = body.get("model", "")
+    prompt = "\n".join(m.get("content", "") for m in body.get("messages", []))
+    key = prompt_key(model, prompt)
+
+    with self._lock:
+      content = self.recordings.get(key)
+    if content is not None:
+      self._count("replayed")
+    elif self.record:
+      content = self._fetch_upstream(body)
+      with self._lock:
+        self.recordings[key] = content
+        self._save_recordings()
+      self._count("recorded")
+    else:
+      content = heuristic_answer(prompt)
+      self._count("generated")
+    content = self.maybe_malform(body, content)
+
+    prompt_tokens = estimate_tokens(prompt)
+    completion_tokens = estimate_tokens(content)
+    time.sleep(self.latency + self.latency_per_1k_tokens * prompt_tokens / 1000)
+    return {
+      "id": f"fake-{key[:16]}",
+      "object": "chat.completion",
+      "created": int(time.time()),
+      "model": model,
+      "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": content},
+        "finish_reason": "stop",
+      }],
+      "usage": {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+      },
+    }
+
+  def _save_recordings(self):
+    if not self.recordings_path:
+      return
+    tmp_path = self.recordings_path + ".tmp"
+    with open(tmp_path, "w") as f:
+      json.dump(self.recordings, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, self.recordings_path)
+
+  def _handler_class(self):
+    server = self
+
+    class Handler(BaseHTTPRequestHandler):
+      protocol_version = "HTTP/1.1"
+
+      def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+          self._send(404, {"error": {"message": f"Unknown path {self.path}"}})
+          return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if server.should_reject():
+          self._send(429, {"error": {"message": "Rate limit exceeded (injected)"}}, {"Retry-After": "0.1"})
+          return
+        try:
+          self._send(200, server.complete(body))
+        except requests.RequestException as e:
+          self._send(502, {"error": {"message": f"Upstream request failed: {e}"}})
+
+      def _send(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+          self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+      def log_message(self, format, *args):
+        pass
+
+    return Handler
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Serve a local stand-in for the Fireworks chat completions API.")
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=8001)
+  parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response.")
+  parser.add_argument("--latency-per-1k-tokens", type=float, default=0.0, help="Seconds added per 1000 prompt tokens.")
+  parser.add_argument("--recordings", help="JSON file of recorded responses to replay.")
+  parser.add_argument("--record", action="store_true", help="Forward unrecorded prompts to Fireworks and save the answers.")
+  parser.add_argument("--fail-every", type=int, default=0, help="Reject every n-th request with a 429.")
+  parser.add_argument("--malformed-every", type=int, default=0,
+                      help="Malform every n-th JSON answer to requests without a response_format.")
+  args = parser.parse_args()
+
+  server = FakeModelServer(args.host, args.port, args.latency, args.latency_per_1k_tokens, args.recordings, args.record,
+                           fail_every=args.fail_every, malformed_every=args.malformed_every)
+  print(f"Serving fake model API at {server.base_url} (set FIREWORKS_API_BASE to this URL)")
+  try:
+    server.serve_forever()
+  except KeyboardInterrupt:
+    pass
+  finally:
+    server.stop()
+
+
+if __name__ == "__main__":
+  main()
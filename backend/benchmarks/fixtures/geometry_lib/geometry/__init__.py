@@ -0,0 +1 @@
+from geometry.point import Point2D, distance
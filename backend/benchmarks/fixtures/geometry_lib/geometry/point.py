@@ -0,0 +1,29 @@
+"""Points in the plane."""
+import math
+
+
+class Point2D:
+    """A point with x and y coordinates."""
+
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def distance_to(self, other):
+        """Euclidean distance between this point and another."""
+        return math.hypot(self.x - other.x, self.y - other.y)
+
+    def translate(self, dx, dy):
+        return Point2D(self.x + dx, self.y + dy)
+
+    def __repr__(self):
+        return f"Point2D({self.x}, {self.y})"
+
+
+def distance(p, q):
+    """Euclidean distance between two points."""
+    return p.distance_to(q)
+
+
+def midpoint(p, q):
+    return Point2D((p.x + q.x) / 2, (p.y + q.y) / 2)
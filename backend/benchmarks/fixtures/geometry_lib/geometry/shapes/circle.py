@@ -0,0 +1,20 @@
+import math
+
+from geometry.point import distance
+
+
+class Circle:
+    def __init__(self, center, radius):
+        self.center = center
+        self.radius = radius
+
+    def area(self):
+        """Area of the circle."""
+        return math.pi * self.radius ** 2
+
+    def circumference(self):
+        return 2 * math.pi * self.radius
+
+    def contains(self, point):
+        """Whether the point lies inside or on the circle."""
+        return distance(self.center, point) <= self.radius
@@ -0,0 +1,36 @@
+from geometry.point import distance
+
+
+def polygon_area(points):
+    """Area of a simple polygon using the shoelace formula."""
+    total = 0
+    for i, p in enumerate(points):
+        q = points[(i + 1) % len(points)]
+        total += p.x * q.y - q.x * p.y
+    return abs(total) / 2
+
+
+def polygon_perimeter(points):
+    """Sum of the edge lengths of a closed polygon."""
+    return sum(distance(p, points[(i + 1) % len(points)]) for i, p in enumerate(points))
+
+
+def convex_hull(points):
+    """Convex hull of a set of points using Andrew's monotone chain."""
+    points = sorted(points, key=lambda p: (p.x, p.y))
+    if len(points) <= 2:
+        return points
+
+    def cross(o, a, b):
+        return (a.x - o.x) * (b.y - o.y) - (a.y - o.y) * (b.x - o.x)
+
+    lower, upper = [], []
+    for p in points:
+        while len(lower) >= 2 and cross(lower[-2], lower[-1], p) <= 0:
+            lower.pop()
+        lower.append(p)
+    for p in reversed(points):
+        while len(upper) >= 2 and cross(upper[-2], upper[-1], p) <= 0:
+            upper.pop()
+        upper.append(p)
+    return lower[:-1] + upper[:-1]
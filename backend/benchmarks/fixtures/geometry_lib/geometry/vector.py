@@ -0,0 +1,30 @@
+"""Vectors in the plane."""
+import math
+
+
+class Vector2D:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+    def __add__(self, other):
+        return Vector2D(self.x + other.x, self.y + other.y)
+
+    def dot(self, other):
+        """Dot product of two vectors."""
+        return self.x * other.x + self.y * other.y
+
+    def cross(self, other):
+        return self.x * other.y - self.y * other.x
+
+    def length(self):
+        return math.hypot(self.x, self.y)
+
+    def normalized(self):
+        length = self.length()
+        return Vector2D(self.x / length, self.y / length)
+
+
+def angle_between(u, v):
+    """Angle in radians between two vectors."""
+    return math.acos(u.dot(v) / (u.length() * v.length()))
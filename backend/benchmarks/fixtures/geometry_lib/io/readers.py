@@ -0,0 +1,15 @@
+import csv
+
+from geometry.point import Point2D
+
+
+def parse_point(text):
+    """Parse a point written as "x,y"."""
+    x, y = text.split(",")
+    return Point2D(float(x), float(y))
+
+
+def read_points_csv(path):
+    """Read points from a CSV file with x and y columns."""
+    with open(path, newline="") as f:
+        return [Point2D(float(row["x"]), float(row["y"])) for row in csv.DictReader(f)]
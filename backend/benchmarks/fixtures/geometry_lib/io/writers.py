@@ -0,0 +1,6 @@
+import json
+
+
+def write_points_json(points, path):
+    with open(path, "w") as f:
+        json.dump([{"x": p.x, "y": p.y} for p in points], f)
@@ -0,0 +1,5 @@
+from geometry.point import Point2D, distance
+
+
+def test_distance():
+    assert distance(Point2D(0, 0), Point2D(3, 4)) == 5
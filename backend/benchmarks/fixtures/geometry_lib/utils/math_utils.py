@@ -0,0 +1,12 @@
+def clamp(value, low, high):
+    """Limit value to the range [low, high]."""
+    return max(low, min(high, value))
+
+
+def lerp(a, b, t):
+    """Linear interpolation between a and b."""
+    return a + (b - a) * t
+
+
+def almost_equal(a, b, tolerance=1e-9):
+    return abs(a - b) <= tolerance
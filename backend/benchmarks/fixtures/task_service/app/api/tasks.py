@@ -0,0 +1,20 @@
+from app.storage.models import Task
+
+
+def create_task(db, owner_id, title, due=None):
+    task = Task(owner_id=owner_id, title=title, due=due)
+    db.save(task)
+    return task
+
+
+def complete_task(db, task_id):
+    """Mark a task as done."""
+    task = db.get(Task, task_id)
+    task.done = True
+    db.save(task)
+    return task
+
+
+def list_overdue_tasks(db, now):
+    """Tasks that are past their due date and not done."""
+    return [t for t in db.all(Task) if t.due and t.due < now and not t.done]
@@ -0,0 +1,17 @@
+from app.auth.passwords import hash_password, check_password
+from app.auth.tokens import issue_token
+
+
+def register_user(db, email, password):
+    """Create a user account with a hashed password."""
+    if db.find_user(email):
+        raise ValueError("email already registered")
+    return db.insert_user(email=email, password_hash=hash_password(password))
+
+
+def login(db, email, password, secret_key):
+    """Check credentials and return a bearer token."""
+    user = db.find_user(email)
+    if not user or not check_password(password, user.password_hash):
+        raise PermissionError("invalid credentials")
+    return issue_token(user.id, secret_key)
@@ -0,0 +1,19 @@
+import hashlib
+import hmac
+import os
+
+ITERATIONS = 200000
+
+
+def hash_password(password):
+    """Hash a password with a random salt using PBKDF2."""
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac("sha256", password.encode(), salt, ITERATIONS)
+    return salt.hex() + ":" + digest.hex()
+
+
+def check_password(password, stored):
+    """Compare a password against a stored salted hash."""
+    salt, digest = stored.split(":")
+    candidate = hashlib.pbkdf2_hmac("sha256", password.encode(), bytes.fromhex(salt), ITERATIONS)
+    return hmac.compare_digest(candidate.hex(), digest)
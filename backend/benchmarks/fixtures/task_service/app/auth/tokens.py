@@ -0,0 +1,30 @@
+"""Signed bearer tokens."""
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+
+class TokenError(Exception):
+    pass
+
+
+def issue_token(user_id, secret_key, ttl=3600):
+    """Create a signed token for the user that expires after ttl seconds."""
+    payload = json.dumps({"sub": user_id, "exp": int(time.time()) + ttl}).encode()
+    signature = hmac.new(secret_key.encode(), payload, hashlib.sha256).hexdigest()
+    return base64.urlsafe_b64encode(payload).decode() + "." + signature
+
+
+def verify_token(token, secret_key):
+    """Check a token's signature and expiry, returning the user id."""
+    encoded, _, signature = token.partition(".")
+    payload = base64.urlsafe_b64decode(encoded.encode())
+    expected = hmac.new(secret_key.encode(), payload, hashlib.sha256).hexdigest()
+    if not hmac.compare_digest(expected, signature):
+        raise TokenError("bad signature")
+    claims = json.loads(payload)
+    if claims["exp"] < time.time():
+        raise TokenError("token expired")
+    return claims["sub"]
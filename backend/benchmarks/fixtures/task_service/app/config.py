@@ -0,0 +1,10 @@
+import os
+
+
+def load_config():
+    """Read service settings from the environment."""
+    return {
+        "database_url": os.getenv("DATABASE_URL", "sqlite:///tasks.db"),
+        "secret_key": os.environ["SECRET_KEY"],
+        "token_ttl": int(os.getenv("TOKEN_TTL", "3600")),
+    }
@@ -0,0 +1,8 @@
+from app.api.tasks import list_overdue_tasks
+
+
+def send_overdue_reminders(db, mailer, now):
+    """Email each owner a reminder about their overdue tasks."""
+    for task in list_overdue_tasks(db, now):
+        owner = db.get_user(task.owner_id)
+        mailer.send(owner.email, f"Task overdue: {task.title}")
@@ -0,0 +1,20 @@
+import heapq
+import time
+
+
+class JobScheduler:
+    """Runs callables at fixed intervals."""
+
+    def __init__(self):
+        self._queue = []
+
+    def schedule_every(self, seconds, func):
+        heapq.heappush(self._queue, (time.monotonic() + seconds, seconds, func))
+
+    def run_pending(self):
+        """Run every job whose time has come and reschedule it."""
+        now = time.monotonic()
+        while self._queue and self._queue[0][0] <= now:
+            _, interval, func = heapq.heappop(self._queue)
+            func()
+            heapq.heappush(self._queue, (now + interval, interval, func))
@@ -0,0 +1,834 @@
+"""Storage models for the task service."""
+import datetime
+import json
+
+
+class Model:
+    """Base class for stored records."""
+
+    table = None
+    fields = ()
+
+    def __init__(self, **values):
+        self.id = values.pop("id", None)
+        for name in self.fields:
+            setattr(self, name, values.get(name))
+
+    def to_dict(self):
+        """Serialize the record's fields to a dictionary."""
+        return {"id": self.id, **{name: getattr(self, name) for name in self.fields}}
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(**dict(row))
+
+
+class Task(Model):
+    """A stored task record."""
+
+    table = "tasks"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the task."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Task needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Task is due before it was created")
+
+
+class Project(Model):
+    """A stored project record."""
+
+    table = "projects"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the project."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Project needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Project is due before it was created")
+
+
+class Label(Model):
+    """A stored label record."""
+
+    table = "labels"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the label."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Label needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Label is due before it was created")
+
+
+class Comment(Model):
+    """A stored comment record."""
+
+    table = "comments"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the comment."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Comment needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Comment is due before it was created")
+
+
+class Attachment(Model):
+    """A stored attachment record."""
+
+    table = "attachments"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the attachment."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Attachment needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Attachment is due before it was created")
+
+
+class Team(Model):
+    """A stored team record."""
+
+    table = "teams"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the team."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Team needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Team is due before it was created")
+
+
+class Membership(Model):
+    """A stored membership record."""
+
+    table = "memberships"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the membership."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Membership needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Membership is due before it was created")
+
+
+class Invitation(Model):
+    """A stored invitation record."""
+
+    table = "invitations"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the invitation."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Invitation needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Invitation is due before it was created")
+
+
+class Notification(Model):
+    """A stored notification record."""
+
+    table = "notifications"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the notification."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Notification needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Notification is due before it was created")
+
+
+class AuditEntry(Model):
+    """A stored audit entry record."""
+
+    table = "audit_entrys"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the audit entry."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("AuditEntry needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("AuditEntry is due before it was created")
+
+
+class Webhook(Model):
+    """A stored webhook record."""
+
+    table = "webhooks"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the webhook."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Webhook needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Webhook is due before it was created")
+
+
+class Integration(Model):
+    """A stored integration record."""
+
+    table = "integrations"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the integration."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Integration needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Integration is due before it was created")
+
+
+class Milestone(Model):
+    """A stored milestone record."""
+
+    table = "milestones"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the milestone."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Milestone needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Milestone is due before it was created")
+
+
+class Sprint(Model):
+    """A stored sprint record."""
+
+    table = "sprints"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the sprint."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Sprint needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Sprint is due before it was created")
+
+
+class TimeEntry(Model):
+    """A stored time entry record."""
+
+    table = "time_entrys"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the time entry."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("TimeEntry needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("TimeEntry is due before it was created")
+
+
+class Reminder(Model):
+    """A stored reminder record."""
+
+    table = "reminders"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the reminder."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Reminder needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Reminder is due before it was created")
+
+
+class Subscription(Model):
+    """A stored subscription record."""
+
+    table = "subscriptions"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the subscription."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Subscription needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Subscription is due before it was created")
+
+
+class Invoice(Model):
+    """A stored invoice record."""
+
+    table = "invoices"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the invoice."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Invoice needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Invoice is due before it was created")
+
+
+class Workspace(Model):
+    """A stored workspace record."""
+
+    table = "workspaces"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the workspace."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Workspace needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Workspace is due before it was created")
+
+
+class ApiKey(Model):
+    """A stored api key record."""
+
+    table = "api_keys"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the api key."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("ApiKey needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("ApiKey is due before it was created")
+
+
+class Session(Model):
+    """A stored session record."""
+
+    table = "sessions"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the session."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Session needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Session is due before it was created")
+
+
+class Preference(Model):
+    """A stored preference record."""
+
+    table = "preferences"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the preference."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Preference needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Preference is due before it was created")
+
+
+class Tag(Model):
+    """A stored tag record."""
+
+    table = "tags"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the tag."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Tag needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Tag is due before it was created")
+
+
+class Board(Model):
+    """A stored board record."""
+
+    table = "boards"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the board."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Board needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Board is due before it was created")
+
+
+class Column(Model):
+    """A stored column record."""
+
+    table = "columns"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the column."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Column needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Column is due before it was created")
+
+
+class Checklist(Model):
+    """A stored checklist record."""
+
+    table = "checklists"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the checklist."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Checklist needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Checklist is due before it was created")
+
+
+class ChecklistItem(Model):
+    """A stored checklist item record."""
+
+    table = "checklist_items"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the checklist item."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("ChecklistItem needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("ChecklistItem is due before it was created")
+
+
+class Dependency(Model):
+    """A stored dependency record."""
+
+    table = "dependencys"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the dependency."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Dependency needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Dependency is due before it was created")
+
+
+class Template(Model):
+    """A stored template record."""
+
+    table = "templates"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the template."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Template needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Template is due before it was created")
+
+
+class Export(Model):
+    """A stored export record."""
+
+    table = "exports"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the export."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Export needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Export is due before it was created")
+
+
+class Report(Model):
+    """A stored report record."""
+
+    table = "reports"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the report."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Report needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Report is due before it was created")
+
+
+class Dashboard(Model):
+    """A stored dashboard record."""
+
+    table = "dashboards"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the dashboard."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Dashboard needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Dashboard is due before it was created")
+
+
+class Widget(Model):
+    """A stored widget record."""
+
+    table = "widgets"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the widget."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("Widget needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("Widget is due before it was created")
+
+
+class SavedFilter(Model):
+    """A stored saved filter record."""
+
+    table = "saved_filters"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the saved filter."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("SavedFilter needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("SavedFilter is due before it was created")
+
+
+class View(Model):
+    """A stored view record."""
+
+    table = "views"
+    fields = ("owner_id", "title", "created_at", "updated_at", "due", "done", "metadata")
+
+    def touch(self):
+        """Update the modification time of the view."""
+        self.updated_at = datetime.datetime.utcnow()
+
+    def is_overdue(self, now):
+        return bool(self.due and self.due < now and not self.done)
+
+    def metadata_json(self):
+        return json.dumps(self.metadata or {}, sort_keys=True)
+
+    def validate(self):
+        if not self.title:
+            raise ValueError("View needs a title")
+        if self.due and self.created_at and self.due < self.created_at:
+            raise ValueError("View is due before it was created")
+
+
+def soft_delete(record, now):
+    """Mark a record deleted without removing its row."""
+    record.metadata = {**(record.metadata or {}), "deleted_at": now.isoformat()}
+    record.touch()
@@ -0,0 +1,7 @@
+import sqlite3
+
+
+def migrate(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE IF NOT EXISTS tasks (id INTEGER PRIMARY KEY, title TEXT, done INTEGER)")
+    conn.commit()
@@ -0,0 +1,38 @@
+package main
+
+import (
+	"encoding/json"
+	"log"
+	"net/http"
+	"time"
+)
+
+// Server serves search results over HTTP.
+type Server struct {
+	started time.Time
+}
+
+// HandleHealth reports whether the server is up.
+func (s *Server) HandleHealth(w http.ResponseWriter, r *http.Request) {
+	json.NewEncoder(w).Encode(map[string]any{"ok": true, "uptime": time.Since(s.started).String()})
+}
+
+// RateLimit rejects clients that send requests too often.
+func RateLimit(next http.Handler, perSecond int) http.Handler {
+	ticker := time.NewTicker(time.Second / time.Duration(perSecond))
+	return http.HandlerFunc(func(w http.ResponseWriter, r *http.Request) {
+		select {
+		case <-ticker.C:
+			next.ServeHTTP(w, r)
+		default:
+			http.Error(w, "too many requests", http.StatusTooManyRequests)
+		}
+	})
+}
+
+func main() {
+	server := &Server{started: time.Now()}
+	mux := http.NewServeMux()
+	mux.HandleFunc("/health", server.HandleHealth)
+	log.Fatal(http.ListenAndServe(":8080", RateLimit(mux, 20)))
+}
@@ -0,0 +1,51 @@
+export interface SearchResult {
+  file: string;
+  lineStart: number;
+  lineEnd: number;
+  code: string;
+}
+
+export class ApiError extends Error {
+  constructor(public status: number, message: string) {
+    super(message);
+  }
+}
+
+/** Fetch a URL and parse the JSON body, raising ApiError on a failed status. */
+export async function fetchJson<T>(url: string, init?: RequestInit): Promise<T> {
+  const response = await fetch(url, init);
+  if (!response.ok) {
+    throw new ApiError(response.status, await response.text());
+  }
+  return (await response.json()) as T;
+}
+
+/** Client for the search backend. */
+export class SearchClient {
+  constructor(private baseUrl: string) {}
+
+  /** Run a search query against a repository. */
+  async search(repo: string, query: string): Promise<SearchResult[]> {
+    return fetchJson<SearchResult[]>(`${this.baseUrl}/search`, {
+      method: "POST",
+      headers: { "Content-Type": "application/json" },
+      body: JSON.stringify({ github_url: repo, query }),
+    });
+  }
+
+  /** Retry a request with exponential backoff. */
+  async withRetry<T>(request: () => Promise<T>, attempts = 3): Promise<T> {
+    let delay = 250;
+    for (let attempt = 1; ; attempt++) {
+      try {
+        return await request();
+      } catch (error) {
+        if (attempt >= attempts) {
+          throw error;
+        }
+        await new Promise((resolve) => setTimeout(resolve, delay));
+        delay *= 2;
+      }
+    }
+  }
+}
@@ -0,0 +1,18 @@
+import { SearchResult } from "../api/client";
+import { formatLineRange } from "../utils/format";
+
+interface ResultListProps {
+  results: SearchResult[];
+}
+
+/** List of code snippets returned by a search. */
+export const ResultList = ({ results }: ResultListProps) => (
+  <ul>
+    {results.map((result) => (
+      <li key={`${result.file}:${result.lineStart}`}>
+        {result.file} ({formatLineRange(result.lineStart, result.lineEnd)})
+        <pre>{result.code}</pre>
+      </li>
+    ))}
+  </ul>
+);
@@ -0,0 +1,26 @@
+import { useState } from "react";
+import { useDebounce } from "../hooks/useDebounce";
+
+interface SearchBoxProps {
+  onSearch: (query: string) => void;
+  placeholder?: string;
+}
+
+/** Text input that submits a search query. */
+export default function SearchBox({ onSearch, placeholder }: SearchBoxProps) {
+  const [query, setQuery] = useState("");
+  const debouncedQuery = useDebounce(query);
+
+  const handleSubmit = (event: React.FormEvent) => {
+    event.preventDefault();
+    if (debouncedQuery.trim()) {
+      onSearch(debouncedQuery.trim());
+    }
+  };
+
+  return (
+    <form onSubmit={handleSubmit}>
+      <input value={query} placeholder={placeholder} onChange={(e) => setQuery(e.target.value)} />
+    </form>
+  );
+}
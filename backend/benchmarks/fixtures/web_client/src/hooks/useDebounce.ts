@@ -0,0 +1,13 @@
+import { useEffect, useState } from "react";
+
+/** Debounce a changing value so it only updates after the input settles. */
+export function useDebounce<T>(value: T, delayMs = 300): T {
+  const [debounced, setDebounced] = useState(value);
+
+  useEffect(() => {
+    const timer = setTimeout(() => setDebounced(value), delayMs);
+    return () => clearTimeout(timer);
+  }, [value, delayMs]);
+
+  return debounced;
+}
@@ -0,0 +1,19 @@
+/** Format a date as YYYY-MM-DD for display. */
+export const formatDate = (date: Date): string => {
+  const month = String(date.getMonth() + 1).padStart(2, "0");
+  const day = String(date.getDate()).padStart(2, "0");
+  return `${date.getFullYear()}-${month}-${day}`;
+};
+
+/** Shorten text to a maximum length, adding an ellipsis. */
+export function truncateText(text: string, maxLength: number): string {
+  if (text.length <= maxLength) {
+    return text;
+  }
+  return text.slice(0, maxLength - 1) + "…";
+}
+
+/** Render a line range such as "12-20". */
+export function formatLineRange(start: number, end: number): string {
+  return start === end ? `${start}` : `${start}-${end}`;
+}
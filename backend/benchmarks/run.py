@@ -0,0 +1,284 @@
+"""
+Offline search benchmark.
+
+Runs run_search over the fixture repositories in benchmarks/fixtures against the local fake
+model server, and reports wall time, model calls and prompt tokens per stage, GitHub fetches
+and recall@k against the labeled snippets in benchmarks/cases.json.
+
+  cd backend && python -m benchmarks.run --latency 0.2 --json results.json
+  cd backend && python -m benchmarks.run --baseline results.json
+
+With --source github the fixtures are served through benchmarks/fake_github_server.py instead
+of being read from disk, which exercises the Git Trees API and blob fetching paths.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURE_DIR = os.path.join(BENCHMARK_DIR, "fixtures")
+CASES_PATH = os.path.join(BENCHMARK_DIR, "cases.json")
+# Metrics that do not depend on machine speed must not get worse at all; wall time may
+# drift by the given tolerance.
+LOWER_IS_BETTER = ("model_calls", "prompt_tokens", "github_fetches")
+HIGHER_IS_BETTER = ("recall",)
+
+
+FAKE_GITHUB_OWNER = "fixtures"
+
+
+def configure_environment(data_dir, use_caches, github_api_url=None):
+  # retrieval reads its settings at import time, so this must run before importing it.
+  os.environ.setdefault("FIREWORKS_API_KEY", "benchmark")
+  os.environ["ALLOW_LOCAL_REPOS"] = "1"
+  os.environ["DATA_DIR"] = data_dir
+  os.environ["MODEL_CACHE_DB"] = ""
+  if github_api_url:
+    os.environ["GITHUB_API_URL"] = github_api_url
+    os.environ["REPO_SNAPSHOTS"] = "0"
+    os.environ["GITHUB_REQUESTS_PER_SECOND"] = "0"
+  if not use_caches:
+    os.environ["MODEL_CACHE_SIZE"] = "0"
+    os.environ["SEARCH_CACHE_SIZE"] = "0"
+
+
+def snippet_matches(snippet_name, expected_name):
+  # The model may answer with a bare method name or a qualified one.
+  return snippet_name == expected_name or \
+    snippet_name.endswith("." + expected_name) or expected_name.endswith("." + snippet_name)
+
+
+def recall_at_k(recommendations, expected, k):
+  ranked = [
+    (file_recommendations.file_name, snippet.name or "")
+    for file_recommendations in recommendations.files
+    for snippet in file_recommendations.snippets
+  ][:k]
+  found = sum(
+    any(file == e["file"] and snippet_matches(name, e["name"]) for file, name in ranked)
+    for e in expected
+  )
+  return found / len(expected) if expected else 1.0
+
+
+def diff_counts(before, after):
+  return {key: after.get(key, 0) - before.get(key, 0) for key in after if after.get(key, 0) != before.get(key, 0)}
+
+
+def flatten_stage_stats(stats):
+  flat = {}
+  for stage, models in stats.items():
+    for model, outcomes in models.items():
+      for outcome, count in outcomes.items():
+        flat[(stage, model, outcome)] = count
+  return flat
+
+
+def collect_metrics():
+  from retrieval.model_call import model_usage
+  from retrieval.routing import routing_stats
+  from retrieval.snapshot import github_fetches
+  return {
+    "stages": flatten_stage_stats(routing_stats()),
+    "usage": flatten_stage_stats({"all": model_usage()}),
+    "fetches": github_fetches(),
+  }
+
+
+def case_repo_url(case, source):
+  if source == "github":
+    return f"https://github.com/{FAKE_GITHUB_OWNER}/{case['repo']}"
+  return os.path.join(FIXTURE_DIR, case["repo"])
+
+
+def run_case(case, mode, k, source="dir", deadline=None):
+  from retrieval.search import run_search
+  from retrieval.snapshot import get_snapshot
+  from retrieval.symbol_index import get_symbol_index
+  from retrieval.summaries import get_summaries
+
+  repo_path = case_repo_url(case, source)
+  before = collect_metrics()
+
+  started = time.perf_counter()
+  snapshot = get_snapshot(repo_path)
+  if snapshot:
+    get_symbol_index(snapshot)
+    get_summaries(snapshot)
+  snapshot_seconds = time.perf_counter() - started
+
+  started = time.perf_counter()
+  recommendations = run_search(repo_path, case["query"], mode, deadline=deadline)
+  search_seconds = time.perf_counter() - started
+
+  after = collect_metrics()
+  stages = diff_counts(before["stages"], after["stages"])
+  usage = diff_counts(before["usage"], after["usage"])
+  fetches = diff_counts(before["fetches"], after["fetches"])
+
+  stage_summary = {}
+  for (stage, model, outcome), count in stages.items():
+    summary = stage_summary.setdefault(stage, {"calls": 0, "seconds": 0.0, "escalations": 0})
+    if outcome == "calls":
+      summary["calls"] += count
+    elif outcome == "seconds":
+      summary["seconds"] += count
+    elif outcome.startswith("escalated_"):
+      summary["escalations"] += count
+
+  return {
+    "repo": case["repo"],
+    "query": case["query"],
+    "snapshot_seconds": snapshot_seconds,
+    "search_seconds": search_seconds,
+    "model_calls": sum(count for (_, _, name), count in usage.items() if name == "calls"),
+    "prompt_tokens": sum(count for (_, _, name), count in usage.items() if name == "prompt_tokens"),
+    "github_fetches": sum(fetches.values()),
+    "recall": recall_at_k(recommendations, case["expected"], k),
+    "partial": recommendations.partial,
+    "stages": stage_summary,
+  }
+
+
+def summarize(results):
+  totals = {
+    "search_seconds": sum(r["search_seconds"] for r in results),
+    "snapshot_seconds": sum(r["snapshot_seconds"] for r in results),
+    "model_calls": sum(r["model_calls"] for r in results),
+    "prompt_tokens": sum(r["prompt_tokens"] for r in results),
+    "github_fetches": sum(r["github_fetches"] for r in results),
+    "recall": sum(r["recall"] for r in results) / len(results) if results else 0.0,
+    "partial": sum(r.get("partial", False) for r in results),
+    "stages": {},
+  }
+  for r in results:
+    for stage, summary in r["stages"].items():
+      total = totals["stages"].setdefault(stage, {"calls": 0, "seconds": 0.0, "escalations": 0})
+      for name, value in summary.items():
+        total[name] += value
+  return totals
+
+
+def print_report(results, totals, k):
+  print()
+  print(f"{'repo':<14} {'query':<48} {'search s':>9} {'calls':>6} {'tokens':>8} {'fetches':>8} {f'recall@{k}':>9}")
+  for r in results:
+    print(f"{r['repo']:<14} {r['query'][:48]:<48} {r['search_seconds']:>9.2f} {r['model_calls']:>6} "
+          f"{r['prompt_tokens']:>8} {r['github_fetches']:>8} {r['recall']:>9.2f}")
+  print(f"{'total':<14} {'':<48} {totals['search_seconds']:>9.2f} {totals['model_calls']:>6} "
+        f"{totals['prompt_tokens']:>8} {totals['github_fetches']:>8} {totals['recall']:>9.2f}")
+  print(f"\nSnapshot and symbol index: {totals['snapshot_seconds']:.2f}s")
+  if totals["partial"]:
+    print(f"Searches stopped at their deadline: {totals['partial']}")
+
+  print(f"\n{'stage':<20} {'calls':>6} {'escalations':>12} {'model seconds':>14}")
+  for stage, summary in sorted(totals["stages"].items()):
+    print(f"{stage:<20} {summary['calls']:>6} {summary['escalations']:>12} {summary['seconds']:>14.2f}")
+
+
+def compare_to_baseline(totals, baseline, tolerance):
+  """
+  Return the regressions of totals against a previous run's totals.
+  """
+  regressions = []
+  for name in LOWER_IS_BETTER:
+    if totals[name] > baseline[name]:
+      regressions.append(f"{name}: {baseline[name]} -> {totals[name]}")
+  for name in HIGHER_IS_BETTER:
+    if totals[name] < baseline[name]:
+      regressions.append(f"{name}: {baseline[name]:.2f} -> {totals[name]:.2f}")
+  if totals["search_seconds"] > baseline["search_seconds"] * (1 + tolerance):
+    regressions.append(f"search_seconds: {baseline['search_seconds']:.2f} -> {totals['search_seconds']:.2f}")
+  return regressions
+
+
+def main():
+  parser = argparse.ArgumentParser(description="Benchmark search quality and latency against local fixtures.")
+  parser.add_argument("--mode", default="bfs", help="Search mode to benchmark (bfs or lexical).")
+  parser.add_argument("--source", default="dir", choices=["dir", "github"],
+                      help="Read fixtures from disk, or through the local GitHub API stand-in.")
+  parser.add_argument("--github-latency", type=float, default=0.0,
+                      help="Delay of every GitHub stand-in response in seconds (with --source github).")
+  parser.add_argument("-k", type=int, default=5, help="Number of top snippets counted for recall.")
+  parser.add_argument("--deadline", type=float, help="Time budget of each search in seconds (anytime mode).")
+  parser.add_argument("--repeat", type=int, default=1, help="Run every case this many times.")
+  parser.add_argument("--cases", default=CASES_PATH, help="JSON file of labeled queries.")
+  parser.add_argument("--latency", type=float, default=0.05, help="Fake model latency per call in seconds.")
+  parser.add_argument("--latency-per-1k-tokens", type=float, default=0.02, help="Extra fake model latency per 1000 prompt tokens.")
+  parser.add_argument("--recordings", help="Recorded model responses to replay (see benchmarks/fake_model_server.py).")
+  parser.add_argument("--record", action="store_true", help="Record unseen prompts from the real API into --recordings.")
+  parser.add_argument("--fail-every", type=int, default=0, help="Have the fake model server reject every n-th request with a 429.")
+  parser.add_argument("--malformed-every", type=int, default=0,
+                      help="Have the fake model server malform every n-th JSON answer (requests without a response_format).")
+  parser.add_argument("--use-caches", action="store_true", help="Keep the model and search result caches enabled.")
+  parser.add_argument("--json", help="Write per-case results and totals to this file.")
+  parser.add_argument("--baseline", help="Fail if totals regress against this earlier --json output.")
+  parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed relative increase in search time against the baseline.")
+  parser.add_argument("--verbose", action="store_true", help="Show the pipeline's own progress output.")
+  args = parser.parse_args()
+
+  with open(args.cases) as f:
+    cases = json.load(f)
+
+  github_server = None
+  if args.source == "github":
+    from benchmarks.fake_github_server import FakeGitHubServer
+    repos = {f"{FAKE_GITHUB_OWNER}/{name}": os.path.join(FIXTURE_DIR, name) for name in os.listdir(FIXTURE_DIR)}
+    github_server = FakeGitHubServer(repos, latency=args.github_latency).start()
+
+  data_dir = tempfile.mkdtemp(prefix="code-search-benchmark-")
+  configure_environment(data_dir, args.use_caches, github_server.base_url if github_server else None)
+  from benchmarks.fake_model_server import FakeModelServer
+  server = FakeModelServer(latency=args.latency, latency_per_1k_tokens=args.latency_per_1k_tokens,
+                           recordings_path=args.recordings, record=args.record, fail_every=args.fail_every,
+                           malformed_every=args.malformed_every).start()
+  # The model clients are created when retrieval.model_call is first imported, in run_case.
+  os.environ["FIREWORKS_API_BASE"] = server.base_url
+
+  results = []
+  try:
+    for _ in range(args.repeat):
+      for case in cases:
+        stdout = sys.stdout
+        if not args.verbose:
+          sys.stdout = open(os.devnull, "w")
+        try:
+          results.append(run_case(case, args.mode, args.k, args.source, args.deadline))
+        finally:
+          if not args.verbose:
+            sys.stdout.close()
+            sys.stdout = stdout
+  finally:
+    server.stop()
+    if github_server:
+      github_server.stop()
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+  totals = summarize(results)
+  print_report(results, totals, args.k)
+  print(f"\nFake model server: {server.stats}")
+  if github_server:
+    print(f"Fake GitHub server: {dict(github_server.stats)}")
+
+  if args.json:
+    with open(args.json, "w") as f:
+      json.dump({"mode": args.mode, "k": args.k, "results": results, "totals": totals}, f, indent=2)
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)["totals"]
+    regressions = compare_to_baseline(totals, baseline, args.tolerance)
+    if regressions:
+      print("\nRegressions against baseline:")
+      for regression in regressions:
+        print(f"  {regression}")
+      sys.exit(1)
+    print("\nNo regressions against baseline.")
+
+
+if __name__ == "__main__":
+  main()
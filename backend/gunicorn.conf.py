@@ -0,0 +1,39 @@
+"""
+Production serving: gunicorn -c gunicorn.conf.py app:app
+
+A single worker process handles requests on a pool of threads, while the searches
+themselves run on its event loop and are capped by its admission controller
+(MAX_CONCURRENT_SEARCHES running, MAX_QUEUED_SEARCHES waiting). Keep threads above the
+sum of the two, so streaming searches and queued requests leave threads for /comment,
+/repos and /metrics.
+
+Search sessions, the result and explanation caches, admission control and the /metrics
+counters all live in the worker's memory. With WEB_CONCURRENCY above 1 each worker has its
+own: a /comment session_id only works on the worker that ran the search (others answer 404
+and the client resends the results), the search cap is per worker, and every /metrics
+scrape reads a different worker's counters. Run more workers only behind a load balancer
+that keeps a client on one worker, and scrape each worker separately.
+"""
+import os
+
+bind = os.getenv("BIND", "127.0.0.1:3002")
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "gthread"
+threads = int(os.getenv("WEB_THREADS", "32"))
+# gthread workers are restarted when they stop heartbeating for this long, not per request;
+# searches have their own deadline (SEARCH_TIMEOUT_SECONDS).
+timeout = int(os.getenv("WEB_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("WEB_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+# Not preloaded: every worker must start its own event loop, caches and job dispatcher
+# rather than inherit them from the master through fork.
+preload_app = False
+max_requests = int(os.getenv("WEB_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+
+def post_worker_init(worker):
+    # Resume indexing jobs queued before a restart without waiting for a /repos request. Started
+    # here rather than when app is imported, so only processes that serve requests run one.
+    from retrieval.jobs import job_runner
+    job_runner.start()
@@ -0,0 +1,99 @@
+"""
+Admission control for searches.
+
+Each server process runs at most MAX_CONCURRENT_SEARCHES searches at once. Up to
+MAX_QUEUED_SEARCHES more wait for a slot for at most ADMISSION_QUEUE_SECONDS; anything
+beyond that is rejected straight away (the app answers 503 with Retry-After), so a burst
+of requests degrades into fast rejections rather than every search slowing down together.
+"""
+import os
+import threading
+import time
+
+from retrieval.metrics import Counter, Histogram
+
+MAX_CONCURRENT_SEARCHES = int(os.getenv("MAX_CONCURRENT_SEARCHES", "8"))
+MAX_QUEUED_SEARCHES = int(os.getenv("MAX_QUEUED_SEARCHES", "16"))
+ADMISSION_QUEUE_SECONDS = float(os.getenv("ADMISSION_QUEUE_SECONDS", "10"))
+
+ADMISSIONS = Counter("search_admissions_total", "Search admission decisions (admitted, queued, rejected, timed_out).", ["result"])
+ADMISSION_WAIT_SECONDS = Histogram("search_admission_wait_seconds", "Time admitted searches waited for a slot.")
+
+
+class AdmissionRejected(Exception):
+  def __init__(self, reason, retry_after):
+    super().__init__(reason)
+    self.retry_after = retry_after
+
+
+class Admission:
+  """
+  A held slot. release() may be called more than once; only the first call frees the slot.
+  """
+  def __init__(self, controller):
+    self._controller = controller
+    self._released = False
+    self._lock = threading.Lock()
+
+  def release(self):
+    with self._lock:
+      if self._released:
+        return
+      self._released = True
+    self._controller._release()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.release()
+
+
+class AdmissionController:
+  def __init__(self, max_active, max_queued, queue_timeout):
+    self.max_active = max_active
+    self.max_queued = max_queued
+    self.queue_timeout = queue_timeout
+    self.active = 0
+    self.queued = 0
+    self._condition = threading.Condition()
+
+  def acquire(self):
+    """
+    Return an Admission once a slot is free, or raise AdmissionRejected if the queue is full
+    or no slot frees up within queue_timeout.
+    """
+    started = time.monotonic()
+    with self._condition:
+      if self.active < self.max_active and not self.queued:
+        self.active += 1
+        ADMISSIONS.inc(result="admitted")
+        return Admission(self)
+      if self.queued >= self.max_queued:
+        ADMISSIONS.inc(result="rejected")
+        raise AdmissionRejected("Too many searches in progress", retry_after=max(1, round(self.queue_timeout)))
+
+      ADMISSIONS.inc(result="queued")
+      self.queued += 1
+      try:
+        admitted = self._condition.wait_for(lambda: self.active < self.max_active, self.queue_timeout)
+      finally:
+        self.queued -= 1
+      if not admitted:
+        ADMISSIONS.inc(result="timed_out")
+        raise AdmissionRejected("Timed out waiting for a search slot", retry_after=max(1, round(self.queue_timeout)))
+      self.active += 1
+    ADMISSION_WAIT_SECONDS.observe(time.monotonic() - started)
+    return Admission(self)
+
+  def _release(self):
+    with self._condition:
+      self.active -= 1
+      self._condition.notify()
+
+  def stats(self):
+    with self._condition:
+      return {"active": self.active, "queued": self.queued}
+
+
+search_admission = AdmissionController(MAX_CONCURRENT_SEARCHES, MAX_QUEUED_SEARCHES, ADMISSION_QUEUE_SECONDS)
@@ -0,0 +1,191 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class LRUCache:
+  """
+  Thread-safe in-memory cache with least-recently-used eviction and an optional TTL in seconds.
+  """
+  def __init__(self, max_entries=1024, ttl=None):
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self.hits = 0
+    self.misses = 0
+    self._entries = OrderedDict()
+    self._lock = threading.Lock()
+
+  def get(self, key):
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is not None:
+        value, stored_at = entry
+        if self.ttl is None or time.time() - stored_at < self.ttl:
+          self._entries.move_to_end(key)
+          self.hits += 1
+          return value
+        del self._entries[key]
+      self.misses += 1
+      return None
+
+  def set(self, key, value):
+    with self._lock:
+      self._entries[key] = (value, time.time())
+      self._entries.move_to_end(key)
+      while len(self._entries) > self.max_entries:
+        self._entries.popitem(last=False)
+
+  def delete(self, key):
+    with self._lock:
+      self._entries.pop(key, None)
+
+  def __len__(self):
+    return len(self._entries)
+
+  def stats(self):
+    return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+
+class SQLiteCache:
+  """
+  On-disk cache of JSON-serializable values, shared by every process pointing at the same file.
+  """
+  def __init__(self, path, max_entries=100000, ttl=None):
+    self.path = path
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self.hits = 0
+    self.misses = 0
+    self._lock = threading.Lock()
+    self._writes = 0
+    self._conn = None
+    self._pid = None
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+  def _connection(self):
+    # SQLite connections must not cross a fork, so each process opens its own.
+    if self._conn is None or self._pid != os.getpid():
+      self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+      self._pid = os.getpid()
+      self._conn.execute("PRAGMA journal_mode=WAL")
+      self._conn.execute(
+        "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)"
+      )
+      self._conn.execute("CREATE INDEX IF NOT EXISTS cache_stored_at ON cache (stored_at)")
+      self._conn.commit()
+    return self._conn
+
+  def get(self, key):
+    with self._lock:
+      row = self._connection().execute("SELECT value, stored_at FROM cache WHERE key = ?", (key,)).fetchone()
+      if row is not None and (self.ttl is None or time.time() - row[1] < self.ttl):
+        self.hits += 1
+        return json.loads(row[0])
+      self.misses += 1
+      return None
+
+  def set(self, key, value):
+    with self._lock:
+      conn = self._connection()
+      conn.execute(
+        "INSERT OR REPLACE INTO cache (key, value, stored_at) VALUES (?, ?, ?)",
+        (key, json.dumps(value), time.time()),
+      )
+      self._writes += 1
+      # Trimming scans the table, so only do it every so often.
+      if self._writes % 100 == 0:
+        self._evict(conn)
+      conn.commit()
+
+  def delete(self, key):
+    with self._lock:
+      conn = self._connection()
+      conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+      conn.commit()
+
+  def _evict(self, conn):
+    if self.ttl is not None:
+      conn.execute("DELETE FROM cache WHERE stored_at < ?", (time.time() - self.ttl,))
+    conn.execute(
+      "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY stored_at DESC LIMIT -1 OFFSET ?)",
+      (self.max_entries,),
+    )
+
+  def stats(self):
+    with self._lock:
+      size = self._connection().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+    return {"hits": self.hits, "misses": self.misses, "size": size}
+
+
+class TieredCache:
+  """
+  An in-memory LRU in front of an optional on-disk tier; disk hits are promoted to memory.
+  """
+  def __init__(self, memory, disk=None):
+    self.memory = memory
+    self.disk = disk
+
+  def get(self, key):
+    value = self.memory.get(key)
+    if value is None and self.disk is not None:
+      value = self.disk.get(key)
+      if value is not None:
+        self.memory.set(key, value)
+    return value
+
+  def set(self, key, value):
+    self.memory.set(key, value)
+    if self.disk is not None:
+      self.disk.set(key, value)
+
+  async def async_get(self, key):
+    """
+    get() for the event loop: memory is read in place, and the disk tier, whose queries can
+    wait on other processes' locks, in a thread.
+    """
+    value = self.memory.get(key)
+    if value is None and self.disk is not None:
+      value = await asyncio.to_thread(self.disk.get, key)
+      if value is not None:
+        self.memory.set(key, value)
+    return value
+
+  async def async_set(self, key, value):
+    self.memory.set(key, value)
+    if self.disk is not None:
+      await asyncio.to_thread(self.disk.set, key, value)
+
+  def delete(self, key):
+    self.memory.delete(key)
+    if self.disk is not None:
+      self.disk.delete(key)
+
+  def stats(self):
+    stats = {"memory": self.memory.stats()}
+    if self.disk is not None:
+      stats["disk"] = self.disk.stats()
+    return stats
+
+
+class AsyncSingleFlight:
+  """
+  Coalesces concurrent calls for the same key into one in-flight task on the event loop.
+  """
+  def __init__(self):
+    self._in_flight = {}
+
+  async def do(self, key, func):
+    task = self._in_flight.get(key)
+    if task is None:
+      task = asyncio.ensure_future(func())
+      self._in_flight[key] = task
+      task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+    # Shielded so one caller going away does not cancel the work the others are waiting on.
+    return await asyncio.shield(task)
+
+  def __len__(self):
+    return len(self._in_flight)
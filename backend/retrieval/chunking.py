@@ -0,0 +1,136 @@
+import os
+
+# Files estimated above this many tokens are searched in two passes: an outline of
+# signatures and docstrings first, then the bodies of the candidate symbols only.
+FILE_TOKEN_BUDGET = int(os.getenv("FILE_TOKEN_BUDGET", "6000"))
+# Longest signature (in lines) copied into an outline.
+MAX_SIGNATURE_LINES = 8
+CHARS_PER_TOKEN = 4
+# A candidate too large for the remaining budget is shown only up to this many tokens.
+MAX_TRUNCATED_CHUNK_TOKENS = 300
+
+
+def estimate_tokens(text):
+  # Source code averages roughly four characters per token for Llama tokenizers.
+  return len(text) // CHARS_PER_TOKEN + 1
+
+
+def outline_symbols(symbols):
+  """
+  Symbols worth listing in an outline: module-level definitions and class members,
+  but not helpers nested inside functions.
+  """
+  functions = {s.qualified_name for s in symbols if s.kind == "function"}
+  return [s for s in symbols if s.parent not in functions]
+
+
+def symbol_signature(code_lines, symbol):
+  start = symbol.line_start - 1
+  end = min(symbol.line_end, start + MAX_SIGNATURE_LINES)
+  signature = []
+  for line in code_lines[start:end]:
+    signature.append(line)
+    # A Python signature ends with a colon, a brace-delimited one with its opening brace.
+    if line.split("#", 1)[0].rstrip().endswith(":") or line.rstrip().endswith("{"):
+      break
+  else:
+    if end < symbol.line_end:
+      signature.append("        ...")
+  return signature
+
+
+def definition_indent(code_lines, symbol):
+  # Skip decorators to find the def/class line, then indent one level past it.
+  for line in code_lines[symbol.line_start - 1:symbol.line_end]:
+    stripped = line.lstrip()
+    if not stripped.startswith("@"):
+      return " " * (len(line) - len(stripped) + 4)
+  return "    "
+
+
+def build_file_outline(code_str, symbols, token_budget=FILE_TOKEN_BUDGET):
+  """
+  Render signatures and first-line docstrings of a file's symbols, each tagged with its
+  line range, stopping once the token budget is spent.
+  """
+  code_lines = code_str.splitlines()
+  parts = []
+  used = 0
+  for symbol in outline_symbols(symbols):
+    indent = definition_indent(code_lines, symbol)
+    part = "\n".join(symbol_signature(code_lines, symbol))
+    if symbol.doc:
+      part += f'\n{indent}"""{symbol.doc}"""'
+    part += f"\n{indent}# lines {symbol.line_start}-{symbol.line_end}"
+
+    cost = estimate_tokens(part)
+    if used + cost > token_budget:
+      parts.append("# ... outline truncated")
+      break
+    parts.append(part)
+    used += cost
+  return "\n\n".join(parts)
+
+
+def find_symbols(symbols, names):
+  by_name = {}
+  for symbol in symbols:
+    by_name.setdefault(symbol.qualified_name, symbol)
+    by_name.setdefault(symbol.name, symbol)
+  found = []
+  for name in names:
+    symbol = by_name.get(name)
+    if symbol and symbol not in found:
+      found.append(symbol)
+  return found
+
+
+def contains(outer, inner):
+  return outer is not inner and outer.line_start <= inner.line_start and inner.line_end <= outer.line_end
+
+
+def truncate_lines(lines, token_budget):
+  kept, used = [], 0
+  for line in lines:
+    used += estimate_tokens(line)
+    if used > token_budget:
+      break
+    kept.append(line)
+  return kept
+
+
+def build_symbol_chunks(code_str, symbols, token_budget=FILE_TOKEN_BUDGET):
+  """
+  Render the full source of the given symbols in file order, each tagged with its line
+  range. Smaller symbols are budgeted first; a symbol that contains already included ones
+  replaces them if it fits, and one that does not fit is cut down to its head.
+  """
+  code_lines = code_str.splitlines()
+  chunks = {}
+  used = 0
+  for symbol in sorted(symbols, key=lambda s: s.line_end - s.line_start):
+    if any(contains(outer, symbol) for outer in chunks):
+      continue
+
+    nested = [inner for inner in chunks if contains(symbol, inner)]
+    refund = sum(estimate_tokens(chunks[inner]) for inner in nested)
+    body = code_lines[symbol.line_start - 1:symbol.line_end]
+    chunk = "\n".join(body)
+    if estimate_tokens(chunk) <= token_budget - used + refund:
+      for inner in nested:
+        del chunks[inner]
+      used -= refund
+    elif nested:
+      # Its members are already shown; the whole body would not fit anyway.
+      continue
+    else:
+      kept = truncate_lines(body, min(token_budget - used, MAX_TRUNCATED_CHUNK_TOKENS))
+      if not kept:
+        continue
+      chunk = "\n".join(kept) + "\n# ... truncated"
+
+    chunks[symbol] = chunk
+    used += estimate_tokens(chunk)
+
+  ordered = sorted(chunks, key=lambda s: s.line_start)
+  return "\n\n".join(f"# lines {s.line_start}-{s.line_end}\n{chunks[s]}" for s in ordered)
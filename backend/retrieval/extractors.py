@@ -0,0 +1,234 @@
+"""
+Symbol extraction per language. An extractor turns source code into its module docstring
+and a list of SymbolDefinitions (functions and classes with 1-based, inclusive line ranges);
+extractors are registered by file extension.
+
+Python uses the standard library's ast module. JavaScript, TypeScript, Go and Java use
+tree-sitter grammars when their packages are installed; without them those files simply
+have no symbols.
+"""
+import ast
+import importlib
+from dataclasses import dataclass
+
+# Docstrings are kept to their first line, capped at this many characters.
+MAX_DOC_LENGTH = 200
+
+# extension -> extractor(code) returning (module doc, [SymbolDefinition])
+EXTRACTORS = {}
+
+
+@dataclass(frozen=True)
+class SymbolDefinition:
+  qualified_name: str
+  kind: str
+  line_start: int
+  line_end: int
+  parent: str
+  doc: str = ""
+
+  @property
+  def name(self):
+    return self.qualified_name.rsplit(".", 1)[-1]
+
+
+def register_extractor(extensions, extractor):
+  for extension in extensions:
+    EXTRACTORS[extension] = extractor
+
+
+def extractor_for(path):
+  _, dot, extension = path.rpartition(".")
+  return EXTRACTORS.get(f".{extension}") if dot else None
+
+
+def has_extractor(path):
+  return extractor_for(path) is not None
+
+
+def extract_file_module(path, code):
+  """
+  Return (module doc, symbols) for a file, or None if its language is not supported or
+  it does not parse.
+  """
+  extractor = extractor_for(path)
+  if extractor is None:
+    return None
+  try:
+    return extractor(code)
+  except (SyntaxError, ValueError, UnicodeDecodeError):
+    return None
+
+
+# -----------  PYTHON ---------------
+
+def _node_kind(node):
+  if isinstance(node, ast.ClassDef):
+    return "class"
+  if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+    return "function"
+  return None
+
+
+def summarize_docstring(node):
+  doc = ast.get_docstring(node, clean=True)
+  if not doc:
+    return ""
+  return doc.strip().split("\n", 1)[0][:MAX_DOC_LENGTH]
+
+
+def extract_module(code_str):
+  """
+  Return the module docstring and every function and class in the code, in source order.
+  Line numbers match astroid: 1-based, with function decorators included.
+  """
+  tree = ast.parse(code_str)
+  symbols = []
+
+  def visit(node, parent):
+    for child in ast.iter_child_nodes(node):
+      kind = _node_kind(child)
+      if kind is None:
+        visit(child, parent)
+        continue
+
+      qualified_name = f"{parent}.{child.name}" if parent else child.name
+      line_start = child.lineno
+      if kind == "function" and child.decorator_list:
+        line_start = min(line_start, child.decorator_list[0].lineno)
+      symbols.append(SymbolDefinition(qualified_name=qualified_name, kind=kind,
+        line_start=line_start, line_end=child.end_lineno, parent=parent,
+        doc=summarize_docstring(child)))
+      visit(child, qualified_name)
+
+  visit(tree, "")
+  return summarize_docstring(tree), symbols
+
+
+def extract_symbols(code_str):
+  return extract_module(code_str)[1]
+
+
+register_extractor((".py",), extract_module)
+
+
+# -----------  TREE-SITTER ---------------
+
+# language -> (grammar module, function returning the grammar, file extensions)
+TREE_SITTER_GRAMMARS = {
+  "javascript": ("tree_sitter_javascript", "language", (".js", ".jsx", ".mjs", ".cjs")),
+  "typescript": ("tree_sitter_typescript", "language_typescript", (".ts", ".mts", ".cts")),
+  "tsx": ("tree_sitter_typescript", "language_tsx", (".tsx",)),
+  "go": ("tree_sitter_go", "language", (".go",)),
+  "java": ("tree_sitter_java", "language", (".java",)),
+}
+FUNCTION_NODES = {
+  "function_declaration", "generator_function_declaration", "method_definition",
+  "method_declaration", "constructor_declaration",
+}
+CLASS_NODES = {
+  "class_declaration", "abstract_class_declaration", "interface_declaration", "enum_declaration",
+  "record_declaration", "annotation_type_declaration", "type_spec",
+}
+# Variables and fields whose value is one of these are reported as functions.
+FUNCTION_VALUES = {"arrow_function", "function_expression", "function", "generator_function"}
+ASSIGNMENT_NODES = {"variable_declarator", "public_field_definition", "field_definition"}
+# Statements wrapping a single definition, whose lines belong to it (export, const, Go's type).
+WRAPPER_NODES = {"export_statement", "lexical_declaration", "variable_declaration", "type_declaration"}
+COMMENT_NODES = {"comment", "line_comment", "block_comment"}
+
+
+def _tree_sitter_kind(node):
+  if node.type in FUNCTION_NODES:
+    return "function"
+  if node.type in CLASS_NODES:
+    return "class"
+  if node.type in ASSIGNMENT_NODES:
+    value = node.child_by_field_name("value")
+    if value is not None and value.type in FUNCTION_VALUES:
+      return "function"
+  return None
+
+
+def _outer_node(node):
+  # Stop at wrappers holding more than one definition, such as a Go type ( ... ) group.
+  while node.parent is not None and node.parent.type in WRAPPER_NODES and node.parent.named_child_count == 1:
+    node = node.parent
+  return node
+
+
+def _comment_doc(node):
+  """
+  First line of the comment directly above a definition, without comment markers.
+  """
+  comment = node.prev_named_sibling
+  if comment is None or comment.type not in COMMENT_NODES or comment.end_point[0] < node.start_point[0] - 1:
+    return ""
+  for line in comment.text.decode("utf-8", "replace").splitlines():
+    line = line.strip().lstrip("/*").rstrip("*/").strip()
+    if line:
+      return line[:MAX_DOC_LENGTH]
+  return ""
+
+
+def _go_receiver_type(node):
+  receiver = node.child_by_field_name("receiver")
+  stack = [receiver] if receiver is not None else []
+  while stack:
+    current = stack.pop()
+    if current.type == "type_identifier":
+      return current.text.decode("utf-8", "replace")
+    stack.extend(reversed(current.named_children))
+  return ""
+
+
+def make_tree_sitter_extractor(language):
+  from tree_sitter import Parser
+
+  def extract(code):
+    if isinstance(code, str):
+      code = code.encode("utf-8")
+    # Parsers are cheap to create and not safe to share between threads.
+    tree = Parser(language).parse(code)
+    symbols = []
+
+    def visit(node, parent):
+      for child in node.named_children:
+        kind = _tree_sitter_kind(child)
+        name_node = child.child_by_field_name("name") if kind else None
+        if name_node is None:
+          visit(child, parent)
+          continue
+
+        name = name_node.text.decode("utf-8", "replace")
+        owner = parent
+        if child.type == "method_declaration" and not parent:
+          # Go methods are declared outside their type.
+          owner = _go_receiver_type(child)
+        qualified_name = f"{owner}.{name}" if owner else name
+        outer = _outer_node(child)
+        symbols.append(SymbolDefinition(qualified_name=qualified_name, kind=kind,
+          line_start=outer.start_point[0] + 1, line_end=outer.end_point[0] + 1, parent=owner,
+          doc=_comment_doc(outer)))
+        visit(child, qualified_name)
+
+    visit(tree.root_node, "")
+    return "", symbols
+
+  return extract
+
+
+def _load_tree_sitter_grammars():
+  try:
+    from tree_sitter import Language
+  except ImportError:
+    return
+  for module_name, function_name, extensions in TREE_SITTER_GRAMMARS.values():
+    try:
+      module = importlib.import_module(module_name)
+    except ImportError:
+      continue
+    register_extractor(extensions, make_tree_sitter_extractor(Language(getattr(module, function_name)())))
+
+
+_load_tree_sitter_grammars()
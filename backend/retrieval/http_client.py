@@ -0,0 +1,283 @@
+"""
+Shared HTTP plumbing for GitHub and the model provider: pooled keep-alive connections,
+timeouts, retries with exponential backoff and jitter that honor Retry-After and
+X-RateLimit-Reset, and token buckets that pace requests to each provider's limits.
+"""
+import asyncio
+import email.utils
+import os
+import random
+import threading
+import time
+
+import httpx
+import requests
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+
+from retrieval.metrics import Counter
+
+# The first retrieval module to read settings; later ones see .env through this too.
+load_dotenv()
+
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN")
+DEFAULT_GITHUB_API_URL = "https://api.github.com"
+# Point at GitHub Enterprise, or a local stand-in such as benchmarks/fake_github_server.py.
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", DEFAULT_GITHUB_API_URL).rstrip("/")
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "30"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "32"))
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES", "4"))
+# Backoff before retry n is a random delay up to min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2**n).
+HTTP_BACKOFF_BASE = float(os.getenv("HTTP_BACKOFF_BASE", "0.5"))
+HTTP_BACKOFF_MAX = float(os.getenv("HTTP_BACKOFF_MAX", "30"))
+# Waits longer than this (e.g. an hour until the GitHub rate limit resets) fail instead.
+HTTP_MAX_RETRY_WAIT = float(os.getenv("HTTP_MAX_RETRY_WAIT", "60"))
+# Sustained requests per second; bursts of up to twice that are allowed. 0 disables pacing.
+GITHUB_REQUESTS_PER_SECOND = float(os.getenv("GITHUB_REQUESTS_PER_SECOND", "10"))
+MODEL_REQUESTS_PER_SECOND = float(os.getenv("MODEL_REQUESTS_PER_SECOND", "10"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+HTTP_REQUESTS = Counter("http_requests_total", "HTTP requests by target and status code (or error).", ["target", "status"])
+HTTP_RETRIES = Counter("http_retries_total", "Retried requests by target and reason.", ["target", "reason"])
+RATE_LIMIT_WAITS = Counter("rate_limit_wait_seconds_total", "Seconds spent waiting for a rate limiter.", ["target"])
+
+
+class RetryableError(Exception):
+  """
+  A failed attempt worth retrying, with the delay the server asked for if any.
+  """
+  def __init__(self, reason, retry_after=None):
+    super().__init__(reason)
+    self.reason = reason
+    self.retry_after = retry_after
+
+
+class TokenBucket:
+  """
+  Paces requests to a sustained rate with bursts up to capacity. A server-reported limit can
+  pause the bucket for everyone until the limit resets.
+  """
+  def __init__(self, rate, capacity=None):
+    self.rate = rate
+    self.capacity = capacity or max(1.0, 2 * rate)
+    self._tokens = self.capacity
+    self._updated = time.monotonic()
+    self._paused_until = 0.0
+    self._lock = threading.Lock()
+
+  def _reserve(self):
+    """
+    Take a token, possibly borrowing against the future, and return how long to wait for it.
+    """
+    if not self.rate:
+      return 0.0
+    with self._lock:
+      now = time.monotonic()
+      self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+      self._updated = now
+      self._tokens -= 1
+      wait = 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+      return max(wait, self._paused_until - now)
+
+  def pause(self, seconds):
+    with self._lock:
+      self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+  def acquire(self, target):
+    wait = self._reserve()
+    if wait > 0:
+      RATE_LIMIT_WAITS.inc(wait, target=target)
+      time.sleep(wait)
+
+  async def async_acquire(self, target):
+    wait = self._reserve()
+    if wait > 0:
+      RATE_LIMIT_WAITS.inc(wait, target=target)
+      await asyncio.sleep(wait)
+
+
+github_limiter = TokenBucket(GITHUB_REQUESTS_PER_SECOND)
+model_limiter = TokenBucket(MODEL_REQUESTS_PER_SECOND)
+
+
+def parse_retry_after(headers):
+  """
+  Seconds to wait according to Retry-After, or X-RateLimit-Reset once the quota is used up.
+  """
+  retry_after = headers.get("Retry-After")
+  if retry_after:
+    try:
+      return max(0.0, float(retry_after))
+    except ValueError:
+      try:
+        return max(0.0, email.utils.parsedate_to_datetime(retry_after).timestamp() - time.time())
+      except (TypeError, ValueError):
+        pass
+  if headers.get("X-RateLimit-Remaining") == "0" and headers.get("X-RateLimit-Reset"):
+    try:
+      return max(0.0, float(headers["X-RateLimit-Reset"]) - time.time())
+    except ValueError:
+      pass
+  return None
+
+
+def check_response(status_code, headers):
+  """
+  Raise RetryableError for throttled or transiently failed responses.
+  """
+  retry_after = parse_retry_after(headers)
+  if status_code in RETRYABLE_STATUS_CODES:
+    raise RetryableError(f"status_{status_code}", retry_after)
+  # GitHub reports an exhausted (secondary) rate limit as 403 with rate-limit headers.
+  if status_code == 403 and retry_after is not None:
+    raise RetryableError("rate_limited", retry_after)
+
+
+def backoff_delay(attempt, retry_after=None):
+  if retry_after is not None:
+    return retry_after
+  return random.uniform(0, min(HTTP_BACKOFF_MAX, HTTP_BACKOFF_BASE * 2 ** attempt))
+
+
+def _next_delay(target, limiter, attempt, error):
+  """
+  Delay before the next attempt, or None to give up.
+  """
+  if attempt >= HTTP_MAX_RETRIES:
+    return None
+  delay = backoff_delay(attempt, error.retry_after)
+  if delay > HTTP_MAX_RETRY_WAIT:
+    return None
+  if error.retry_after is not None:
+    # The provider says everyone is over the limit, not just this request.
+    limiter.pause(delay)
+  HTTP_RETRIES.inc(target=target, reason=error.reason)
+  print(f"Retrying {target} request in {delay:.1f}s ({error.reason})")
+  return delay
+
+
+def with_retries(target, limiter, attempt_once):
+  """
+  Call attempt_once() until it returns, pacing calls through limiter. attempt_once raises
+  RetryableError for failures worth retrying; the last one is re-raised when retries run out.
+  """
+  attempt = 0
+  while True:
+    limiter.acquire(target)
+    try:
+      return attempt_once()
+    except RetryableError as e:
+      delay = _next_delay(target, limiter, attempt, e)
+      if delay is None:
+        raise
+      time.sleep(delay)
+      attempt += 1
+
+
+async def async_with_retries(target, limiter, attempt_once):
+  attempt = 0
+  while True:
+    await limiter.async_acquire(target)
+    try:
+      return await attempt_once()
+    except RetryableError as e:
+      delay = _next_delay(target, limiter, attempt, e)
+      if delay is None:
+        raise
+      await asyncio.sleep(delay)
+      attempt += 1
+
+
+# -----------  GITHUB ---------------
+
+def github_headers():
+  headers = {"User-Agent": "code-search"}
+  if GITHUB_TOKEN:
+    headers["Authorization"] = f"Bearer {GITHUB_TOKEN}"
+  return headers
+
+
+def _make_github_session():
+  session = requests.Session()
+  adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+  session.mount("https://", adapter)
+  session.mount("http://", adapter)
+  session.headers.update(github_headers())
+  return session
+
+
+_github_session = None
+_github_session_pid = None
+_async_github_client = None
+_async_github_client_loop = None
+_clients_lock = threading.Lock()
+
+
+def get_github_session():
+  # Pooled connections must not be shared with a forked child.
+  global _github_session, _github_session_pid
+  with _clients_lock:
+    if _github_session is None or _github_session_pid != os.getpid():
+      _github_session = _make_github_session()
+      _github_session_pid = os.getpid()
+    return _github_session
+
+
+def get_async_github_client():
+  # Created lazily, and again if a different event loop uses it, since httpx clients are
+  # bound to the loop that opened their connections.
+  global _async_github_client, _async_github_client_loop
+  loop = asyncio.get_running_loop()
+  if _async_github_client is None or _async_github_client_loop is not loop:
+    _async_github_client = httpx.AsyncClient(
+      timeout=HTTP_TIMEOUT,
+      headers=github_headers(),
+      limits=httpx.Limits(max_connections=HTTP_POOL_SIZE, max_keepalive_connections=HTTP_POOL_SIZE),
+    )
+    _async_github_client_loop = loop
+  return _async_github_client
+
+
+def github_get(url, headers=None, stream=False):
+  """
+  GET a GitHub URL through the pooled session. Retryable failures are retried; the final
+  response is returned whatever its status, or None if the request could not be made.
+  """
+  def attempt_once():
+    try:
+      response = get_github_session().get(url, headers=headers, stream=stream, timeout=HTTP_TIMEOUT)
+    except requests.RequestException as e:
+      HTTP_REQUESTS.inc(target="github", status="error")
+      raise RetryableError(type(e).__name__)
+    HTTP_REQUESTS.inc(target="github", status=response.status_code)
+    try:
+      check_response(response.status_code, response.headers)
+    except RetryableError:
+      response.close()
+      raise
+    return response
+
+  try:
+    return with_retries("github", github_limiter, attempt_once)
+  except RetryableError as e:
+    print(f"Error: GitHub request failed after retries ({e.reason}): {url}")
+    return None
+
+
+async def async_github_get(url, headers=None):
+  async def attempt_once():
+    try:
+      response = await get_async_github_client().get(url, headers=headers)
+    except httpx.HTTPError as e:
+      HTTP_REQUESTS.inc(target="github", status="error")
+      raise RetryableError(type(e).__name__)
+    HTTP_REQUESTS.inc(target="github", status=response.status_code)
+    check_response(response.status_code, response.headers)
+    return response
+
+  try:
+    return await async_with_retries("github", github_limiter, attempt_once)
+  except RetryableError as e:
+    print(f"Error: GitHub request failed after retries ({e.reason}): {url}")
+    return None
@@ -0,0 +1,298 @@
+"""
+Background repository indexing.
+
+POST /repos queues a job that fetches a repository's snapshot and builds its symbol index
+and summaries, so the first search against it only pays for model calls. Jobs are kept in
+SQLite, so they survive restarts and are shared by every server process using the same
+DATA_DIR. Each process runs a dispatcher thread that claims queued jobs (highest priority
+first, then oldest) and runs them in a small process pool. There is at most one queued or
+running job per repository; asking again returns it, with its priority raised if needed.
+"""
+import concurrent.futures
+import concurrent.futures.process
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from retrieval.metrics import Counter
+from retrieval.snapshot import DATA_DIR, get_snapshot
+from retrieval.summaries import SUMMARIES_ENABLED, get_summaries
+from retrieval.symbol_index import get_symbol_index
+
+JOBS_DB = os.getenv("JOBS_DB", os.path.join(DATA_DIR, "jobs.sqlite3"))
+# Jobs run at once by each server process.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# A running job not finished after this many seconds is assumed lost (its process died) and
+# may be claimed again.
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "3600"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "1"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+JOBS = Counter("index_jobs_total", "Repository indexing jobs, by outcome (queued, deduplicated, requeued, done, failed).", ["status"])
+
+
+def warm_repo(repo_url):
+  """
+  Fetch a repository's snapshot and build everything searches read from disk. Runs in a
+  worker process; returns a JSON-serializable summary of what was built.
+  """
+  started = time.time()
+  snapshot = get_snapshot(repo_url)
+  if snapshot is None:
+    raise RuntimeError(f"Unable to fetch a snapshot of {repo_url}")
+  index = get_symbol_index(snapshot)
+  if SUMMARIES_ENABLED:
+    get_summaries(snapshot)
+  return {
+    "sha": snapshot.sha,
+    "files": len(index.blobs),
+    "seconds": round(time.time() - started, 3),
+  }
+
+
+class JobQueue:
+  """
+  Jobs persisted in SQLite. Claiming a job runs in an immediate transaction, so several
+  processes can share one queue without running a job twice.
+  """
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+    self._conn = None
+    self._pid = None
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+  def _connection(self):
+    # SQLite connections must not cross a fork, so each process opens its own.
+    if self._conn is None or self._pid != os.getpid():
+      self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30, isolation_level=None)
+      self._conn.row_factory = sqlite3.Row
+      self._pid = os.getpid()
+      self._conn.execute("PRAGMA journal_mode=WAL")
+      self._conn.execute(
+        "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, repo TEXT NOT NULL, priority INTEGER NOT NULL,"
+        " status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL,"
+        " started_at REAL, finished_at REAL, error TEXT, result TEXT)"
+      )
+      self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, priority DESC, created_at)")
+      self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_repo ON jobs (repo, status)")
+    return self._conn
+
+  def _transaction(self, func):
+    with self._lock:
+      conn = self._connection()
+      conn.execute("BEGIN IMMEDIATE")
+      try:
+        result = func(conn)
+      except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+      conn.execute("COMMIT")
+      return result
+
+  def enqueue(self, repo, priority=0):
+    """
+    Queue a job for a repository, or return its queued or running job. Returns (job, created).
+    """
+    def enqueue_job(conn):
+      row = conn.execute(
+        "SELECT * FROM jobs WHERE repo = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+        (repo, JOB_QUEUED, JOB_RUNNING),
+      ).fetchone()
+      if row is not None:
+        if priority > row["priority"]:
+          conn.execute("UPDATE jobs SET priority = ? WHERE id = ?", (priority, row["id"]))
+        return self._get(conn, row["id"]), False
+
+      job_id = uuid.uuid4().hex
+      conn.execute(
+        "INSERT INTO jobs (id, repo, priority, status, created_at) VALUES (?, ?, ?, ?, ?)",
+        (job_id, repo, priority, JOB_QUEUED, time.time()),
+      )
+      return self._get(conn, job_id), True
+
+    return self._transaction(enqueue_job)
+
+  def claim(self):
+    """
+    Mark the next job to run as running and return it, or None if there is nothing to do.
+    """
+    def claim_job(conn):
+      # Jobs left running by a process that died go back to the queue, up to JOB_MAX_ATTEMPTS.
+      conn.execute(
+        "UPDATE jobs SET status = ? WHERE status = ? AND started_at < ? AND attempts < ?",
+        (JOB_QUEUED, JOB_RUNNING, time.time() - JOB_TIMEOUT, JOB_MAX_ATTEMPTS),
+      )
+      conn.execute(
+        "UPDATE jobs SET status = ?, finished_at = ?, error = ? WHERE status = ? AND started_at < ?",
+        (JOB_FAILED, time.time(), "Timed out", JOB_RUNNING, time.time() - JOB_TIMEOUT),
+      )
+      row = conn.execute(
+        "SELECT id FROM jobs WHERE status = ? ORDER BY priority DESC, created_at LIMIT 1", (JOB_QUEUED,)
+      ).fetchone()
+      if row is None:
+        return None
+      conn.execute(
+        "UPDATE jobs SET status = ?, started_at = ?, attempts = attempts + 1 WHERE id = ?",
+        (JOB_RUNNING, time.time(), row["id"]),
+      )
+      return self._get(conn, row["id"])
+
+    return self._transaction(claim_job)
+
+  def requeue(self, job_id):
+    """
+    Put a running job back in the queue, keeping its attempt count.
+    """
+    self._transaction(lambda conn: conn.execute(
+      "UPDATE jobs SET status = ?, started_at = NULL WHERE id = ? AND status = ?",
+      (JOB_QUEUED, job_id, JOB_RUNNING),
+    ))
+
+  def finish(self, job_id, result=None, error=None):
+    status = JOB_FAILED if error else JOB_DONE
+    self._transaction(lambda conn: conn.execute(
+      "UPDATE jobs SET status = ?, finished_at = ?, error = ?, result = ? WHERE id = ?",
+      (status, time.time(), error, json.dumps(result) if result is not None else None, job_id),
+    ))
+
+  def get(self, job_id):
+    with self._lock:
+      return self._get(self._connection(), job_id)
+
+  def _get(self, conn, job_id):
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+      return None
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+class JobRunner:
+  """
+  Claims jobs from the queue on a daemon thread and runs them in a process pool, so
+  indexing neither blocks requests nor competes with them for the GIL. A worker that dies
+  (out of memory, a crashing parser) breaks the pool: it is replaced, and the jobs it was
+  running are queued again until they have had JOB_MAX_ATTEMPTS attempts.
+  """
+  def __init__(self, queue, workers=JOB_WORKERS, target=warm_repo):
+    self.queue = queue
+    self.workers = workers
+    # Called with a repository URL in a worker process; must be importable by name.
+    self.target = target
+    self._lock = threading.Lock()
+    self._wake = threading.Event()
+    self._slots = threading.Semaphore(workers)
+    self._pool = None
+    self._pid = None
+
+  def start(self):
+    with self._lock:
+      # A forked server process inherits the object but not the thread or the pool.
+      if self._pid == os.getpid() or self.workers <= 0:
+        return
+      self._pid = os.getpid()
+      self._slots = threading.Semaphore(self.workers)
+      self._pool = self._new_pool()
+      threading.Thread(target=self._dispatch, daemon=True).start()
+
+  def _new_pool(self):
+    # Spawned rather than forked: the server has threads (the event loop, the dispatcher) that
+    # a fork would copy in an unknown state.
+    return concurrent.futures.ProcessPoolExecutor(
+      max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"),
+    )
+
+  def _replace_pool(self, broken):
+    with self._lock:
+      # Every job of a broken pool reports it; only the first replaces the pool.
+      if self._pool is broken:
+        broken.shutdown(wait=False)
+        self._pool = self._new_pool()
+
+  def _submit(self, job):
+    while True:
+      pool = self._pool
+      try:
+        return pool, pool.submit(self.target, job["repo"])
+      except concurrent.futures.process.BrokenProcessPool:
+        # Broken by an earlier job, which _finished requeues; this one gets a fresh pool.
+        self._replace_pool(pool)
+
+  def notify(self):
+    self.start()
+    self._wake.set()
+
+  def _dispatch(self):
+    while True:
+      self._slots.acquire()
+      try:
+        job = self.queue.claim()
+      except sqlite3.Error as e:
+        print(f"Error: Unable to claim an indexing job: {e}")
+        job = None
+      if job is None:
+        self._slots.release()
+        self._wake.wait(JOB_POLL_SECONDS)
+        self._wake.clear()
+        continue
+
+      print(f"Indexing {job['repo']} (job {job['id']})")
+      try:
+        pool, future = self._submit(job)
+      except Exception as e:
+        pool, future = None, concurrent.futures.Future()
+        future.set_exception(e)
+      future.add_done_callback(lambda future, job=job, pool=pool: self._finished(job, pool, future))
+
+  def _finished(self, job, pool, future):
+    try:
+      error = future.exception()
+      if isinstance(error, concurrent.futures.process.BrokenProcessPool):
+        self._replace_pool(pool)
+        if job["attempts"] < JOB_MAX_ATTEMPTS:
+          self.queue.requeue(job["id"])
+          JOBS.inc(status="requeued")
+          print(f"Error: Indexing {job['repo']} lost its worker process, queued again (job {job['id']})")
+          self._wake.set()
+          return
+      if error is None:
+        self.queue.finish(job["id"], result=future.result())
+        JOBS.inc(status=JOB_DONE)
+        print(f"Indexed {job['repo']} (job {job['id']})")
+      else:
+        self.queue.finish(job["id"], error=str(error) or type(error).__name__)
+        JOBS.inc(status=JOB_FAILED)
+        print(f"Error: Indexing {job['repo']} failed: {error}")
+    finally:
+      self._slots.release()
+
+
+job_queue = JobQueue(JOBS_DB)
+job_runner = JobRunner(job_queue)
+
+
+def submit_index_job(repo_url, priority=0):
+  """
+  Queue a repository for indexing and return its job, which may already exist.
+  """
+  job, created = job_queue.enqueue(repo_url, priority)
+  JOBS.inc(status=JOB_QUEUED if created else "deduplicated")
+  job_runner.notify()
+  return job
+
+
+def get_index_job(job_id):
+  # Polling also starts this process's dispatcher, so jobs queued before a restart resume.
+  job_runner.start()
+  return job_queue.get(job_id)
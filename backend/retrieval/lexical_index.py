@@ -0,0 +1,169 @@
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+import numpy as np
+
+from retrieval.metrics import span
+from retrieval.snapshot import iter_snapshot_files, lock_for, snapshot_manifest
+from retrieval.symbol_index import get_symbol_index
+
+# Files worth handing to the function-level model step.
+SOURCE_EXTENSIONS = (
+  ".py", ".js", ".jsx", ".ts", ".tsx", ".go", ".java", ".kt", ".scala", ".rb", ".rs",
+  ".c", ".cc", ".cpp", ".h", ".hpp", ".cs", ".php", ".swift",
+)
+LEXICAL_TOP_K = int(os.getenv("LEXICAL_TOP_K", "10"))
+MAX_LOADED_LEXICAL_INDEXES = int(os.getenv("MAX_LOADED_LEXICAL_INDEXES", "8"))
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Path and filename terms say more about a file than any one symbol inside it.
+PATH_WEIGHT = 3
+SYMBOL_WEIGHT = 1
+DOC_WEIGHT = 1
+
+STOPWORDS = {
+  "a", "an", "and", "are", "as", "at", "be", "by", "can", "code", "do", "does", "find", "for",
+  "from", "how", "i", "in", "is", "it", "of", "on", "or", "that", "the", "this", "to", "want",
+  "what", "where", "which", "with",
+}
+
+_WORD_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+_loaded_indexes = OrderedDict()
+_index_lock = threading.Lock()
+
+
+def tokenize(text):
+  """
+  Split identifiers and prose into lowercase terms: snake_case, camelCase and paths all
+  break into words, and a trailing plural "s" is dropped.
+  """
+  terms = []
+  for word in _WORD_RE.findall(text):
+    word = word.lower()
+    if len(word) < 2 or word in STOPWORDS:
+      continue
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+      word = word[:-1]
+    terms.append(word)
+  return terms
+
+
+def document_terms(path, symbols, module_doc):
+  terms = Counter()
+  for term in tokenize(path):
+    terms[term] += PATH_WEIGHT
+  if module_doc:
+    for term in tokenize(module_doc):
+      terms[term] += DOC_WEIGHT
+  for symbol in symbols:
+    for term in tokenize(symbol.name):
+      terms[term] += SYMBOL_WEIGHT
+    for term in tokenize(symbol.doc):
+      terms[term] += DOC_WEIGHT
+  return terms
+
+
+class LexicalIndex:
+  """
+  BM25 over file paths, symbol names and docstrings, stored as per-term posting arrays so a
+  query is scored with one vectorized update per query term.
+  """
+  def __init__(self, paths, doc_terms, blobs=None):
+    self.paths = paths
+    # Kept so the index of the next commit can reuse the terms of unchanged files.
+    self.doc_terms = doc_terms
+    self.blobs = blobs or {}
+    self.vocabulary = {}
+    postings = {}
+    doc_lengths = np.zeros(len(paths), dtype=np.float32)
+
+    for doc_id, terms in enumerate(doc_terms):
+      doc_lengths[doc_id] = sum(terms.values())
+      for term, count in terms.items():
+        postings.setdefault(term, ([], []))
+        postings[term][0].append(doc_id)
+        postings[term][1].append(count)
+
+    self.doc_ids = []
+    self.term_frequencies = []
+    for term_id, (term, (doc_ids, counts)) in enumerate(postings.items()):
+      self.vocabulary[term] = term_id
+      self.doc_ids.append(np.asarray(doc_ids, dtype=np.int32))
+      self.term_frequencies.append(np.asarray(counts, dtype=np.float32))
+
+    n_docs = max(len(paths), 1)
+    document_frequency = np.asarray([len(d) for d in self.doc_ids], dtype=np.float32)
+    self.idf = np.log(1 + (n_docs - document_frequency + 0.5) / (document_frequency + 0.5))
+    average_length = doc_lengths.mean() if len(paths) else 1.0
+    self.length_norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_lengths / max(average_length, 1.0))
+
+  def search(self, query, k=LEXICAL_TOP_K):
+    scores = np.zeros(len(self.paths), dtype=np.float32)
+    for term in set(tokenize(query)):
+      term_id = self.vocabulary.get(term)
+      if term_id is None:
+        continue
+      doc_ids = self.doc_ids[term_id]
+      tf = self.term_frequencies[term_id]
+      scores[doc_ids] += self.idf[term_id] * tf * (BM25_K1 + 1) / (tf + self.length_norm[doc_ids])
+
+    matches = np.flatnonzero(scores)
+    if len(matches) == 0:
+      return []
+    k = min(k, len(matches))
+    top = matches[np.argpartition(-scores[matches], k - 1)[:k]]
+    top = top[np.argsort(-scores[top], kind="stable")]
+    return [(self.paths[i], float(scores[i])) for i in top]
+
+
+def build_lexical_index(snapshot, previous=None):
+  """
+  Build the index for a snapshot. Terms of files whose blob SHA matches the previous index
+  are reused, so only changed files are re-read from the symbol index.
+  """
+  symbol_index = get_symbol_index(snapshot)
+  manifest = snapshot_manifest(snapshot)
+  reusable = {}
+  if previous:
+    reusable = {path: terms for path, terms in zip(previous.paths, previous.doc_terms)}
+
+  paths, doc_terms, blobs = [], [], {}
+  for path, _ in iter_snapshot_files(snapshot, SOURCE_EXTENSIONS):
+    paths.append(path)
+    blobs[path] = manifest.get(path)
+    if path in reusable and blobs[path] and previous.blobs.get(path) == blobs[path]:
+      doc_terms.append(reusable[path])
+    else:
+      doc_terms.append(document_terms(path, symbol_index.symbols(path), symbol_index.module_docs.get(path)))
+  return LexicalIndex(paths, doc_terms, blobs)
+
+
+def _previous_index(snapshot):
+  # The most recently used index of another commit of the same repository.
+  with _index_lock:
+    for (owner, repo, sha), index in reversed(_loaded_indexes.items()):
+      if (owner, repo) == (snapshot.owner, snapshot.repo) and sha != snapshot.sha:
+        return index
+  return None
+
+
+def get_lexical_index(snapshot):
+  key = (snapshot.owner, snapshot.repo, snapshot.sha)
+  with lock_for(("lexical",) + key):
+    with _index_lock:
+      if key in _loaded_indexes:
+        _loaded_indexes.move_to_end(key)
+        return _loaded_indexes[key]
+
+    with span("lexical_index_build", repo=f"{snapshot.owner}/{snapshot.repo}"):
+      index = build_lexical_index(snapshot, _previous_index(snapshot))
+
+    with _index_lock:
+      _loaded_indexes[key] = index
+      if len(_loaded_indexes) > MAX_LOADED_LEXICAL_INDEXES:
+        _loaded_indexes.popitem(last=False)
+    return index
@@ -0,0 +1,194 @@
+"""
+Process-wide metrics in Prometheus text format, and per-request traces.
+
+Metrics are always collected; a trace is only recorded while one is active for the current
+request (see traced). Spans feed both: each span observes search_span_seconds{span=...}, and is
+added to the active trace if there is one.
+"""
+import bisect
+import contextvars
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, from a cached lookup to a slow model call.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(labelnames, values, extra=()):
+  pairs = list(zip(labelnames, values)) + list(extra)
+  if not pairs:
+    return ""
+  escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+  return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+  return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+  def __init__(self, name, documentation, labelnames=()):
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self._values = {}
+    self._lock = threading.Lock()
+    with _registry_lock:
+      _registry.append(self)
+
+  def _key(self, labels):
+    return tuple(str(labels[name]) for name in self.labelnames)
+
+  def inc(self, amount=1, **labels):
+    key = self._key(labels)
+    with self._lock:
+      self._values[key] = self._values.get(key, 0) + amount
+
+  def samples(self):
+    """
+    Current values keyed by label values, in labelnames order.
+    """
+    with self._lock:
+      return dict(self._values)
+
+  def render(self):
+    lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+    for key, value in sorted(self.samples().items()):
+      lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+    return lines
+
+
+class Histogram:
+  def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    self.name = name
+    self.documentation = documentation
+    self.labelnames = tuple(labelnames)
+    self.buckets = tuple(sorted(buckets))
+    # label values -> [bucket counts..., sum, count]
+    self._values = {}
+    self._lock = threading.Lock()
+    with _registry_lock:
+      _registry.append(self)
+
+  def observe(self, value, **labels):
+    key = tuple(str(labels[name]) for name in self.labelnames)
+    i = bisect.bisect_left(self.buckets, value)
+    with self._lock:
+      state = self._values.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+      if i < len(self.buckets):
+        state[i] += 1
+      state[-2] += value
+      state[-1] += 1
+
+  def samples(self):
+    """
+    (sum, count) of observations keyed by label values, in labelnames order.
+    """
+    with self._lock:
+      return {key: (state[-2], state[-1]) for key, state in self._values.items()}
+
+  def render(self):
+    lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+    with self._lock:
+      values = {key: list(state) for key, state in self._values.items()}
+    for key, state in sorted(values.items()):
+      cumulative = 0
+      for bound, count in zip(self.buckets, state):
+        cumulative += count
+        le = (("le", _format_value(float(bound))),)
+        lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+      le = (("le", "+Inf"),)
+      lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {state[-1]}")
+      lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(state[-2])}")
+      lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {state[-1]}")
+    return lines
+
+
+def render_metrics():
+  """
+  All registered metrics in the Prometheus text exposition format.
+  """
+  with _registry_lock:
+    metrics = list(_registry)
+  lines = []
+  for metric in metrics:
+    lines.extend(metric.render())
+  return "\n".join(lines) + "\n"
+
+
+SPAN_SECONDS = Histogram("search_span_seconds", "Time spent in each instrumented step.", ["span"])
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Trace:
+  """
+  Spans recorded for one request, with start times relative to the start of the trace.
+  """
+  def __init__(self):
+    self.started = time.perf_counter()
+    self.spans = []
+    self._ids = itertools.count(1)
+    self._lock = threading.Lock()
+
+  def next_id(self):
+    with self._lock:
+      return next(self._ids)
+
+  def add(self, span):
+    with self._lock:
+      self.spans.append(span)
+
+  def to_json(self):
+    with self._lock:
+      return sorted(self.spans, key=lambda s: (s["start_ms"], s["id"]))
+
+
+@contextmanager
+def span(name, /, **attributes):
+  """
+  Time a step. Nested spans (also across tasks and to_thread calls, which copy the context)
+  record the enclosing span as their parent.
+  """
+  trace = _current_trace.get()
+  parent = _current_span.get()
+  span_id = trace.next_id() if trace else None
+  token = _current_span.set(span_id) if trace else None
+  started = time.perf_counter()
+  error = None
+  try:
+    yield attributes
+  except BaseException as e:
+    error = type(e).__name__
+    raise
+  finally:
+    elapsed = time.perf_counter() - started
+    SPAN_SECONDS.observe(elapsed, span=name)
+    if trace:
+      _current_span.reset(token)
+      record = {
+        "id": span_id,
+        "parent": parent,
+        "name": name,
+        "start_ms": round((started - trace.started) * 1000, 2),
+        "duration_ms": round(elapsed * 1000, 2),
+      }
+      if attributes:
+        record["attributes"] = attributes
+      if error:
+        record["error"] = error
+      trace.add(record)
+
+
+async def traced(trace, coro):
+  """
+  Await coro with trace active, so its spans (and those of tasks it starts) are recorded.
+  """
+  _current_trace.set(trace)
+  return await coro
@@ -1,35 +1,221 @@
-from fireworks.client import Fireworks
+from fireworks.client import Fireworks, AsyncFireworks
+from fireworks.client.error import RateLimitError, InternalServerError, BadGatewayError, ServiceUnavailableError, InvalidRequestError
+import asyncio
+import hashlib
+import httpx
+import json
 import os
+import time
 from dotenv import load_dotenv
 
+from retrieval.cache import LRUCache, SQLiteCache, TieredCache
+from retrieval.http_client import RETRYABLE_STATUS_CODES, RetryableError, with_retries, async_with_retries, model_limiter
+from retrieval.metrics import Counter, Histogram, span
+
 load_dotenv()
 
+# Seconds before a single model request is abandoned (and retried).
+MODEL_TIMEOUT = int(os.getenv("MODEL_TIMEOUT", "120"))
+
 api_key = os.getenv("FIREWORKS_API_KEY")
-client = Fireworks(api_key=api_key)
+# Each client keeps a pool of keep-alive connections for all calls in this process.
+client = Fireworks(api_key=api_key, timeout=MODEL_TIMEOUT)
+async_client = AsyncFireworks(api_key=api_key, timeout=MODEL_TIMEOUT)
+
+RETRYABLE_MODEL_ERRORS = (
+  RateLimitError,
+  InternalServerError,
+  BadGatewayError,
+  ServiceUnavailableError,
+  httpx.TransportError,
+)
 
 LLAMA_70B="accounts/fireworks/models/llama-v3p1-70b-instruct"
 LLAMA_8B="accounts/fireworks/models/llama-v3p1-8b-instruct"
 
-def call_model(model, sys_msg):
-  response = client.chat.completions.create(
-    model=model,
-    messages=[{
-      "role": "user",
-      "content": sys_msg,
-    }],
-    temperature=0,
-  )
+# Upper bound on in-flight async model requests across all searches in this process.
+MODEL_CONCURRENCY = int(os.getenv("MODEL_CONCURRENCY", "32"))
+_model_semaphore = asyncio.Semaphore(MODEL_CONCURRENCY)
+
+# Every call uses temperature 0, so identical prompts can be answered from cache.
+TEMPERATURE = 0
+MODEL_CACHE_SIZE = int(os.getenv("MODEL_CACHE_SIZE", "4096"))
+MODEL_CACHE_TTL = float(os.getenv("MODEL_CACHE_TTL", str(7 * 24 * 3600)))
+# Optional SQLite file that keeps responses across restarts and worker processes.
+MODEL_CACHE_DB = os.getenv("MODEL_CACHE_DB")
+
+response_cache = TieredCache(
+  LRUCache(max_entries=MODEL_CACHE_SIZE, ttl=MODEL_CACHE_TTL),
+  SQLiteCache(MODEL_CACHE_DB, ttl=MODEL_CACHE_TTL) if MODEL_CACHE_DB else None,
+)
+
+# Models that rejected a response_format; they are asked without one from then on.
+_response_format_unsupported = set()
+# An invalid request is put down to its response_format only if the error names it.
+RESPONSE_FORMAT_ERROR_TERMS = ("response_format", "response format", "schema", "json_object", "json mode", "grammar")
+
+MODEL_CALLS = Counter("model_calls_total", "Model requests sent to the provider.", ["model", "outcome"])
+MODEL_CACHE_LOOKUPS = Counter("model_cache_lookups_total", "Model response cache lookups.", ["model", "result"])
+MODEL_TOKENS = Counter("model_tokens_total", "Tokens reported by the provider.", ["model", "direction"])
+MODEL_CALL_SECONDS = Histogram("model_call_seconds", "Latency of model requests, including time queued for a slot.", ["model"])
+
+def record_usage(model, response, seconds):
+  MODEL_CALLS.inc(model=model, outcome="ok")
+  MODEL_CALL_SECONDS.observe(seconds, model=model)
+  usage = getattr(response, "usage", None)
+  if usage:
+    MODEL_TOKENS.inc(usage.prompt_tokens or 0, model=model, direction="in")
+    MODEL_TOKENS.inc(usage.completion_tokens or 0, model=model, direction="out")
+
+def model_usage():
+  """
+  Per model: calls made, calls answered from cache, and tokens reported by the provider.
+  """
+  stats = {}
+  for (model, outcome), count in MODEL_CALLS.samples().items():
+    if outcome == "ok":
+      stats.setdefault(model, {})["calls"] = count
+  for (model, result), count in MODEL_CACHE_LOOKUPS.samples().items():
+    if result == "hit":
+      stats.setdefault(model, {})["cache_hits"] = count
+  for (model, direction), count in MODEL_TOKENS.samples().items():
+    name = "prompt_tokens" if direction == "in" else "completion_tokens"
+    stats.setdefault(model, {})[name] = count
+  return stats
+
+def cached_response(model, cache_key):
+  cached = response_cache.get(cache_key)
+  MODEL_CACHE_LOOKUPS.inc(model=model, result="miss" if cached is None else "hit")
+  return cached
 
-  return response.choices[0].message.content
+async def async_cached_response(model, cache_key):
+  cached = await response_cache.async_get(cache_key)
+  MODEL_CACHE_LOOKUPS.inc(model=model, result="miss" if cached is None else "hit")
+  return cached
 
-async def async_call_model(model, sys_msg):
-  response = client.chat.completions.create(
-    model=model,
-    messages=[{
+def should_cache(content, cacheable):
+  return bool(content) and (cacheable is None or cacheable(content))
+
+def model_cache_key(model, sys_msg, temperature=TEMPERATURE, response_format=None):
+  prompt_hash = hashlib.sha256(sys_msg.encode("utf-8")).hexdigest()
+  if response_format is None:
+    return f"{model}:{temperature}:{prompt_hash}"
+  format_hash = hashlib.sha256(json.dumps(response_format, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+  return f"{model}:{temperature}:{prompt_hash}:{format_hash}"
+
+def model_request(model, sys_msg, response_format=None):
+  request = {
+    "model": model,
+    "messages": [{
       "role": "user",
       "content": sys_msg,
     }],
-    temperature=0,
-  )
+    "temperature": TEMPERATURE,
+  }
+  if response_format is not None and model not in _response_format_unsupported:
+    request["response_format"] = response_format
+  return request
+
+def response_format_rejected(model, request, e):
+  """
+  Whether a request failed only because the model does not take its response_format, in
+  which case the model is asked without one from then on. Other invalid requests (a prompt
+  over the context length, say) are not retried.
+  """
+  if "response_format" not in request or not isinstance(e, InvalidRequestError):
+    return False
+  message = str(e).lower()
+  if not any(term in message for term in RESPONSE_FORMAT_ERROR_TERMS):
+    return False
+  print(f"Model {model} rejected response_format, continuing without it: {e}")
+  _response_format_unsupported.add(model)
+  return True
+
+def retryable_model_error(model, e):
+  MODEL_CALLS.inc(model=model, outcome="error")
+  if isinstance(e, RETRYABLE_MODEL_ERRORS):
+    return RetryableError(type(e).__name__)
+  if isinstance(e, httpx.HTTPStatusError) and e.response.status_code in RETRYABLE_STATUS_CODES:
+    return RetryableError(f"status_{e.response.status_code}")
+  return None
+
+def call_model(model, sys_msg, response_format=None, cacheable=None):
+  """
+  Ask a model, answering from cache when the same prompt was asked before. response_format
+  requests JSON (optionally matching a schema) from models that support it. Answers are
+  cached only if cacheable(answer), when given, says they are usable.
+  """
+  cache_key = model_cache_key(model, sys_msg, response_format=response_format)
+  cached = cached_response(model, cache_key)
+  if cached is not None:
+    return cached
+
+  def attempt_once():
+    request = model_request(model, sys_msg, response_format)
+    try:
+      return client.chat.completions.create(**request)
+    except Exception as e:
+      if response_format_rejected(model, request, e):
+        return attempt_once()
+      retryable = retryable_model_error(model, e)
+      if retryable is None:
+        raise
+      raise retryable from e
+
+  with span("model_call", model=model) as attributes:
+    started = time.perf_counter()
+    try:
+      response = with_retries("model", model_limiter, attempt_once)
+    except RetryableError as e:
+      # Out of retries: surface the provider's own error.
+      raise e.__cause__
+    record_usage(model, response, time.perf_counter() - started)
+    attributes["tokens_in"] = getattr(response.usage, "prompt_tokens", None)
+    attributes["tokens_out"] = getattr(response.usage, "completion_tokens", None)
+
+  content = response.choices[0].message.content
+  if should_cache(content, cacheable):
+    response_cache.set(cache_key, content)
+  return content
+
+async def async_call_model(model, sys_msg, response_format=None, cacheable=None):
+  cache_key = model_cache_key(model, sys_msg, response_format=response_format)
+  cached = await async_cached_response(model, cache_key)
+  if cached is not None:
+    return cached
+
+  queued_seconds = []
+
+  async def attempt_once():
+    request = model_request(model, sys_msg, response_format)
+    try:
+      # A slot is held only while a request is in flight, not during backoff between
+      # retries, so calls waiting out a rate limit do not stall every other search.
+      waited = time.perf_counter()
+      async with _model_semaphore:
+        queued_seconds.append(time.perf_counter() - waited)
+        return await async_client.chat.completions.acreate(**request, stream=False)
+    except Exception as e:
+      if response_format_rejected(model, request, e):
+        return await attempt_once()
+      retryable = retryable_model_error(model, e)
+      if retryable is None:
+        raise
+      raise retryable from e
+
+  with span("model_call", model=model) as attributes:
+    started = time.perf_counter()
+    try:
+      response = await async_with_retries("model", model_limiter, attempt_once)
+    except RetryableError as e:
+      raise e.__cause__
+    finally:
+      attributes["queued_ms"] = round(sum(queued_seconds) * 1000, 2)
+    record_usage(model, response, time.perf_counter() - started)
+    attributes["tokens_in"] = getattr(response.usage, "prompt_tokens", None)
+    attributes["tokens_out"] = getattr(response.usage, "completion_tokens", None)
 
-  return response.choices[0].message.content
\ No newline at end of file
+  content = response.choices[0].message.content
+  if should_cache(content, cacheable):
+    await response_cache.async_set(cache_key, content)
+  return content
@@ -1,8 +1,13 @@
 import asyncio
+import contextlib
+import heapq
+import itertools
 
 from retrieval.model_call import async_call_model, LLAMA_70B, call_model
 import time
 import multiprocessing as mp
+import os
+import threading
 
 
 class AysncIOProcessor:
@@ -20,6 +25,108 @@ class AysncIOProcessor:
     return results
 
 
+class AsyncBatcher:
+  """
+  Groups items submitted close together into one call of process_batch. A batch is sent
+  when adding an item would exceed the token budget, or max_wait seconds after its first
+  item arrived. process_batch receives a list of items and returns one result per item.
+  """
+  def __init__(self, process_batch, token_budget, max_wait):
+    self.process_batch = process_batch
+    self.token_budget = token_budget
+    self.max_wait = max_wait
+    self._pending = []
+    self._pending_tokens = 0
+    self._timer = None
+    self._tasks = set()
+
+  async def submit(self, item, tokens):
+    loop = asyncio.get_running_loop()
+    if self._pending and self._pending_tokens + tokens > self.token_budget:
+      self.flush()
+
+    future = loop.create_future()
+    self._pending.append((item, future))
+    self._pending_tokens += tokens
+    if self._timer is None:
+      self._timer = loop.call_later(self.max_wait, self.flush)
+    return await future
+
+  def flush(self):
+    if self._timer is not None:
+      self._timer.cancel()
+      self._timer = None
+    batch, self._pending, self._pending_tokens = self._pending, [], 0
+    if batch:
+      task = asyncio.ensure_future(self._run(batch))
+      self._tasks.add(task)
+      task.add_done_callback(self._tasks.discard)
+
+  async def _run(self, batch):
+    try:
+      results = await self.process_batch([item for item, _ in batch])
+    except Exception as e:
+      for _, future in batch:
+        if not future.done():
+          future.set_exception(e)
+      return
+    for (_, future), result in zip(batch, results):
+      if not future.done():
+        future.set_result(result)
+
+  def close(self):
+    if self._timer is not None:
+      self._timer.cancel()
+      self._timer = None
+    for task in self._tasks:
+      task.cancel()
+    for _, future in self._pending:
+      future.cancel()
+    self._pending = []
+
+
+class PrioritySemaphore:
+  """
+  An asyncio semaphore that hands free slots to the waiter with the lowest priority value,
+  in arrival order among equals, instead of to whoever asked first.
+  """
+  def __init__(self, value):
+    self._value = value
+    self._waiters = []
+    self._order = itertools.count()
+
+  async def acquire(self, priority=0):
+    if self._value > 0 and not self._waiters:
+      self._value -= 1
+      return
+    future = asyncio.get_running_loop().create_future()
+    heapq.heappush(self._waiters, (priority, next(self._order), future))
+    try:
+      await future
+    except asyncio.CancelledError:
+      if future.done() and not future.cancelled():
+        # Handed a slot just as the waiter was cancelled: pass it on.
+        self.release()
+      raise
+
+  def release(self):
+    while self._waiters:
+      _, _, future = heapq.heappop(self._waiters)
+      # Waiters cancelled while queued are skipped here rather than removed from the heap.
+      if not future.done():
+        future.set_result(None)
+        return
+    self._value += 1
+
+  @contextlib.asynccontextmanager
+  async def slot(self, priority=0):
+    await self.acquire(priority)
+    try:
+      yield
+    finally:
+      self.release()
+
+
 class MultiprocessingProcessor:
   def __init__(self, concurrency = 100):
     self.concurrency = concurrency
@@ -29,6 +136,34 @@ class MultiprocessingProcessor:
       results = pool.starmap(func, iterable)
       return results
 
+class BackgroundEventLoop:
+  """
+  A single event loop running on a daemon thread, shared by every request in the process
+  so that async clients and their connection pools outlive individual requests.
+  """
+  def __init__(self):
+    self._lock = threading.Lock()
+    self._loop = None
+    self._pid = None
+
+  def _ensure_loop(self):
+    with self._lock:
+      # A forked worker inherits the object but not the thread running the loop.
+      if self._loop is None or self._pid != os.getpid():
+        self._loop = asyncio.new_event_loop()
+        self._pid = os.getpid()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+      return self._loop
+
+  def submit(self, coro):
+    return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+  def run(self, coro, timeout=None):
+    return self.submit(coro).result(timeout)
+
+
+background_loop = BackgroundEventLoop()
+
 async def foo(i):
   return i
 
@@ -23,6 +23,11 @@ The query is: {query}
 
 """
 
+SUMMARIES_NOTE = """
+Some names are followed by " - " and a short summary of what the file or directory contains.
+Use the summaries to judge relevance, but answer with the names only.
+"""
+
 ANSWER_FORMAT = f"""
 Provide you answer in json format:
 
@@ -74,6 +79,85 @@ To reiterate:
 """
 
 
+FIND_MOST_RELEVANT_FUNCTIONS_MULTI_FILE = """
+You are an expert in a given code base and your task is to help point a new
+team member to the most relevant functions/classes in the code base given their query.
+
+You will be given the file contents of several files in the codebase and the 
+user query. Each file starts with a line giving its path. Your task is to find the
+most relevant functions/classes in each file.
+
+{files}
+
+<<<< USER QUERY >>>>
+
+{query}
+
+<<<< END USER QUERY >>>>
+"""
+
+FILE_SECTION = """
+<<<< FILE: {file_name} >>>>
+
+{file_contents}
+
+<<<< END FILE: {file_name} >>>>
+"""
+
+ANSWER_FORMAT_MULTI_FILE = f"""
+Provide you answer in json format, with one entry per file path:
+
+{{
+  "<file path>": {{
+    "{RELEVANT_FUNCTIONS_KEY}": [<list of function names in this file relevant to the user's query. Leave empty if no relevant functions are found.>],
+    "{RELEVANT_CLASSES_KEY}": [<list of class names in this file relevant to the user's query. Leave empty if no relevant classes are found.>]
+  }}
+}}
+
+To reiterate:
+1. Only return a json object and nothing else. Your response should begin with an open brace and end with a close brace.
+2. Use the file paths exactly as given. Only list a function or class under the file that defines it.
+3. Only return functions or classes that are highly relevant to the user's query. You want to optimize for precision. Return nothing if
+   if the function/class will not address the user's query.
+"""
+
+
+FIND_CANDIDATE_FUNCTIONS = """
+You are an expert in a given code base and your task is to help point a new
+team member to the most relevant functions/classes in the code base given their query.
+
+You will be given an outline of a single large file in the codebase: the signature,
+docstring and line range of each function and class, without their bodies. Your task
+is to pick the functions/classes whose bodies are worth reading to answer the query.
+
+<<<< FILE OUTLINE >>>>
+
+{file_outline}
+
+<<<< END FILE OUTLINE >>>>
+
+<<<< USER QUERY >>>>
+
+{query}
+
+<<<< END USER QUERY >>>>
+"""
+
+ANSWER_FORMAT_CANDIDATES = f"""
+Provide you answer in json format:
+
+{{
+  "{RELEVANT_FUNCTIONS_KEY}": [<list of candidate function names. Return up to 8. Leave empty if none could be relevant.>]
+  "{RELEVANT_CLASSES_KEY}": [<list of candidate class names. Return up to 4. Leave empty if none could be relevant.>]
+}}
+
+To reiterate:
+1. Only return a json object and nothing else. Your response should begin with an open brace and end with a close brace.
+2. Please ensure that every function or class you return appears in the outline. Use the names exactly as written.
+3. Their bodies will be shown to you in a second step, so favor recall: include anything that could plausibly be relevant.
+"""
+
+
 PROVIDE_EXPLANATION = """
 You are an expert in a given code base and your task is to help a new team
 member to understand the codebase better.
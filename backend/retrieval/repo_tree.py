@@ -0,0 +1,179 @@
+"""
+Whole-repository listings from the Git Trees API.
+
+Without a local snapshot, one recursive tree request replaces a contents call per directory:
+every directory's listing is answered from memory afterwards, and file contents are fetched
+as blobs, which are keyed by content hash and so are cached across commits.
+"""
+import asyncio
+import base64
+import json
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+from retrieval.cache import LRUCache
+from retrieval.http_client import GITHUB_API_URL, github_get, async_github_get
+from retrieval.metrics import span
+from retrieval.snapshot import parse_repo_source, resolve_commit_sha, lock_for, count_github_fetch
+
+REPO_TREES_ENABLED = os.getenv("REPO_TREES", "1") != "0"
+MAX_LOADED_TREES = int(os.getenv("MAX_LOADED_TREES", "32"))
+BLOB_CACHE_SIZE = int(os.getenv("BLOB_CACHE_SIZE", "4096"))
+# Blobs fetched at once by fetch_blobs.
+BLOB_FETCH_CONCURRENCY = int(os.getenv("BLOB_FETCH_CONCURRENCY", "8"))
+
+_loaded_trees = OrderedDict()
+_trees_lock = threading.Lock()
+blob_cache = LRUCache(max_entries=BLOB_CACHE_SIZE)
+
+
+@dataclass
+class RepoTree:
+  owner: str
+  repo: str
+  sha: str
+  # Directory path ("" for the root) -> (subdirectory names, file names), both sorted.
+  directories: dict = field(default_factory=dict)
+  # File path -> blob SHA.
+  blobs: dict = field(default_factory=dict)
+  # File path -> size in bytes, when the API reported it.
+  sizes: dict = field(default_factory=dict)
+
+  def listing(self, path=None):
+    return self.directories.get((path or "").strip("/"))
+
+  def blob_sha(self, path):
+    return self.blobs.get(path.strip("/"))
+
+  def size(self, path):
+    return self.sizes.get(path.strip("/"))
+
+
+def build_repo_tree(owner, repo, sha, entries):
+  """
+  Index the entries of a recursive tree response by directory.
+  """
+  tree = RepoTree(owner=owner, repo=repo, sha=sha)
+  tree.directories[""] = ([], [])
+  for entry in entries:
+    path = entry["path"]
+    parent, _, name = path.rpartition("/")
+    if entry["type"] == "tree":
+      tree.directories.setdefault(path, ([], []))
+      tree.directories.setdefault(parent, ([], []))[0].append(name)
+    elif entry["type"] == "blob":
+      tree.directories.setdefault(parent, ([], []))[1].append(name)
+      tree.blobs[path] = entry["sha"]
+      if "size" in entry:
+        tree.sizes[path] = entry["size"]
+    # Submodules ("commit" entries) have no contents to search.
+
+  for directories, files in tree.directories.values():
+    directories.sort()
+    files.sort()
+  return tree
+
+
+def fetch_repo_tree(owner, repo, sha):
+  count_github_fetch("trees_api")
+  with span("github_tree", repo=f"{owner}/{repo}"):
+    response = github_get(f"{GITHUB_API_URL}/repos/{owner}/{repo}/git/trees/{sha}?recursive=1")
+  if response is None or response.status_code != 200:
+    status = response.status_code if response is not None else "no response"
+    print(f"Error: Unable to fetch tree of {owner}/{repo}@{sha[:12]}. Status: {status}")
+    return None
+
+  data = json.loads(response.text)
+  if data.get("truncated"):
+    # Too large for one response; per-directory contents calls still work.
+    print(f"Tree of {owner}/{repo}@{sha[:12]} is truncated, listing directories individually")
+    return None
+  return build_repo_tree(owner, repo, sha, data.get("tree", []))
+
+
+def get_repo_tree(repo_url):
+  """
+  Return the tree of the repository at its current HEAD, fetched once per commit. A tree
+  that could not be fetched or was truncated is remembered as None, so the commit goes
+  straight to the contents API afterwards.
+  """
+  if not REPO_TREES_ENABLED:
+    return None
+  source = parse_repo_source(repo_url)
+  if source.kind != "github":
+    return None
+  sha = resolve_commit_sha(source)
+  if not sha:
+    return None
+
+  key = (source.owner, source.repo, sha)
+  with lock_for(("tree",) + key):
+    with _trees_lock:
+      if key in _loaded_trees:
+        _loaded_trees.move_to_end(key)
+        return _loaded_trees[key]
+
+    tree = fetch_repo_tree(source.owner, source.repo, sha)
+    with _trees_lock:
+      _loaded_trees[key] = tree
+      if len(_loaded_trees) > MAX_LOADED_TREES:
+        _loaded_trees.popitem(last=False)
+    return tree
+
+
+def _blob_url(tree, blob_sha):
+  return f"{GITHUB_API_URL}/repos/{tree.owner}/{tree.repo}/git/blobs/{blob_sha}"
+
+
+def parse_blob_response(response):
+  if response is None or response.status_code != 200:
+    return None
+  data = json.loads(response.text)
+  if data.get("encoding") == "base64":
+    return base64.b64decode(data["content"])
+  return data["content"].encode("utf-8")
+
+
+def read_tree_file(tree, path):
+  """
+  Bytes of a file in the tree, or None if it is not a file.
+  """
+  blob_sha = tree.blob_sha(path)
+  if not blob_sha:
+    return None
+  data = blob_cache.get(blob_sha)
+  if data is None:
+    count_github_fetch("blobs_api")
+    data = parse_blob_response(github_get(_blob_url(tree, blob_sha)))
+    if data is not None:
+      blob_cache.set(blob_sha, data)
+  return data
+
+
+async def async_read_tree_file(tree, path):
+  blob_sha = tree.blob_sha(path)
+  if not blob_sha:
+    return None
+  data = blob_cache.get(blob_sha)
+  if data is None:
+    count_github_fetch("blobs_api")
+    data = parse_blob_response(await async_github_get(_blob_url(tree, blob_sha)))
+    if data is not None:
+      blob_cache.set(blob_sha, data)
+  return data
+
+
+async def fetch_blobs(tree, paths):
+  """
+  Fetch several files concurrently, returning {path: bytes} for those that could be read.
+  """
+  semaphore = asyncio.Semaphore(BLOB_FETCH_CONCURRENCY)
+
+  async def fetch(path):
+    async with semaphore:
+      return path, await async_read_tree_file(tree, path)
+
+  results = await asyncio.gather(*(fetch(path) for path in paths))
+  return {path: data for path, data in results if data is not None}
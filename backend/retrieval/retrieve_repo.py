@@ -1,12 +1,32 @@
-import requests
+import asyncio
 import json
 import urllib.parse
 import base64
-import astroid
-import sys
+import difflib
+import os
 
 from dataclasses import dataclass
 
+from retrieval.cache import LRUCache, AsyncSingleFlight
+from retrieval.http_client import GITHUB_API_URL, github_get, async_github_get
+from retrieval.metrics import Counter, span
+from retrieval.snapshot import get_snapshot, list_snapshot_directory, read_snapshot_file, snapshot_path, count_github_fetch
+from retrieval.repo_tree import get_repo_tree, read_tree_file, async_read_tree_file, fetch_blobs
+from retrieval.extractors import extract_file_module, has_extractor
+from retrieval.symbol_index import get_symbol_index
+from retrieval.summaries import SUMMARIES_ENABLED, get_summaries
+
+# Similarity (difflib's ratio) a near-miss name needs to resolve to a definition.
+FUZZY_MATCH_CUTOFF = float(os.getenv("FUZZY_MATCH_CUTOFF", "0.8"))
+# Decoded files kept in memory, keyed by commit and path.
+FILE_CACHE_SIZE = int(os.getenv("FILE_CACHE_SIZE", "1024"))
+
+file_contents_cache = LRUCache(max_entries=FILE_CACHE_SIZE)
+file_reads = AsyncSingleFlight()
+
+FILE_READS = Counter("file_reads_total", "File reads, by whether the file was already loaded (cache) or read now (read).", ["source"])
+PREFETCHES = Counter("file_prefetches_total", "Files read speculatively while the model triaged their directory.")
+
 @dataclass
 class FolderContents: 
     directories: list
@@ -17,35 +37,62 @@ class FileContents:
     name: str
     code: str
 
-def get_repo_contents(repo_url, folder_path=None):
+def build_contents_api_url(repo_url, folder_path=None):
     # Extract owner and repo name from the URL
     parts = repo_url.rstrip('/').split('/')
     owner, repo = parts[-2], parts[-1]
 
     # GitHub API endpoint
-    api_url = f"https://api.github.com/repos/{owner}/{repo}/contents"
+    api_url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/contents"
     
     # If a folder is specified, add it to the API URL
     if folder_path:
         api_url += f"/{urllib.parse.quote(folder_path)}"
 
-    # Make a GET request to the GitHub API
-    response = requests.get(api_url)
+    return api_url
 
+
+def parse_contents_response(status_code, text, folder_path=None):
     # Check if the request was successful
-    if response.status_code == 200:
+    if status_code == 200:
         # Parse the JSON response
-        return json.loads(response.text)
+        return json.loads(text)
     else:
-        print(f"Error: Unable to fetch repository contents. Status code: {response.status_code}")
+        print(f"Error: Unable to fetch repository contents. Status code: {status_code}")
         print(f"Folder path: {folder_path}")
-        print(response.text)
+        print(text)
     
     return None
 
 
-def get_repo_file_structure(repo_url, path=None):
-    contents = get_repo_contents(repo_url, path)
+def get_repo_contents(repo_url, folder_path=None):
+    # Make a GET request to the GitHub API
+    count_github_fetch("contents_api")
+    with span("github_contents", path=folder_path):
+        response = github_get(build_contents_api_url(repo_url, folder_path))
+    if response is None:
+        return None
+    return parse_contents_response(response.status_code, response.text, folder_path)
+
+
+async def async_get_repo_contents(repo_url, folder_path=None):
+    count_github_fetch("contents_api")
+    with span("github_contents", path=folder_path):
+        response = await async_github_get(build_contents_api_url(repo_url, folder_path))
+    if response is None:
+        return None
+    return parse_contents_response(response.status_code, response.text, folder_path)
+
+
+def snapshot_folder_contents(snapshot, path=None):
+    listing = list_snapshot_directory(snapshot, path)
+    if listing is None:
+        return None
+    directories, files = listing
+    return FolderContents(directories=directories, files=files)
+
+
+def contents_to_folder_contents(contents):
     if contents is None:
       return None
             
@@ -64,69 +111,259 @@ def get_repo_file_structure(repo_url, path=None):
 
     return folder_contents
 
-def get_file_contents(repo_url, path):
-    contents = get_repo_contents(repo_url, path)
+
+def snapshot_file_contents(snapshot, path):
+    return bytes_to_file_contents(path, read_snapshot_file(snapshot, path))
+
+
+def snapshot_file_size(snapshot, path):
+    full_path = snapshot_path(snapshot, path)
+    if not full_path or not os.path.isfile(full_path):
+        return None
+    return os.path.getsize(full_path)
+
+
+def contents_to_file_contents(contents):
     if not contents:
       return None
     if isinstance(contents, list):
       return None
     return FileContents(name=contents['name'], 
                         code=base64.b64decode(contents['content']).decode('utf-8'))
-    
 
-def get_function_with_comments(code_str, function_node):
+
+def tree_folder_contents(tree, path=None):
+    listing = tree.listing(path)
+    if listing is None:
+        return None
+    directories, files = listing
+    return FolderContents(directories=list(directories), files=list(files))
+
+
+def bytes_to_file_contents(path, data):
+    if data is None:
+        return None
+    try:
+        return FileContents(name=path.rstrip('/').split('/')[-1], code=data.decode('utf-8'))
+    except UnicodeDecodeError:
+        return None
+
+
+def get_repo_file_structure(repo_url, path=None):
+    snapshot = get_snapshot(repo_url)
+    if snapshot:
+        return snapshot_folder_contents(snapshot, path)
+    tree = get_repo_tree(repo_url)
+    if tree:
+        return tree_folder_contents(tree, path)
+    return contents_to_folder_contents(get_repo_contents(repo_url, path))
+
+
+def get_file_contents(repo_url, path):
+    snapshot = get_snapshot(repo_url)
+    if snapshot:
+        return snapshot_file_contents(snapshot, path)
+    tree = get_repo_tree(repo_url)
+    if tree:
+        return bytes_to_file_contents(path, read_tree_file(tree, path))
+    return contents_to_file_contents(get_repo_contents(repo_url, path))
+
+
+async def async_get_repo_file_structure(repo_url, path=None):
+    with span("list_directory", path=path):
+        snapshot = await asyncio.to_thread(get_snapshot, repo_url)
+        if snapshot:
+            return await asyncio.to_thread(snapshot_folder_contents, snapshot, path)
+        tree = await asyncio.to_thread(get_repo_tree, repo_url)
+        if tree:
+            return tree_folder_contents(tree, path)
+        return contents_to_folder_contents(await async_get_repo_contents(repo_url, path))
+
+
+async def _async_cached_file_contents(key, read):
     """
-    Extract the function source code, including comments, from the original code string.
+    Decoded contents of a file at a commit, read at most once at a time: a caller arriving
+    while a (possibly speculative) read of the same file is in flight waits for it.
     """
-    if function_node is None:
-        return "Function not found."
-    
-    # Get the start and end line numbers of the function
-    start_line = function_node.lineno - 1  # lineno is 1-based, so adjust to 0-based index
-    end_line = function_node.end_lineno  # end_lineno is already 1-based
-    
-    # Split the original code string by lines
-    code_lines = code_str.splitlines()
-    
-    # Extract the relevant lines (including comments)
-    function_lines = code_lines[start_line:end_line]
-    
-    return (start_line, end_line, "\n".join(function_lines))
+    cached = file_contents_cache.get(key)
+    if cached is not None:
+        FILE_READS.inc(source="cache")
+        return cached
+
+    async def read_and_cache():
+        FILE_READS.inc(source="read")
+        contents = await read()
+        if contents is not None:
+            file_contents_cache.set(key, contents)
+        return contents
+
+    return await file_reads.do(key, read_and_cache)
+
+
+async def async_get_file_contents(repo_url, path):
+    with span("read_file", path=path):
+        snapshot = await asyncio.to_thread(get_snapshot, repo_url)
+        if snapshot:
+            return await _async_cached_file_contents(
+                (snapshot.owner, snapshot.repo, snapshot.sha, path),
+                lambda: asyncio.to_thread(snapshot_file_contents, snapshot, path))
+        tree = await asyncio.to_thread(get_repo_tree, repo_url)
+        if tree:
+            async def read_tree_file_contents():
+                return bytes_to_file_contents(path, await async_read_tree_file(tree, path))
+            return await _async_cached_file_contents((tree.owner, tree.repo, tree.sha, path), read_tree_file_contents)
+        return contents_to_file_contents(await async_get_repo_contents(repo_url, path))
 
 
-def find_function_in_class_or_module(node, function_name, target_type="function"):
+async def async_speculative_read(repo_url, path, max_bytes):
     """
-    Recursively search through classes and modules to find a function by its name.
+    Load a file into the file cache ahead of a possible read, unless it is larger than
+    max_bytes. Without a snapshot or tree there is no commit to key the cache by, so nothing
+    is read.
     """
-    target_type_obj = astroid.FunctionDef if target_type == "function" else astroid.ClassDef
+    snapshot = await asyncio.to_thread(get_snapshot, repo_url)
+    if snapshot:
+        size = await asyncio.to_thread(snapshot_file_size, snapshot, path)
+    else:
+        tree = await asyncio.to_thread(get_repo_tree, repo_url)
+        if not tree or not tree.blob_sha(path):
+            return
+        size = tree.size(path)
+    if size is None or size > max_bytes:
+        return
+    PREFETCHES.inc()
+    await async_get_file_contents(repo_url, path)
 
-    # If it's a target type definition at the module or class level
-    if isinstance(node, target_type_obj) and node.name == function_name:
-        return node
-    
-    # If it's a class, look inside the class body
-    if isinstance(node, astroid.ClassDef):
-        for class_node in node.body:
-            result = find_function_in_class_or_module(class_node, function_name, target_type)
-            if result:
-                return result
-    
-    # If it's a module, look at the top level
-    if isinstance(node, astroid.Module):
-        for module_node in node.body:
-            result = find_function_in_class_or_module(module_node, function_name, target_type)
-            if result:
-                return result
-    
+
+async def async_prefetch_file_contents(repo_url, paths):
+    """
+    Fetch a known set of files in one concurrent batch, so later reads of them are served
+    from the blob cache. Snapshots need no prefetching.
+    """
+    snapshot = await asyncio.to_thread(get_snapshot, repo_url)
+    if snapshot:
+        return
+    tree = await asyncio.to_thread(get_repo_tree, repo_url)
+    if tree:
+        with span("prefetch_files", files=len(paths)):
+            await fetch_blobs(tree, paths)
+
+
+def normalize_symbol_name(name):
+    """
+    Reduce an answer such as "async def parse_args(argv)" or "Stack::push" to a plain
+    (possibly dotted) name.
+    """
+    name = name.strip().split("(", 1)[0].replace("::", ".").replace("#", ".")
+    words = name.split()
+    return words[-1] if words else ""
+
+
+def fold_symbol_name(name):
+    return name.lower().replace("_", "")
+
+
+def symbol_depth(symbol):
+    return symbol.qualified_name.count(".")
+
+
+def index_symbols_by_name(symbols):
+    """
+    Map kind -> {name or qualified name -> SymbolDefinition}. Qualified names are unique; a
+    bare name shared by several definitions means the least nested one (a top-level
+    function over a nested function or method of the same name), then the first.
+    """
+    by_kind = {}
+    for symbol in symbols:
+        by_kind.setdefault(symbol.kind, {}).setdefault(symbol.qualified_name, symbol)
+    for symbol in symbols:
+        names = by_kind[symbol.kind]
+        current = names.get(symbol.name)
+        if current is None or (current.qualified_name != symbol.name and symbol_depth(symbol) < symbol_depth(current)):
+            names[symbol.name] = symbol
+    return by_kind
+
+
+def is_misspelling(key, candidate):
+    # A name that only adds to or drops from the end of another (parse/parser,
+    # get_user/get_users) is a different identifier, not a typo of it.
+    return not (candidate.startswith(key) or key.startswith(candidate))
+
+
+def match_symbol(by_kind, name, target_type="function"):
+    """
+    Find the definition of a name, tolerating the near misses models make: call syntax,
+    a wrong or missing qualifier, different case or a small typo.
+    """
+    names = by_kind.get(target_type, {})
+    if name in names:
+        return names[name]
+
+    cleaned = normalize_symbol_name(name)
+    for candidate in (cleaned, cleaned.rsplit(".", 1)[-1]):
+        if candidate in names:
+            return names[candidate]
+
+    # Compare case- and underscore-insensitively, so parseArgs finds parse_args.
+    folded = {}
+    for symbol_name, symbol in names.items():
+        folded.setdefault(fold_symbol_name(symbol_name), symbol)
+    key = fold_symbol_name(cleaned)
+    if key in folded:
+        return folded[key]
+
+    for close in difflib.get_close_matches(key, folded, n=3, cutoff=FUZZY_MATCH_CUTOFF):
+        if is_misspelling(key, close):
+            return folded[close]
     return None
 
-def find_code_snippet_definition(code_str, function_name, target_type="function"):
-    # Parse the code string into an AST (Abstract Syntax Tree)
-    tree = astroid.parse(code_str)
-    
-    # Start by looking through the module level
-    node = find_function_in_class_or_module(tree, function_name, target_type)
-    if node:
-        return get_function_with_comments(code_str, node)
-    
-    return None
\ No newline at end of file
+
+def resolve_code_snippet_definitions(repo_url, path, code_str, names):
+    """
+    Resolve several (name, target type) pairs of one file with a single parse of it (or
+    none, given a symbol index) and a single split of its lines. Returns one
+    (symbol, (start line, end line, code)) per pair, or None for names that do not resolve.
+    """
+    symbols = get_file_symbols(repo_url, path, code_str)
+    if not symbols:
+        return [None for _ in names]
+
+    with span("symbol_resolve", path=path, names=len(names)):
+        by_kind = index_symbols_by_name(symbols)
+        code_lines = code_str.splitlines()
+        resolved = []
+        for name, target_type in names:
+            symbol = match_symbol(by_kind, name, target_type)
+            if symbol is None:
+                resolved.append(None)
+                continue
+            start_line = symbol.line_start - 1
+            resolved.append((symbol, (start_line, symbol.line_end, "\n".join(code_lines[start_line:symbol.line_end]))))
+    return resolved
+
+
+def get_file_symbols(repo_url, path, code_str):
+    """
+    Return the functions and classes of a file, from the symbol index when possible.
+    """
+    if not has_extractor(path):
+        return []
+
+    snapshot = get_snapshot(repo_url)
+    if snapshot:
+        return get_symbol_index(snapshot).symbols(path)
+
+    module = extract_file_module(path, code_str)
+    return module[1] if module else []
+
+
+def get_repo_summaries(repo_url):
+    """
+    Return the file and directory summaries of the repository, or None without a snapshot.
+    """
+    if not SUMMARIES_ENABLED:
+        return None
+    snapshot = get_snapshot(repo_url)
+    if not snapshot:
+        return None
+    return get_summaries(snapshot)
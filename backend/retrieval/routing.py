@@ -0,0 +1,247 @@
+import os
+import time
+
+from retrieval.metrics import Counter, Histogram, span
+from retrieval.model_call import call_model, async_call_model, LLAMA_70B, LLAMA_8B
+from retrieval.structured_output import (
+  DIRECTORY_ANSWER_SCHEMA,
+  FILE_ANSWER_SCHEMA,
+  MULTI_FILE_ANSWER_SCHEMA,
+  REPAIR_MAX_CHARS,
+  build_repair_prompt,
+  extract_json,
+  response_format,
+  schema_problem,
+)
+
+STAGE_DIRECTORY_TRIAGE = "directory_triage"
+STAGE_SMALL_FILE_SEARCH = "small_file_search"
+STAGE_FILE_SEARCH = "file_search"
+STAGE_BATCH_FILE_SEARCH = "batch_file_search"
+STAGE_OUTLINE_SEARCH = "outline_search"
+STAGE_EXPLANATION = "explanation"
+
+# Models tried in order for each stage; a later model only sees the prompt when the
+# previous answer was unusable JSON (even after repair), empty, or failed the stage's sanity
+# check.
+DEFAULT_POLICIES = {
+  STAGE_DIRECTORY_TRIAGE: [LLAMA_8B, LLAMA_70B],
+  STAGE_SMALL_FILE_SEARCH: [LLAMA_8B, LLAMA_70B],
+  STAGE_BATCH_FILE_SEARCH: [LLAMA_8B, LLAMA_70B],
+  STAGE_FILE_SEARCH: [LLAMA_70B],
+  STAGE_OUTLINE_SEARCH: [LLAMA_70B],
+  STAGE_EXPLANATION: [LLAMA_70B],
+}
+
+# The JSON schema each stage's answer must match.
+STAGE_SCHEMAS = {
+  STAGE_DIRECTORY_TRIAGE: DIRECTORY_ANSWER_SCHEMA,
+  STAGE_SMALL_FILE_SEARCH: FILE_ANSWER_SCHEMA,
+  STAGE_BATCH_FILE_SEARCH: MULTI_FILE_ANSWER_SCHEMA,
+  STAGE_FILE_SEARCH: FILE_ANSWER_SCHEMA,
+  STAGE_OUTLINE_SEARCH: FILE_ANSWER_SCHEMA,
+}
+
+MODEL_ALIASES = {
+  "8b": LLAMA_8B,
+  "70b": LLAMA_70B,
+}
+
+# Files up to this many (estimated) tokens use the small-file policy.
+SMALL_FILE_TOKENS = int(os.getenv("SMALL_FILE_TOKENS", "1500"))
+
+STAGE_ANSWERS = Counter("model_stage_answers_total", "Answers per stage and model, by whether they were accepted or escalated.", ["stage", "model", "outcome"])
+STAGE_CALL_SECONDS = Histogram("model_stage_call_seconds", "Model call latency per stage, including cache hits.", ["stage", "model"])
+STRUCTURED_ANSWERS = Counter("structured_answers_total", "JSON answers per stage, by how they were parsed (exact, extracted, repaired) or why they were unusable.", ["stage", "result"])
+
+
+class EscalationError(Exception):
+  pass
+
+
+def resolve_model(name):
+  return MODEL_ALIASES.get(name.strip().lower(), name.strip())
+
+
+def load_policies():
+  """
+  Stage policies, overridable per stage with e.g. MODEL_POLICY_DIRECTORY_TRIAGE=8b,70b
+  (aliases or full model names).
+  """
+  policies = {}
+  for stage, models in DEFAULT_POLICIES.items():
+    override = os.getenv(f"MODEL_POLICY_{stage.upper()}")
+    if override:
+      models = [resolve_model(m) for m in override.split(",") if m.strip()]
+    policies[stage] = models
+  return policies
+
+
+POLICIES = load_policies()
+# Rewrites malformed JSON answers. It only sees the answer, not the stage's prompt, so a
+# repair costs a fraction of asking the next model in the policy.
+REPAIR_MODEL = resolve_model(os.getenv("REPAIR_MODEL", "8b"))
+
+
+def record(stage, model, outcome):
+  STAGE_ANSWERS.inc(stage=stage, model=model, outcome=outcome)
+
+
+def routing_stats():
+  """
+  Per stage and model: how many answers were accepted and how many escalated, by reason,
+  plus the number of calls and the seconds spent waiting on them.
+  """
+  stats = {}
+  for (stage, model, outcome), count in STAGE_ANSWERS.samples().items():
+    stats.setdefault(stage, {}).setdefault(model, {})[outcome] = count
+  for (stage, model), (seconds, calls) in STAGE_CALL_SECONDS.samples().items():
+    stats.setdefault(stage, {}).setdefault(model, {}).update(calls=calls, seconds=seconds)
+  return stats
+
+
+def parse_answer(response, schema):
+  """
+  Return (answer, how it was parsed) for a response holding JSON that matches schema, or
+  (None, reason) for one that does not.
+  """
+  answer, exact = extract_json(response)
+  if answer is None:
+    return None, "invalid_json"
+  if schema is not None and schema_problem(answer, schema):
+    return None, "schema_mismatch"
+  return answer, "exact" if exact else "extracted"
+
+
+def parses_as(schema):
+  """
+  The cacheable predicate for answers that must match schema: malformed answers are not
+  cached, so asking again gets a fresh answer rather than the same unusable one.
+  """
+  if schema is None:
+    return None
+  return lambda response: parse_answer(response, schema)[0] is not None
+
+
+def needs_repair(response, schema, reason):
+  return schema is not None and reason in ("invalid_json", "schema_mismatch") and len(response) <= REPAIR_MAX_CHARS
+
+
+def check_answer(answer, reason, validate):
+  """
+  Return (answer, None) for an acceptable answer, or (answer, reason) for one that should
+  be escalated.
+  """
+  if answer is None:
+    return None, reason
+  if validate is not None:
+    reason = validate(answer)
+    if reason:
+      return answer, reason
+  return answer, None
+
+
+def record_parse(stage, answer, result):
+  STRUCTURED_ANSWERS.inc(stage=stage, result=result)
+  if result in ("exact", "extracted", "repaired"):
+    return answer, None
+  return None, result
+
+
+def _finish(stage, model, answer, reason, is_last):
+  if reason is None:
+    record(stage, model, "accepted")
+    return True
+  if is_last:
+    record(stage, model, f"final_{reason}")
+    if answer is None:
+      raise EscalationError(f"{stage}: no usable answer ({reason}) from {model}")
+    return True
+  record(stage, model, f"escalated_{reason}")
+  print(f"Escalating {stage} from {model}: {reason}")
+  return False
+
+
+async def async_parse_json_answer(stage, response, schema):
+  """
+  Parse a JSON answer, asking REPAIR_MODEL to rewrite it if it is malformed. Returns
+  (answer, None) or (None, reason).
+  """
+  with span("parse_answer"):
+    answer, result = parse_answer(response, schema)
+  if not needs_repair(response, schema, result):
+    return record_parse(stage, answer, result)
+
+  print(f"Repairing {stage} answer: {result}")
+  with span("repair_answer", reason=result):
+    try:
+      repair = await async_call_model(
+        REPAIR_MODEL, build_repair_prompt(response, schema), response_format(schema), parses_as(schema))
+    except Exception as e:
+      # The stage escalates as it would have without a repair.
+      print(f"Error: Repair of {stage} answer failed: {e}")
+      repair = None
+    answer, _ = parse_answer(repair or "", schema)
+  return record_parse(stage, answer, "repaired" if answer is not None else result)
+
+
+def parse_json_answer(stage, response, schema):
+  with span("parse_answer"):
+    answer, result = parse_answer(response, schema)
+  if not needs_repair(response, schema, result):
+    return record_parse(stage, answer, result)
+
+  print(f"Repairing {stage} answer: {result}")
+  with span("repair_answer", reason=result):
+    try:
+      repair = call_model(
+        REPAIR_MODEL, build_repair_prompt(response, schema), response_format(schema), parses_as(schema))
+    except Exception as e:
+      print(f"Error: Repair of {stage} answer failed: {e}")
+      repair = None
+    answer, _ = parse_answer(repair or "", schema)
+  return record_parse(stage, answer, "repaired" if answer is not None else result)
+
+
+async def async_call_model_with_policy(stage, sys_msg, validate=None, parse_json=True):
+  """
+  Ask each model in the stage's policy in turn, returning the first acceptable answer
+  (parsed JSON unless parse_json is False). validate returns a reason string to escalate.
+  JSON is requested in the stage's schema, and a malformed answer is repaired by
+  REPAIR_MODEL before the next model in the policy is asked.
+  """
+  models = POLICIES[stage]
+  schema = STAGE_SCHEMAS.get(stage) if parse_json else None
+  for i, model in enumerate(models):
+    with span(stage, model=model) as attributes:
+      started = time.perf_counter()
+      response = await async_call_model(model, sys_msg, response_format(schema), parses_as(schema))
+      STAGE_CALL_SECONDS.observe(time.perf_counter() - started, stage=stage, model=model)
+      if not response or not response.strip():
+        answer, reason = None, "empty"
+      elif parse_json:
+        answer, reason = check_answer(*await async_parse_json_answer(stage, response, schema), validate)
+      else:
+        answer, reason = response, None
+      attributes["outcome"] = reason or "accepted"
+    if _finish(stage, model, answer, reason, i == len(models) - 1):
+      return answer
+
+
+def call_model_with_policy(stage, sys_msg, validate=None, parse_json=True):
+  models = POLICIES[stage]
+  schema = STAGE_SCHEMAS.get(stage) if parse_json else None
+  for i, model in enumerate(models):
+    with span(stage, model=model) as attributes:
+      started = time.perf_counter()
+      response = call_model(model, sys_msg, response_format(schema), parses_as(schema))
+      STAGE_CALL_SECONDS.observe(time.perf_counter() - started, stage=stage, model=model)
+      if not response or not response.strip():
+        answer, reason = None, "empty"
+      elif parse_json:
+        answer, reason = check_answer(*parse_json_answer(stage, response, schema), validate)
+      else:
+        answer, reason = response, None
+      attributes["outcome"] = reason or "accepted"
+    if _finish(stage, model, answer, reason, i == len(models) - 1):
+      return answer
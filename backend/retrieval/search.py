@@ -1,28 +1,102 @@
 from retrieval.retrieve_repo import (
-  get_repo_file_structure, 
-  get_file_contents,  
-  find_code_snippet_definition
+  async_get_repo_file_structure,
+  async_get_file_contents,
+  async_prefetch_file_contents,
+  async_speculative_read,
+  resolve_code_snippet_definitions,
+  get_file_symbols,
+  get_repo_summaries,
 )
 
 from retrieval.prompts import (
   FIND_MOST_RELEVANT_FILE,
+  SUMMARIES_NOTE,
   ANSWER_FORMAT, 
   RELEVANT_FILES_KEY, 
   RELEVANT_DIRECTORIES_KEY,
   FIND_MOST_RELEVANT_FUNCTIONS,
   ANSWER_FORMAT_FILES,
+  FIND_CANDIDATE_FUNCTIONS,
+  ANSWER_FORMAT_CANDIDATES,
+  FIND_MOST_RELEVANT_FUNCTIONS_MULTI_FILE,
+  FILE_SECTION,
+  ANSWER_FORMAT_MULTI_FILE,
   RELEVANT_FUNCTIONS_KEY,
   RELEVANT_CLASSES_KEY,
   PROVIDE_EXPLANATION,
-  ANSWER_EXPLANATION,
 )
-from retrieval.model_call import call_model, LLAMA_70B
+from retrieval.routing import (
+  call_model_with_policy,
+  async_call_model_with_policy,
+  EscalationError,
+  SMALL_FILE_TOKENS,
+  STAGE_DIRECTORY_TRIAGE,
+  STAGE_SMALL_FILE_SEARCH,
+  STAGE_FILE_SEARCH,
+  STAGE_BATCH_FILE_SEARCH,
+  STAGE_OUTLINE_SEARCH,
+  STAGE_EXPLANATION,
+)
 
-import json
+import asyncio
+import hashlib
+import os
+import time
 from dataclasses import dataclass
 from urllib.parse import urlparse
 
-from retrieval.multi_processor_utils import MultiprocessingProcessor
+from retrieval.multi_processor_utils import AysncIOProcessor, AsyncBatcher, PrioritySemaphore, background_loop
+from retrieval.cache import LRUCache, AsyncSingleFlight
+from retrieval.metrics import Counter, span, traced
+from retrieval.snapshot import get_snapshot, resolve_repo_commit
+from retrieval.lexical_index import get_lexical_index, tokenize
+from retrieval.extractors import has_extractor
+from retrieval.chunking import (
+  FILE_TOKEN_BUDGET,
+  estimate_tokens,
+  build_file_outline,
+  build_symbol_chunks,
+  find_symbols,
+)
+
+# Maximum number of directories or files a single search works on at once.
+SEARCH_CONCURRENCY = int(os.getenv("SEARCH_CONCURRENCY", "10"))
+# Budgets for the directory walk: how deep it may go and how many directories plus files it may visit.
+SEARCH_MAX_DEPTH = int(os.getenv("SEARCH_MAX_DEPTH", "10"))
+SEARCH_MAX_NODES = int(os.getenv("SEARCH_MAX_NODES", "60"))
+ALLOW_LOCAL_REPOS = os.getenv("ALLOW_LOCAL_REPOS", "0") == "1"
+# "bfs" walks the tree with the model; "lexical" picks candidate files with a local BM25 index.
+SEARCH_MODE_BFS = "bfs"
+SEARCH_MODE_LEXICAL = "lexical"
+SEARCH_MODES = (SEARCH_MODE_BFS, SEARCH_MODE_LEXICAL)
+# Files up to BATCH_SMALL_FILE_TOKENS are packed together into one function-search prompt of
+# at most BATCH_TOKEN_BUDGET tokens, waiting up to BATCH_WAIT_SECONDS for more files to arrive.
+BATCH_SMALL_FILE_TOKENS = int(os.getenv("BATCH_SMALL_FILE_TOKENS", "1500"))
+BATCH_TOKEN_BUDGET = int(os.getenv("BATCH_TOKEN_BUDGET", "6000"))
+BATCH_WAIT_SECONDS = float(os.getenv("BATCH_WAIT_SECONDS", "0.3"))
+# Files read speculatively during directory triage: at most this many per directory listed and
+# per search, skipping files larger than PREFETCH_MAX_FILE_BYTES.
+PREFETCH_FILES_PER_DIRECTORY = int(os.getenv("PREFETCH_FILES_PER_DIRECTORY", "6"))
+PREFETCH_MAX_FILES = int(os.getenv("PREFETCH_MAX_FILES", "40"))
+PREFETCH_MAX_FILE_BYTES = int(os.getenv("PREFETCH_MAX_FILE_BYTES", str(256 * 1024)))
+# Default and maximum time budget of a search. At its deadline a search returns what it has
+# found so far, marked partial; it stops expanding directories once less than
+# SEARCH_EXPANSION_RESERVE of the budget is left, so the files already picked can finish.
+SEARCH_TIMEOUT_SECONDS = float(os.getenv("SEARCH_TIMEOUT_SECONDS", "120"))
+SEARCH_EXPANSION_RESERVE = float(os.getenv("SEARCH_EXPANSION_RESERVE", "0.25"))
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "512"))
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", str(24 * 3600)))
+
+# Explanations of a line, by snippet code, line within the snippet and normalized question.
+EXPLANATION_CACHE_SIZE = int(os.getenv("EXPLANATION_CACHE_SIZE", "4096"))
+EXPLANATION_CACHE_TTL = float(os.getenv("EXPLANATION_CACHE_TTL", str(7 * 24 * 3600)))
+
+search_result_cache = LRUCache(max_entries=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+search_flights = AsyncSingleFlight()
+explanation_cache = LRUCache(max_entries=EXPLANATION_CACHE_SIZE, ttl=EXPLANATION_CACHE_TTL)
+
+SEARCHES = Counter("searches_total", "Searches run, by mode and how they were answered (cache, shared, search).", ["mode", "source"])
+EXPLANATIONS = Counter("explanations_total", "Line explanations, by whether they came from the cache or the model.", ["source"])
 
 
 # Dummy test case:
@@ -45,64 +119,82 @@ class FileRecommendations:
 @dataclass
 class Recommendations:
   files: list[FileRecommendations]
+  # Set when the search stopped at its deadline with work left undone.
+  partial: bool = False
+
+def file_recommendations_to_json(file_recommendations):
+  return [
+    {f"{function_def.line_start}:{function_def.line_end}": function_def.code}
+    for function_def in file_recommendations.snippets
+  ]
+
+def emit_file_event(on_event, file_recommendations):
+  if on_event and file_recommendations and file_recommendations.snippets:
+    on_event({
+      "type": "file",
+      "file_name": file_recommendations.file_name,
+      "snippets": file_recommendations_to_json(file_recommendations),
+    })
 
 # -----------  FOLDER SEARCH ---------------
-def build_folder_structure_search_sys_prompt(query, folder_contents):
-  directories_str = "\n".join(folder_contents.directories)
-  files_str = "\n".join(folder_contents.files)
+def describe_entries(names, directory, summaries):
+  lines = []
+  for name in names:
+    summary = summaries.get(join_repo_path(directory, name)) if summaries else None
+    lines.append(f"{name} - {summary}" if summary else name)
+  return lines
+
 
-  return FIND_MOST_RELEVANT_FILE.format(
+def build_folder_structure_search_sys_prompt(query, folder_contents, directory=None, summaries=None):
+  directories = describe_entries(folder_contents.directories, directory, summaries)
+  files = describe_entries(folder_contents.files, directory, summaries)
+  directories_str = "\n".join(directories)
+  files_str = "\n".join(files)
+
+  prompt = FIND_MOST_RELEVANT_FILE.format(
     directories=directories_str,
     files=files_str,
     query=query
-  ) + "\n" + ANSWER_FORMAT
-
+  )
+  if directories != folder_contents.directories or files != folder_contents.files:
+    prompt += SUMMARIES_NOTE
+  return prompt + "\n" + ANSWER_FORMAT
+
+
+def validate_directory_answer(folder_contents):
+  # An empty pick, or names that are not in the listing, mean the model was unsure.
+  def validate(answer):
+    if not isinstance(answer, dict):
+      return "not_an_object"
+    directories = answer.get(RELEVANT_DIRECTORIES_KEY, [])
+    files = answer.get(RELEVANT_FILES_KEY, [])
+    if not directories and not files:
+      return "empty"
+    if any(d not in folder_contents.directories for d in directories) or \
+        any(f not in folder_contents.files for f in files):
+      return "unknown_names"
+    return None
+  return validate
 
-def prepare_prompt_and_call_model(repo, query, directory):
-  contents = get_repo_file_structure(repo, directory)
+async def async_prepare_prompt_and_call_model(repo, query, directory, on_listing=None):
+  contents = await async_get_repo_file_structure(repo, directory)
   if not contents:
+    # Transient GitHub failures were already retried; the branch is skipped, not the search.
+    print(f"Skipping directory {directory}: listing unavailable")
+    return (directory, {})
+  if on_listing:
+    on_listing(directory, contents)
+  summaries = await asyncio.to_thread(get_repo_summaries, repo)
+  sys_prompt = build_folder_structure_search_sys_prompt(query, contents, directory, summaries)
+  try:
+    parsed_response = await async_call_model_with_policy(
+      STAGE_DIRECTORY_TRIAGE, sys_prompt, validate_directory_answer(contents))
+  except EscalationError as e:
+    # Like an unavailable listing, an unusable answer skips the branch, not the search.
+    print(f"Skipping directory {directory}: {e}")
     return (directory, {})
-  sys_prompt = build_folder_structure_search_sys_prompt(query, contents)
-  response = call_model(LLAMA_70B, sys_prompt)
-  parsed_response = json.loads(response)
   return (directory, parsed_response)
 
-def search_for_relevant_files(repo, query):
-  files_to_use = []
-
-  directories_to_search = [None]
-
-  processor = MultiprocessingProcessor(concurrency = 10)
-
-  while directories_to_search:
-    print("Searching directories:", directories_to_search)
-
-    if len(directories_to_search) < 4:
-      directory = directories_to_search.pop(0)
-      responses = [prepare_prompt_and_call_model(repo, query, directory)]
-    else:
-      print("Parallel")
-      args = [(repo, query, directory) for directory in directories_to_search]
-      directories_to_search = []
-      responses = processor.process(prepare_prompt_and_call_model, args)
-
-    for (directory, response) in responses:
-      if RELEVANT_DIRECTORIES_KEY in response:
-        for sub_dir in response[RELEVANT_DIRECTORIES_KEY]:
-          if directory:
-            directories_to_search.append(directory + "/" + sub_dir)
-          else:
-            directories_to_search.append(sub_dir)
-
-      if RELEVANT_FILES_KEY in response:
-        for file in response[RELEVANT_FILES_KEY]:
-          if directory:
-            files_to_use.append(directory + "/" + file)
-          else:
-            files_to_use.append(file)
-
-  return files_to_use
-
 # -----------  FILE SEARCH ---------------
 
 def build_file_contents_search_sys_prompt(query, file_contents):
@@ -111,68 +203,220 @@ def build_file_contents_search_sys_prompt(query, file_contents):
     query=query
   ) + "\n" + ANSWER_FORMAT_FILES
 
+def build_file_outline_search_sys_prompt(query, file_outline):
+  return FIND_CANDIDATE_FUNCTIONS.format(
+    file_outline=file_outline,
+    query=query
+  ) + "\n" + ANSWER_FORMAT_CANDIDATES
 
-def prepare_function_search_prompt_and_call_model(repo, query, file):
-  file_contents = get_file_contents(repo, file)
-  if not file_contents:
+def build_symbol_chunks_search_sys_prompt(query, symbol_chunks):
+  return FIND_MOST_RELEVANT_FUNCTIONS.format(
+    file_contents=symbol_chunks,
+    query=query
+  ) + "\n" + ANSWER_FORMAT_FILES
+
+async def async_search_large_file(query, file, file_contents, symbols):
+  """
+  Search a file over the token budget in two passes: pick candidates from an outline of
+  signatures and docstrings, then choose among the candidates' full bodies.
+  """
+  file_outline = build_file_outline(file_contents.code, symbols)
+  candidates = await async_call_model_with_policy(
+    STAGE_OUTLINE_SEARCH, build_file_outline_search_sys_prompt(query, file_outline))
+  names = candidates.get(RELEVANT_FUNCTIONS_KEY, []) + candidates.get(RELEVANT_CLASSES_KEY, [])
+  print(f"Candidate symbols in large file: {file}:", names)
+
+  candidate_symbols = find_symbols(symbols, names)
+  if not candidate_symbols:
+    return {}
+
+  symbol_chunks = build_symbol_chunks(file_contents.code, candidate_symbols)
+  return await async_call_model_with_policy(
+    STAGE_FILE_SEARCH, build_symbol_chunks_search_sys_prompt(query, symbol_chunks),
+    validate_file_answer(symbol_chunks))
+
+def build_multi_file_search_sys_prompt(query, files):
+  file_sections = "".join(
+    FILE_SECTION.format(file_name=file, file_contents=file_contents.code)
+    for file, file_contents in files
+  )
+  return FIND_MOST_RELEVANT_FUNCTIONS_MULTI_FILE.format(
+    files=file_sections,
+    query=query
+  ) + "\n" + ANSWER_FORMAT_MULTI_FILE
+
+def file_answer_problem(answer, code):
+  if not isinstance(answer, dict):
+    return "not_an_object"
+  names = answer.get(RELEVANT_FUNCTIONS_KEY, []) + answer.get(RELEVANT_CLASSES_KEY, [])
+  if not names:
+    return "empty"
+  if any(not isinstance(name, str) or name.split(".")[-1] not in code for name in names):
+    return "unknown_names"
+  return None
+
+def validate_file_answer(code):
+  # Names that do not even appear in the file text are guesses.
+  return lambda answer: file_answer_problem(answer, code)
+
+def multi_file_answer_problems(answer, files):
+  return [file_answer_problem(answer.get(file) or {}, file_contents.code) for file, file_contents in files]
+
+def validate_multi_file_answer(files):
+  # Only a batch with no usable file answer at all escalates; files with a bad answer in an
+  # otherwise usable batch are searched again on their own.
+  def validate(answer):
+    if not isinstance(answer, dict):
+      return "not_an_object"
+    problems = multi_file_answer_problems(answer, files)
+    if all(problem == "empty" for problem in problems):
+      return "empty"
+    if all(problem is not None for problem in problems):
+      return "unknown_names"
     return None
+  return validate
 
+async def async_call_model_for_file(query, file_contents):
   sys_prompt = build_file_contents_search_sys_prompt(query, file_contents)
-  response = call_model(LLAMA_70B, sys_prompt)
-  parsed_response = json.loads(response)
+  stage = STAGE_SMALL_FILE_SEARCH if estimate_tokens(file_contents.code) <= SMALL_FILE_TOKENS else STAGE_FILE_SEARCH
+  return await async_call_model_with_policy(stage, sys_prompt, validate_file_answer(file_contents.code))
+
+def make_file_batcher(query):
+  """
+  Batcher for one search: small files submitted close together share a single prompt
+  whose answer is keyed by file path, then unpacked into one response per file.
+  """
+  async def process_batch(files):
+    if len(files) == 1:
+      return [await async_call_model_for_file(query, files[0][1])]
+
+    print("Searching files in one batch:", [file for file, _ in files])
+    parsed_response = await async_call_model_with_policy(
+      STAGE_BATCH_FILE_SEARCH, build_multi_file_search_sys_prompt(query, files),
+      validate_multi_file_answer(files))
+    answers = [parsed_response.get(file) or {} for file, _ in files]
+
+    problems = multi_file_answer_problems(parsed_response, files)
+    retry = [i for i, problem in enumerate(problems) if problem not in (None, "empty")]
+    if retry:
+      print("Searching files again on their own:", [files[i][0] for i in retry])
+      retried = await asyncio.gather(
+        *(async_call_model_for_file(query, files[i][1]) for i in retry), return_exceptions=True)
+      for i, answer in zip(retry, retried):
+        if isinstance(answer, EscalationError):
+          # The batch's answer for this file was unusable too, so it has no picks.
+          answers[i] = {}
+        elif isinstance(answer, BaseException):
+          raise answer
+        else:
+          answers[i] = answer
+    return answers
+
+  return AsyncBatcher(process_batch, token_budget=BATCH_TOKEN_BUDGET, max_wait=BATCH_WAIT_SECONDS)
+
+async def async_prepare_function_search_prompt_and_call_model(repo, query, file, batcher=None):
+  if not has_extractor(file):
+    # Names picked in this file could not be resolved to line ranges, so skip the model call.
+    print(f"Skipping file without a symbol extractor: {file}")
+    return None
+
+  file_contents = await async_get_file_contents(repo, file)
+  if not file_contents:
+    return None
 
+  try:
+    parsed_response = await async_pick_names_in_file(repo, query, file, file_contents, batcher)
+  except EscalationError as e:
+    # No model gave a usable answer for this file: it has no picks, and the other files'
+    # results still stand.
+    print(f"No usable answer for file {file}: {e}")
+    parsed_response = {}
+  except Exception as e:
+    # Any other failure, such as the provider rejecting the prompt, costs only this file.
+    print(f"Error: Unable to search file {file}: {e!r}")
+    return None
+  return await asyncio.to_thread(resolve_file_recommendations, repo, file, file_contents, parsed_response)
 
-  file_recommendations = FileRecommendations(file_name=file, snippets=[])
-  if RELEVANT_FUNCTIONS_KEY in parsed_response:
-    print(f"Relevant functions found in file: {file}:", parsed_response[RELEVANT_FUNCTIONS_KEY])
-    for function_name in parsed_response[RELEVANT_FUNCTIONS_KEY]:
-      func_def = find_code_snippet_definition(file_contents.code, function_name, "function")
-      if not func_def:
-        return None
-
-      line_start, line_end, function_code = func_def
-      
-      function_def = CodeSnippetDefinition(name=function_name, 
-        line_start=line_start, line_end=line_end, code=function_code)
-      file_recommendations.snippets.append(function_def)
-
-  if RELEVANT_CLASSES_KEY in parsed_response:
-    print(f"Relevant classes found in file: {file}:", parsed_response[RELEVANT_CLASSES_KEY])
-    for class_name in parsed_response[RELEVANT_CLASSES_KEY]:
-      class_def = find_code_snippet_definition(file_contents.code, class_name, "class")
-      if not class_def:
-        return None
-
-      line_start, line_end, class_code = class_def
-      
-      class_def = CodeSnippetDefinition(name=class_name, 
-        line_start=line_start, line_end=line_end, code=class_code)
-      file_recommendations.snippets.append(class_def)
-  
-  return file_recommendations
+async def async_pick_names_in_file(repo, query, file, file_contents, batcher=None):
+  file_tokens = estimate_tokens(file_contents.code)
+  if batcher and file_tokens <= BATCH_SMALL_FILE_TOKENS:
+    return await batcher.submit((file, file_contents), file_tokens)
 
-def search_for_relevant_functions(repo, query, files_to_use):
-  recommendations = Recommendations([])
-  processor = MultiprocessingProcessor(concurrency = 10)
+  if file_tokens > FILE_TOKEN_BUDGET:
+    symbols = await asyncio.to_thread(get_file_symbols, repo, file, file_contents.code)
+    if not symbols:
+      # Too large for one prompt, and names picked in it would not resolve anyway.
+      print(f"Skipping large file without symbols: {file}")
+      return {}
+    return await async_search_large_file(query, file, file_contents, symbols)
 
-  if len(files_to_use) < 5:
-    # Serial
-    responses = []
-    for file in files_to_use:
-      responses.append(prepare_function_search_prompt_and_call_model(repo, query, file))
-  else:
-    # Parallel
-    args = [(repo, query, file) for file in files_to_use]
-    responses = processor.process(prepare_function_search_prompt_and_call_model, args)
+  return await async_call_model_for_file(query, file_contents)
 
+def resolve_file_recommendations(repo, file, file_contents, parsed_response):
+  # Names that do not resolve are skipped; the ones that do are still worth returning.
+  file_recommendations = FileRecommendations(file_name=file, snippets=[])
+  names = []
+  for key, target_type in ((RELEVANT_FUNCTIONS_KEY, "function"), (RELEVANT_CLASSES_KEY, "class")):
+    if key in parsed_response:
+      print(f"Relevant {target_type}s found in file: {file}:", parsed_response[key])
+      names += [(name, target_type) for name in parsed_response[key] if isinstance(name, str)]
+  if not names:
+    return file_recommendations
+
+  resolved_symbols = set()
+  resolved = resolve_code_snippet_definitions(repo, file, file_contents.code, names)
+  for (name, target_type), definition in zip(names, resolved):
+    if not definition:
+      print(f"Unable to resolve {target_type} {name} in {file}")
+      continue
+
+    symbol, (line_start, line_end, code) = definition
+    if symbol in resolved_symbols:
+      continue
+    resolved_symbols.add(symbol)
+    # A near-miss name is reported under the name the code actually uses.
+    exact = name in (symbol.name, symbol.qualified_name)
+    file_recommendations.snippets.append(CodeSnippetDefinition(name=name if exact else symbol.qualified_name,
+      line_start=line_start, line_end=line_end, code=code))
 
-  for file_recommendations in responses:
+  return file_recommendations
+
+async def async_search_for_relevant_functions(repo, query, files_to_use, on_event=None, deadline=None):
+  """
+  Search the given files, in order of preference. Files not finished by the deadline (a
+  time.monotonic() value) are dropped and the recommendations marked partial.
+  """
+  recommendations = Recommendations([])
+  processor = AysncIOProcessor(concurrency = SEARCH_CONCURRENCY)
+  batcher = make_file_batcher(query)
+  # Filled in as files finish, so results survive the rest being cancelled.
+  file_results = dict.fromkeys(files_to_use)
+
+  async def search_file(file):
+    file_results[file] = await async_prepare_function_search_prompt_and_call_model(repo, query, file, batcher)
+    emit_file_event(on_event, file_results[file])
+
+  args = [(file,) for file in files_to_use]
+  try:
+    await asyncio.wait_for(async_prefetch_file_contents(repo, files_to_use), remaining_seconds(deadline))
+    await asyncio.wait_for(processor.process(search_file, args), remaining_seconds(deadline))
+  except asyncio.TimeoutError:
+    print(f"Deadline reached with {sum(r is None for r in file_results.values())} files unsearched")
+    recommendations.partial = True
+  finally:
+    batcher.close()
+
+  for file_recommendations in file_results.values():
     if file_recommendations and file_recommendations.snippets:
       recommendations.files.append(file_recommendations)
 
   return recommendations
 
 def extract_github_base_url(github_url):
+    # Local repositories are only searchable when explicitly allowed (development, benchmarks).
+    if ALLOW_LOCAL_REPOS and os.path.isdir(github_url):
+        return os.path.abspath(github_url)
+
     # Parse the URL
     parsed_url = urlparse(github_url)
     
@@ -187,19 +431,216 @@ def extract_github_base_url(github_url):
     
     return base_url
 
-def run_search(repo, query):
-  base_url = extract_github_base_url(repo)
-  files_to_use = search_for_relevant_files(base_url, query)
-  print("Files to use:", files_to_use)
-  recommendations = search_for_relevant_functions(base_url, query, files_to_use)
+def join_repo_path(directory, name):
+  return directory + "/" + name if directory else name
+
+def remaining_seconds(deadline):
+  return None if deadline is None else max(0, deadline - time.monotonic())
+
+def rank_prefetch_candidates(query_terms, files):
+  """
+  Files of a directory that function search could use, those sharing a term with the query
+  first and otherwise in listing order.
+  """
+  candidates = [name for name in files if has_extractor(name)]
+  return sorted(candidates, key=lambda name: -len(query_terms.intersection(tokenize(name))))
+
+async def async_search_repo(repo, query, on_event=None, deadline=None):
+  """
+  Walk the repository as a work queue. Each directory's answer immediately schedules the
+  subdirectories it picked, and function search starts on a file as soon as it is picked,
+  so wall-clock follows the critical path instead of the sum of BFS levels.
+
+  The search is anytime: when work waits for a slot, the model's higher-ranked picks go
+  first (files before directories of the same rank), directories stop being expanded once
+  the deadline (a time.monotonic() value) is near, and at the deadline the files finished so
+  far are returned, marked partial.
+
+  on_event, if given, is called with a progress event per directory and a result event
+  per file as soon as each is known.
+  """
+  semaphore = PrioritySemaphore(SEARCH_CONCURRENCY)
+  batcher = make_file_batcher(query)
+  pending = set()
+  visited = set()
+  file_results = {}
+  prefetches = set()
+  prefetched = set()
+  query_terms = set(tokenize(query))
+  partial = False
+  expand_until = None
+  if deadline is not None:
+    expand_until = deadline - SEARCH_EXPANSION_RESERVE * max(0, deadline - time.monotonic())
+
+  def schedule(coro):
+    pending.add(asyncio.ensure_future(coro))
+
+  def prefetch(directory, folder_contents):
+    # Read the files the model is likely to pick while it is still deciding, so function
+    # search finds them loaded. Speculative reads never hold up or fail the search.
+    budget = min(PREFETCH_FILES_PER_DIRECTORY, PREFETCH_MAX_FILES - len(prefetched))
+    for name in rank_prefetch_candidates(query_terms, folder_contents.files)[:max(budget, 0)]:
+      path = join_repo_path(directory, name)
+      prefetched.add(path)
+      task = asyncio.ensure_future(async_speculative_read(repo, path, PREFETCH_MAX_FILE_BYTES))
+      prefetches.add(task)
+      task.add_done_callback(finish_prefetch)
+
+  def finish_prefetch(task):
+    prefetches.discard(task)
+    if not task.cancelled() and task.exception():
+      print(f"Prefetch failed: {task.exception()}")
+
+  def claim(path):
+    if path in visited or len(visited) >= SEARCH_MAX_NODES:
+      return False
+    visited.add(path)
+    return True
+
+  async def visit_directory(directory, depth, priority=()):
+    nonlocal partial
+    print("Searching directory:", directory)
+    if on_event:
+      on_event({"type": "directory", "path": directory or ""})
+    with span("directory", path=directory or "", depth=depth):
+      async with semaphore.slot(priority):
+        _, response = await async_prepare_prompt_and_call_model(repo, query, directory, prefetch)
+
+      # Scheduled inside the span so the trace shows which directory led where.
+      sub_dirs = response.get(RELEVANT_DIRECTORIES_KEY, [])
+      if sub_dirs and expand_until is not None and time.monotonic() >= expand_until:
+        print(f"Not expanding {len(sub_dirs)} directories under {directory}: deadline is near")
+        partial = True
+      elif depth < SEARCH_MAX_DEPTH:
+        for rank, sub_dir in enumerate(sub_dirs):
+          path = join_repo_path(directory, sub_dir)
+          if claim(path):
+            schedule(visit_directory(path, depth + 1, (rank, 1, depth + 1)))
+
+      for rank, file in enumerate(response.get(RELEVANT_FILES_KEY, [])):
+        path = join_repo_path(directory, file)
+        if claim(path):
+          # Reserve the slot now so results keep discovery order.
+          file_results[path] = None
+          schedule(visit_file(path, (rank, 0, depth + 1)))
+
+  async def visit_file(file, priority):
+    with span("file", path=file):
+      async with semaphore.slot(priority):
+        file_results[file] = await async_prepare_function_search_prompt_and_call_model(repo, query, file, batcher)
+    emit_file_event(on_event, file_results[file])
+
+  claim(None)
+  schedule(visit_directory(None, 0))
+  try:
+    while pending:
+      timeout = remaining_seconds(deadline)
+      if timeout == 0:
+        print(f"Deadline reached with {len(pending)} directories and files unfinished")
+        partial = True
+        break
+      done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+      for task in done:
+        pending.discard(task)
+        task.result()
+  finally:
+    for task in pending | prefetches:
+      task.cancel()
+    batcher.close()
+
+  print("Files searched:", list(file_results))
+  recommendations = Recommendations([], partial=partial)
+  for file_recommendations in file_results.values():
+    if file_recommendations and file_recommendations.snippets:
+      recommendations.files.append(file_recommendations)
   return recommendations
 
-if __name__ == "__main__":
-  files_to_use = search_for_relevant_files(REPO, QUERY)
-  print("Files to use:", files_to_use)
+async def async_search_lexical(repo, query, on_event=None, deadline=None):
+  """
+  Skip the tree walk: rank files with the local BM25 index and send only the top
+  candidates to the function-level model step.
+  """
+  snapshot = await asyncio.to_thread(get_snapshot, repo)
+  if not snapshot:
+    print("Lexical search needs a repository snapshot, falling back to BFS")
+    return await async_search_repo(repo, query, on_event, deadline)
+
+  index = await asyncio.to_thread(get_lexical_index, snapshot)
+  candidates = index.search(query)
+  print("Lexical candidates:", candidates)
+  return await async_search_for_relevant_functions(repo, query, [path for path, _ in candidates], on_event, deadline)
+
+SEARCH_STRATEGIES = {
+  SEARCH_MODE_BFS: async_search_repo,
+  SEARCH_MODE_LEXICAL: async_search_lexical,
+}
+
+def normalize_query(query):
+  return " ".join(query.lower().split())
+
+def search_cache_key(base_url, sha, query, mode=SEARCH_MODE_BFS):
+  return (base_url.rstrip("/").lower(), sha, normalize_query(query), mode)
+
+async def async_run_search(repo, query, mode=SEARCH_MODE_BFS, on_event=None, deadline=None):
+  """
+  Search a repository within a time budget of deadline seconds (at most, and by default,
+  SEARCH_TIMEOUT_SECONDS). A search that runs out of time returns its best results so far
+  with partial set.
+  """
+  if mode not in SEARCH_STRATEGIES:
+    raise ValueError(f"Unknown search mode: {mode}")
+  with span("search", mode=mode) as attributes:
+    recommendations, attributes["source"] = await _async_run_search(repo, query, mode, on_event, deadline)
+    attributes["partial"] = recommendations.partial
+    SEARCHES.inc(mode=mode, source=attributes["source"])
+    return recommendations
+
+async def _async_run_search(repo, query, mode, on_event, deadline):
+  """
+  Return the recommendations and whether they came from the cache, another request's
+  identical search, or a search of our own.
+  """
+  strategy = SEARCH_STRATEGIES[mode]
+  budget = SEARCH_TIMEOUT_SECONDS if deadline is None else min(deadline, SEARCH_TIMEOUT_SECONDS)
+  search_deadline = time.monotonic() + budget
+
+  base_url = extract_github_base_url(repo)
+  sha = await asyncio.to_thread(resolve_repo_commit, base_url)
+  if not sha:
+    # Without a commit the result could go stale silently, so don't cache it.
+    return await strategy(base_url, query, on_event, search_deadline), "search"
+
+  key = search_cache_key(base_url, sha, query, mode)
+  cached = search_result_cache.get(key)
+  if cached is not None:
+    print("Search result cache hit:", key)
+    for file_recommendations in cached.files:
+      emit_file_event(on_event, file_recommendations)
+    return cached, "cache"
+
+  searched = []
+  async def search_and_cache():
+    searched.append(True)
+    recommendations = await strategy(base_url, query, on_event, search_deadline)
+    if not recommendations.partial:
+      search_result_cache.set(key, recommendations)
+    return recommendations
+
+  if on_event or deadline is not None:
+    # A streaming caller needs its own events, and a caller with its own deadline its own
+    # budget, so neither can join another request's search.
+    return await search_and_cache(), "search"
+  recommendations = await search_flights.do(key, search_and_cache)
+  return recommendations, "search" if searched else "shared"
+
+def run_search(repo, query, mode=SEARCH_MODE_BFS, trace=None, deadline=None):
+  # All searches share one event loop, so concurrent requests need no pools of their own.
+  coro = async_run_search(repo, query, mode, deadline=deadline)
+  return background_loop.run(traced(trace, coro) if trace else coro)
 
-  recommendations = search_for_relevant_functions(REPO, QUERY, files_to_use)
-  display_recommendations(recommendations)
+if __name__ == "__main__":
+  recommendations = run_search(REPO, QUERY)
+  print(recommendations)
 
 def find_code_snippet_in_recommendations(recommendations, current_file, current_line):
   for file_recommendations in recommendations.files:
@@ -208,9 +649,7 @@ def find_code_snippet_in_recommendations(recommendations, current_file, current_
         if function_def.line_start <= current_line <= function_def.line_end:
           return function_def
 
-def build_explanation_sys_prompt(query, recommendations, current_file, current_line):
-  function_def = find_code_snippet_in_recommendations(recommendations, current_file, current_line)
-  
+def build_explanation_sys_prompt(query, function_def, current_line):
   code = function_def.code
   line_num = current_line - function_def.line_start
   line_str = code.split('\n')[line_num]
@@ -239,12 +678,43 @@ def current_context_json_to_recommendations(current_context):
     recommendations.files.append(file_recommendations)
   return recommendations
 
-def find_explanation(query, current_context, current_file, current_line):
-  recommendations = current_context_json_to_recommendations(current_context) 
-
-  sys_prompt = build_explanation_sys_prompt(query, recommendations, current_file, current_line)
-  response = call_model(LLAMA_70B, sys_prompt)
-  if len(response) > 0:
-    return response
+def explanation_cache_key(query, function_def, current_line):
+  # The line is relative to the snippet, so the same code returned by another search (or
+  # found at other line numbers in a later commit) shares its explanations.
+  code_hash = hashlib.sha256(function_def.code.encode("utf-8")).hexdigest()
+  return (code_hash, current_line - function_def.line_start, normalize_query(query))
+
+def explain_snippet(query, function_def, current_line):
+  key = explanation_cache_key(query, function_def, current_line)
+  cached = explanation_cache.get(key)
+  if cached is not None:
+    EXPLANATIONS.inc(source="cache")
+    return cached
+
+  sys_prompt = build_explanation_sys_prompt(query, function_def, current_line)
+  try:
+    explanation = call_model_with_policy(STAGE_EXPLANATION, sys_prompt, parse_json=False)
+  except EscalationError:
+    return "I'm not sure. Please try again."
+  explanation_cache.set(key, explanation)
+  EXPLANATIONS.inc(source="model")
+  return explanation
 
-  return "I'm not sure. Please try again."
+def find_explanation(query, current_context, current_file, current_line):
+  """
+  Explain a line using snippets sent by the client. Returns None if no snippet covers it.
+  """
+  recommendations = current_context_json_to_recommendations(current_context)
+  function_def = find_code_snippet_in_recommendations(recommendations, current_file, current_line)
+  if function_def is None:
+    return None
+  return explain_snippet(query, function_def, current_line)
+
+def find_session_explanation(query, session, current_file, current_line):
+  """
+  Explain a line using the snippets of a stored search. Returns None if no snippet covers it.
+  """
+  function_def = session.find_snippet(current_file, current_line)
+  if function_def is None:
+    return None
+  return explain_snippet(query, function_def, current_line)
@@ -0,0 +1,78 @@
+"""
+Server-side search sessions.
+
+A finished search is kept under a random ID together with an interval index of its snippets
+per file, so a follow-up question about one line (/comment) sends the ID, the file and the
+line instead of the code of every snippet the search returned.
+"""
+import bisect
+import itertools
+import os
+import secrets
+
+from retrieval.cache import LRUCache
+
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1024"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", str(24 * 3600)))
+
+session_cache = LRUCache(max_entries=SESSION_CACHE_SIZE, ttl=SESSION_TTL)
+
+
+class SnippetIndex:
+  """
+  The snippets of one file sorted by first line, with the furthest last line seen so far,
+  so the snippets covering a line are found by bisection rather than a scan of the file's
+  results.
+  """
+  def __init__(self, snippets):
+    self.snippets = sorted(snippets, key=lambda snippet: (snippet.line_start, -snippet.line_end))
+    self.starts = [snippet.line_start for snippet in self.snippets]
+    self.max_ends = list(itertools.accumulate((snippet.line_end for snippet in self.snippets), max))
+
+  def find(self, line):
+    """
+    Return the innermost snippet covering a line (a method rather than its class), or None.
+    """
+    found = None
+    i = bisect.bisect_right(self.starts, line) - 1
+    # Every snippet before i ends before the line once the running maximum does.
+    while i >= 0 and self.max_ends[i] >= line:
+      snippet = self.snippets[i]
+      if snippet.line_end >= line and (found is None or snippet.line_end - snippet.line_start < found.line_end - found.line_start):
+        found = snippet
+      i -= 1
+    return found
+
+
+class SearchSession:
+  def __init__(self, session_id, repo, query, recommendations):
+    self.session_id = session_id
+    self.repo = repo
+    self.query = query
+    # File path -> SnippetIndex
+    self.files = {
+      file_recommendations.file_name: SnippetIndex(file_recommendations.snippets)
+      for file_recommendations in recommendations.files
+    }
+
+  def find_snippet(self, file, line):
+    index = self.files.get(file)
+    return index.find(line) if index else None
+
+
+def create_session(repo, query, recommendations):
+  """
+  Store the results of a search and return the ID follow-up requests refer to them by.
+  """
+  session_id = secrets.token_urlsafe(16)
+  session_cache.set(session_id, SearchSession(session_id, repo, query, recommendations))
+  return session_id
+
+
+def get_session(session_id):
+  """
+  Return a stored search, or None if the ID is unknown or has expired.
+  """
+  if not isinstance(session_id, str):
+    return None
+  return session_cache.get(session_id)
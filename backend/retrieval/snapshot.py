@@ -0,0 +1,475 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from urllib.parse import urlparse
+
+from dotenv import load_dotenv
+
+from retrieval.http_client import DEFAULT_GITHUB_API_URL, GITHUB_API_URL, GITHUB_TOKEN, HTTP_TIMEOUT, github_get
+from retrieval.metrics import Counter, span
+
+load_dotenv()
+
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".data"))
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(DATA_DIR, "snapshots"))
+# Directory holding bare mirrors laid out as <owner>/<repo>.git, checked before GitHub.
+GIT_MIRROR_DIR = os.getenv("GIT_MIRROR_DIR")
+# How long a resolved HEAD commit is trusted before asking the remote again.
+SNAPSHOT_REF_TTL = float(os.getenv("SNAPSHOT_REF_TTL", "300"))
+# The same for the fingerprint of a plain directory, which walks the whole tree. Short, so
+# local edits still show up in the next search.
+SNAPSHOT_DIR_TTL = float(os.getenv("SNAPSHOT_DIR_TTL", "5"))
+SNAPSHOTS_ENABLED = os.getenv("REPO_SNAPSHOTS", "1") != "0"
+# A new commit of a GitHub repository with an earlier snapshot fetches only its changed files,
+# up to this many; larger changes download the whole archive. Each file is one API request, so
+# the default stays near the cost of one archive download and well inside the 60 requests an
+# hour GitHub allows without a token.
+SNAPSHOT_INCREMENTAL_MAX_FILES = int(os.getenv("SNAPSHOT_INCREMENTAL_MAX_FILES", "50" if GITHUB_TOKEN else "10"))
+
+IGNORED_NAMES = {".git"}
+
+
+@dataclass
+class RepoSnapshot:
+  owner: str
+  repo: str
+  sha: str
+  root: str
+
+
+@dataclass
+class RepoSource:
+  owner: str
+  repo: str
+  # One of "github", "git" (local repository or mirror) or "dir" (plain directory).
+  kind: str
+  location: str
+
+
+# (owner, repo), or ("dir", path) for plain directories -> (sha, resolved_at)
+_resolved_refs = {}
+_locks = {}
+_locks_guard = threading.Lock()
+GITHUB_REQUESTS = Counter("github_requests_total", "Requests sent to GitHub, by kind (ls_remote, commits_api, tarball, contents_api, trees_api, blobs_api).", ["kind"])
+
+
+def lock_for(key):
+  with _locks_guard:
+    if key not in _locks:
+      _locks[key] = threading.Lock()
+    return _locks[key]
+
+
+def count_github_fetch(kind):
+  GITHUB_REQUESTS.inc(kind=kind)
+
+
+def github_fetches():
+  return {kind: count for (kind,), count in GITHUB_REQUESTS.samples().items()}
+
+
+def git_blob_sha(data):
+  """
+  The SHA git gives a file with these contents, as listed by the Git Trees API.
+  """
+  return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def _run_git(args, cwd=None, timeout=None):
+  result = subprocess.run(["git", *args], cwd=cwd, capture_output=True, check=True, timeout=timeout)
+  return result.stdout
+
+
+def _is_git_toplevel(path):
+  try:
+    toplevel = _run_git(["rev-parse", "--show-toplevel"], cwd=path).decode().strip()
+  except (OSError, subprocess.CalledProcessError):
+    return False
+  return os.path.realpath(toplevel) == os.path.realpath(path)
+
+
+def parse_repo_source(repo_url):
+  if repo_url.startswith("file://"):
+    repo_url = urlparse(repo_url).path
+
+  if os.path.isdir(repo_url):
+    path = os.path.abspath(repo_url)
+    owner = os.path.basename(os.path.dirname(path)) or "local"
+    repo = os.path.basename(path)
+    kind = "git" if _is_git_toplevel(path) else "dir"
+    return RepoSource(owner=owner, repo=repo, kind=kind, location=path)
+
+  parts = repo_url.rstrip('/').split('/')
+  owner, repo = parts[-2], parts[-1]
+  if repo.endswith(".git"):
+    repo = repo[:-len(".git")]
+
+  if GIT_MIRROR_DIR:
+    mirror = os.path.join(GIT_MIRROR_DIR, owner, f"{repo}.git")
+    if os.path.isdir(mirror):
+      return RepoSource(owner=owner, repo=repo, kind="git", location=mirror)
+
+  return RepoSource(owner=owner, repo=repo, kind="github", location=f"https://github.com/{owner}/{repo}")
+
+
+def _directory_fingerprint(path):
+  # Plain directories have no commit, so key them on their file listing instead.
+  digest = hashlib.sha1()
+  for dirpath, dirnames, filenames in os.walk(path):
+    dirnames[:] = sorted(d for d in dirnames if d not in IGNORED_NAMES)
+    for filename in sorted(filenames):
+      full_path = os.path.join(dirpath, filename)
+      stat = os.stat(full_path)
+      digest.update(f"{os.path.relpath(full_path, path)}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+  return digest.hexdigest()
+
+
+def _resolve_github_sha(source):
+  # ls-remote talks to github.com, which is the wrong server behind a custom API URL.
+  if GITHUB_API_URL == DEFAULT_GITHUB_API_URL:
+    count_github_fetch("ls_remote")
+    try:
+      output = _run_git(["ls-remote", source.location, "HEAD"], timeout=HTTP_TIMEOUT).decode().split()
+      if output:
+        return output[0]
+    except (OSError, subprocess.SubprocessError):
+      pass
+
+  count_github_fetch("commits_api")
+  response = github_get(
+    f"{GITHUB_API_URL}/repos/{source.owner}/{source.repo}/commits/HEAD",
+    headers={"Accept": "application/vnd.github.sha"},
+  )
+  if response is None:
+    return None
+
+  if response.status_code == 200:
+    return response.text.strip()
+
+  print(f"Error: Unable to resolve HEAD for {source.owner}/{source.repo}. Status code: {response.status_code}")
+  return None
+
+
+def resolve_commit_sha(source):
+  if source.kind == "dir":
+    key, ttl = (source.kind, source.location), SNAPSHOT_DIR_TTL
+  else:
+    key, ttl = (source.owner, source.repo), SNAPSHOT_REF_TTL
+  cached = _resolved_refs.get(key)
+  if cached and time.time() - cached[1] < ttl:
+    return cached[0]
+
+  if source.kind == "dir":
+    sha = _directory_fingerprint(source.location)
+  elif source.kind == "git":
+    sha = _run_git(["rev-parse", "HEAD"], cwd=source.location).decode().strip()
+  else:
+    sha = _resolve_github_sha(source)
+
+  if sha:
+    _resolved_refs[key] = (sha, time.time())
+  return sha
+
+
+def resolve_repo_commit(repo_url):
+  return resolve_commit_sha(parse_repo_source(repo_url))
+
+
+def _skip_unsafe_members(member, dest_path):
+  try:
+    return tarfile.data_filter(member, dest_path)
+  except tarfile.FilterError:
+    return None
+
+
+def _extract_tar(fileobj, dest, strip_top_level):
+  with tarfile.open(fileobj=fileobj, mode="r|*") as tar:
+    for member in tar:
+      if strip_top_level:
+        name = member.name.split("/", 1)
+        if len(name) < 2 or not name[1]:
+          continue
+        member.name = name[1]
+      tar.extract(member, dest, filter=_skip_unsafe_members)
+
+
+def _join_inside(root, path):
+  full_path = os.path.normpath(os.path.join(root, path.strip("/")))
+  if full_path != root and not full_path.startswith(root + os.sep):
+    return None
+  return full_path
+
+
+def _iter_files(root, suffixes=None):
+  for dirpath, dirnames, filenames in os.walk(root):
+    dirnames[:] = sorted(d for d in dirnames if d not in IGNORED_NAMES)
+    for filename in sorted(filenames):
+      if suffixes is None or filename.endswith(tuple(suffixes)):
+        full_path = os.path.join(dirpath, filename)
+        yield os.path.relpath(full_path, root).replace(os.sep, "/"), full_path
+
+
+def _hash_files(root):
+  manifest = {}
+  for path, full_path in _iter_files(root):
+    if os.path.islink(full_path):
+      # git stores a symlink as a blob holding its target.
+      manifest[path] = git_blob_sha(os.fsencode(os.readlink(full_path)))
+      continue
+    with open(full_path, "rb") as f:
+      manifest[path] = git_blob_sha(f.read())
+  return manifest
+
+
+def _git_manifest(location, sha):
+  manifest = {}
+  for entry in _run_git(["ls-tree", "-r", "-z", sha], cwd=location).split(b"\0"):
+    info, _, path = entry.partition(b"\t")
+    if not path:
+      continue
+    _, kind, blob_sha = info.decode().split()
+    if kind == "blob":
+      manifest[os.fsdecode(path)] = blob_sha
+  return manifest
+
+
+def _manifest_path(owner, repo, sha):
+  return os.path.join(SNAPSHOT_DIR, owner, repo, f"{sha}.manifest.json")
+
+
+def _write_manifest(path, manifest):
+  tmp_path = f"{path}.{os.getpid()}.tmp"
+  with open(tmp_path, "w") as f:
+    json.dump(manifest, f, separators=(",", ":"))
+  os.replace(tmp_path, path)
+
+
+def snapshot_manifest(snapshot):
+  """
+  Return {path: blob SHA} for every file in the snapshot, which is what incremental
+  fetching and indexing diff against.
+  """
+  path = _manifest_path(snapshot.owner, snapshot.repo, snapshot.sha)
+  try:
+    with open(path) as f:
+      return json.load(f)
+  except (OSError, ValueError):
+    pass
+  # Snapshots fetched before manifests were recorded.
+  manifest = _hash_files(snapshot.root)
+  _write_manifest(path, manifest)
+  return manifest
+
+
+def latest_snapshot(owner, repo, exclude_sha=None):
+  """
+  The most recently fetched snapshot of the repository other than exclude_sha, if any.
+  """
+  repo_dir = os.path.join(SNAPSHOT_DIR, owner, repo)
+  try:
+    names = os.listdir(repo_dir)
+  except OSError:
+    return None
+
+  candidates = []
+  for name in names:
+    sha = name[:-len(".manifest.json")]
+    if name.endswith(".manifest.json") and sha != exclude_sha and os.path.isdir(os.path.join(repo_dir, sha)):
+      candidates.append((os.path.getmtime(os.path.join(repo_dir, name)), sha))
+  if not candidates:
+    return None
+  sha = max(candidates)[1]
+  return RepoSnapshot(owner=owner, repo=repo, sha=sha, root=os.path.join(repo_dir, sha))
+
+
+def _link_or_copy(source_path, dest_path):
+  # Snapshots are never modified, so unchanged files can share storage with the old one.
+  try:
+    os.link(source_path, dest_path, follow_symlinks=False)
+  except OSError:
+    shutil.copy2(source_path, dest_path, follow_symlinks=False)
+
+
+def _fetch_github_changes(source, sha, dest):
+  """
+  Build the snapshot from the latest earlier one, downloading only blobs that changed.
+  Return the new manifest, or None if the whole archive should be downloaded instead.
+  """
+  from retrieval.multi_processor_utils import background_loop
+  from retrieval.repo_tree import REPO_TREES_ENABLED, fetch_repo_tree, fetch_blobs
+
+  previous = latest_snapshot(source.owner, source.repo, exclude_sha=sha)
+  if not REPO_TREES_ENABLED or previous is None:
+    return None
+  previous_manifest = snapshot_manifest(previous)
+  tree = fetch_repo_tree(source.owner, source.repo, sha)
+  if tree is None:
+    return None
+
+  reused, changed = [], []
+  for path, blob_sha in tree.blobs.items():
+    previous_path = _join_inside(previous.root, path)
+    if previous_manifest.get(path) == blob_sha and previous_path and os.path.lexists(previous_path):
+      reused.append((path, previous_path))
+    else:
+      changed.append(path)
+  if len(changed) > SNAPSHOT_INCREMENTAL_MAX_FILES:
+    return None
+
+  changed = [path for path in changed if _join_inside(dest, path)]
+  # Everything is downloaded before dest is touched: the archive fallback must not extract
+  # over files hard-linked from the previous snapshot.
+  contents = background_loop.run(fetch_blobs(tree, changed))
+  if len(contents) < len(changed):
+    print(f"Unable to download {len(changed) - len(contents)} changed files of "
+          f"{source.owner}/{source.repo}@{sha[:12]}, downloading the archive instead")
+    return None
+
+  for directory in tree.directories:
+    dest_directory = _join_inside(dest, directory)
+    if dest_directory:
+      os.makedirs(dest_directory, exist_ok=True)
+  for path, previous_path in reused:
+    _link_or_copy(previous_path, _join_inside(dest, path))
+  for path, data in contents.items():
+    with open(_join_inside(dest, path), "wb") as f:
+      f.write(data)
+
+  print(f"Fetched {len(changed)} changed files of {source.owner}/{source.repo}@{sha[:12]} "
+        f"on top of {previous.sha[:12]}")
+  return dict(tree.blobs)
+
+
+def _fetch_into(source, sha, dest):
+  """
+  Fill dest with the repository at sha. Returns the snapshot's manifest when it comes for
+  free with the fetch, otherwise None.
+  """
+  if source.kind == "dir":
+    shutil.copytree(source.location, dest, dirs_exist_ok=True,
+                    ignore=shutil.ignore_patterns(*IGNORED_NAMES))
+  elif source.kind == "git":
+    archive = _run_git(["archive", "--format=tar", sha], cwd=source.location)
+    _extract_tar(io.BytesIO(archive), dest, strip_top_level=False)
+    return _git_manifest(source.location, sha)
+  else:
+    manifest = _fetch_github_changes(source, sha, dest)
+    if manifest is not None:
+      return manifest
+    count_github_fetch("tarball")
+    url = f"https://codeload.github.com/{source.owner}/{source.repo}/tar.gz/{sha}"
+    if GITHUB_API_URL != DEFAULT_GITHUB_API_URL:
+      url = f"{GITHUB_API_URL}/repos/{source.owner}/{source.repo}/tarball/{sha}"
+    response = github_get(url, stream=True)
+    if response is None:
+      raise OSError(f"Unable to download {url}")
+    with response:
+      response.raise_for_status()
+      response.raw.decode_content = True
+      _extract_tar(response.raw, dest, strip_top_level=True)
+  return None
+
+
+def get_snapshot(repo_url):
+  """
+  Return a local snapshot of the repository at its current HEAD, fetching it once if needed.
+  """
+  if not SNAPSHOTS_ENABLED:
+    return None
+
+  source = parse_repo_source(repo_url)
+  with span("resolve_commit", kind=source.kind):
+    sha = resolve_commit_sha(source)
+  if not sha:
+    return None
+
+  root = os.path.join(SNAPSHOT_DIR, source.owner, source.repo, sha)
+  snapshot = RepoSnapshot(owner=source.owner, repo=source.repo, sha=sha, root=root)
+  if os.path.isdir(root):
+    return snapshot
+
+  with lock_for((source.owner, source.repo, sha)):
+    if os.path.isdir(root):
+      return snapshot
+
+    parent = os.path.dirname(root)
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=f".{sha}-", dir=parent)
+    try:
+      print(f"Fetching snapshot of {source.owner}/{source.repo}@{sha[:12]}")
+      with span("snapshot_fetch", repo=f"{source.owner}/{source.repo}", kind=source.kind):
+        manifest = _fetch_into(source, sha, tmp_dir)
+        if manifest is None:
+          manifest = _hash_files(tmp_dir)
+      # Written first, so every visible snapshot has a manifest.
+      _write_manifest(_manifest_path(source.owner, source.repo, sha), manifest)
+      try:
+        os.rename(tmp_dir, root)
+      except OSError:
+        # Another process finished the same snapshot first.
+        if not os.path.isdir(root):
+          raise
+    except Exception as e:
+      print(f"Error: Unable to fetch snapshot of {source.owner}/{source.repo}: {e}")
+      return None
+    finally:
+      if os.path.isdir(tmp_dir):
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+  return snapshot
+
+
+def snapshot_path(snapshot, path=None):
+  """
+  Map a repository-relative path onto the snapshot, refusing paths that escape it.
+  """
+  if not path:
+    return snapshot.root
+  return _join_inside(snapshot.root, path)
+
+
+def list_snapshot_directory(snapshot, path=None):
+  """
+  Return (directories, files) for a path in the snapshot, or None if it does not exist.
+  """
+  full_path = snapshot_path(snapshot, path)
+  if full_path is None or not os.path.exists(full_path):
+    return None
+
+  if not os.path.isdir(full_path):
+    return [], [os.path.basename(full_path)]
+
+  directories, files = [], []
+  with os.scandir(full_path) as entries:
+    for entry in sorted(entries, key=lambda e: e.name):
+      if entry.name in IGNORED_NAMES:
+        continue
+      if entry.is_dir(follow_symlinks=False):
+        directories.append(entry.name)
+      else:
+        files.append(entry.name)
+  return directories, files
+
+
+def iter_snapshot_files(snapshot, suffixes=None):
+  """
+  Yield (repository path, absolute path) for every file in the snapshot, optionally
+  restricted to the given filename suffixes.
+  """
+  yield from _iter_files(snapshot.root, suffixes)
+
+
+def read_snapshot_file(snapshot, path):
+  full_path = snapshot_path(snapshot, path)
+  if full_path is None or not os.path.isfile(full_path):
+    return None
+  with open(full_path, "rb") as f:
+    return f.read()
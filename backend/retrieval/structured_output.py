@@ -0,0 +1,140 @@
+"""
+Structured (JSON) answers from the model.
+
+Stages that expect JSON ask the provider for it: with MODEL_RESPONSE_FORMAT=schema (the
+default) decoding is constrained to the stage's JSON schema, with json to any JSON object,
+and off sends no response_format at all. Whatever comes back is parsed tolerantly (code
+fences and prose around the object are skipped) and checked against the schema locally, and
+an answer that still fails is sent, without the original prompt, to REPAIR_MODEL to be
+rewritten rather than asking a larger model the whole question again.
+"""
+import json
+import os
+import re
+
+from retrieval.prompts import (
+  RELEVANT_FILES_KEY,
+  RELEVANT_DIRECTORIES_KEY,
+  RELEVANT_FUNCTIONS_KEY,
+  RELEVANT_CLASSES_KEY,
+)
+
+RESPONSE_FORMAT_SCHEMA = "schema"
+RESPONSE_FORMAT_JSON = "json"
+RESPONSE_FORMAT_OFF = "off"
+MODEL_RESPONSE_FORMAT = os.getenv("MODEL_RESPONSE_FORMAT", RESPONSE_FORMAT_SCHEMA)
+# Answers longer than this are not worth repairing; the stage escalates instead.
+REPAIR_MAX_CHARS = int(os.getenv("REPAIR_MAX_CHARS", "4000"))
+
+STRING_LIST_SCHEMA = {"type": "array", "items": {"type": "string"}}
+
+DIRECTORY_ANSWER_SCHEMA = {
+  "type": "object",
+  "properties": {
+    RELEVANT_DIRECTORIES_KEY: STRING_LIST_SCHEMA,
+    RELEVANT_FILES_KEY: STRING_LIST_SCHEMA,
+  },
+}
+
+FILE_ANSWER_SCHEMA = {
+  "type": "object",
+  "properties": {
+    RELEVANT_FUNCTIONS_KEY: STRING_LIST_SCHEMA,
+    RELEVANT_CLASSES_KEY: STRING_LIST_SCHEMA,
+  },
+}
+
+# Keyed by file path, which the schema cannot list in advance.
+MULTI_FILE_ANSWER_SCHEMA = {
+  "type": "object",
+  "additionalProperties": FILE_ANSWER_SCHEMA,
+}
+
+REPAIR_PROMPT = """
+The text below was meant to be a single JSON object matching this JSON schema, but it is not valid:
+
+{schema}
+
+<<<< TEXT >>>>
+{text}
+<<<< END TEXT >>>>
+
+Rewrite it as that JSON object, keeping every value it contains. Only return the json object and nothing else.
+"""
+
+_FENCE_RE = re.compile(r"```(?:json)?\s*(.*?)```", re.S | re.I)
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_decoder = json.JSONDecoder()
+
+
+def response_format(schema):
+  """
+  The response_format to send with a request for JSON matching schema, or None.
+  """
+  if schema is None or MODEL_RESPONSE_FORMAT == RESPONSE_FORMAT_OFF:
+    return None
+  if MODEL_RESPONSE_FORMAT == RESPONSE_FORMAT_JSON:
+    return {"type": "json_object"}
+  return {"type": "json_object", "schema": schema}
+
+
+def _decode_first_object(text):
+  start = text.find("{")
+  while start != -1:
+    try:
+      value, _ = _decoder.raw_decode(text, start)
+      return value
+    except ValueError:
+      start = text.find("{", start + 1)
+  return None
+
+
+def extract_json(text):
+  """
+  Parse the JSON object in a model answer. Returns (value, exact): exact is False when the
+  object had to be dug out of fences or prose, or had trailing commas removed. value is
+  None if no object could be found.
+  """
+  try:
+    return json.loads(text), True
+  except ValueError:
+    pass
+  candidates = _FENCE_RE.findall(text) + [text]
+  for candidate in candidates:
+    for attempt in (candidate, _TRAILING_COMMA_RE.sub(r"\1", candidate)):
+      value = _decode_first_object(attempt)
+      if value is not None:
+        return value, False
+  return None, False
+
+
+def schema_problem(value, schema, path="$"):
+  """
+  Check a value against the subset of JSON schema used here (type, properties,
+  additionalProperties and items). Returns a description of the first mismatch, or None.
+  """
+  expected = schema.get("type")
+  if expected == "object":
+    if not isinstance(value, dict):
+      return f"{path} is not an object"
+    properties = schema.get("properties", {})
+    for key, item in value.items():
+      item_schema = properties.get(key, schema.get("additionalProperties"))
+      if isinstance(item_schema, dict):
+        problem = schema_problem(item, item_schema, f"{path}.{key}")
+        if problem:
+          return problem
+  elif expected == "array":
+    if not isinstance(value, list):
+      return f"{path} is not an array"
+    for i, item in enumerate(value):
+      problem = schema_problem(item, schema.get("items", {}), f"{path}[{i}]")
+      if problem:
+        return problem
+  elif expected == "string" and not isinstance(value, str):
+    return f"{path} is not a string"
+  return None
+
+
+def build_repair_prompt(text, schema):
+  return REPAIR_PROMPT.format(schema=json.dumps(schema), text=text)
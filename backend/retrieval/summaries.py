@@ -0,0 +1,197 @@
+"""
+Query-independent one-line summaries of every file and directory in a snapshot.
+
+Files are described by their module docstring or the top-level names they define, and
+directories bottom-up by the most distinctive terms of everything below them (or their
+package docstring). Summaries are built once per commit from the symbol index, without
+reading any files, and shown next to each name in the directory triage prompt.
+"""
+import json
+import math
+import os
+import threading
+from collections import Counter, OrderedDict
+
+from retrieval.lexical_index import tokenize
+from retrieval.metrics import span
+from retrieval.snapshot import lock_for, snapshot_manifest
+from retrieval.symbol_index import INDEX_DIR, get_symbol_index
+
+SUMMARIES_ENABLED = os.getenv("DIRECTORY_SUMMARIES", "1") != "0"
+SUMMARY_MAX_LENGTH = int(os.getenv("SUMMARY_MAX_LENGTH", "100"))
+SUMMARY_FORMAT_VERSION = 1
+# Terms listed for a directory without a package docstring.
+DIRECTORY_SUMMARY_TERMS = 6
+# Names listed for a file without a module docstring.
+FILE_SUMMARY_NAMES = 6
+CONSTRUCTOR_NAMES = {"constructor", "__init__", "New"}
+PACKAGE_FILES = ("__init__.py",)
+GENERIC_FILE_NAMES = {"init", "main", "index", "mod", "lib"}
+MAX_LOADED_SUMMARIES = int(os.getenv("MAX_LOADED_SUMMARIES", "8"))
+
+_loaded_summaries = OrderedDict()
+_summaries_lock = threading.Lock()
+
+
+class RepoSummaries:
+  def __init__(self, sha, summaries):
+    self.sha = sha
+    # Repository path of a file or directory ("" for the root) -> summary
+    self.summaries = summaries
+
+  def get(self, path):
+    return self.summaries.get(path or "")
+
+  def to_json(self):
+    return {"version": SUMMARY_FORMAT_VERSION, "sha": self.sha, "summaries": self.summaries}
+
+
+def _truncate(text):
+  if len(text) <= SUMMARY_MAX_LENGTH:
+    return text
+  return text[:SUMMARY_MAX_LENGTH - 3].rstrip() + "..."
+
+
+def summarize_file(symbols, module_doc):
+  if module_doc:
+    return _truncate(module_doc)
+  # Top-level names first, then class members, which are often what a query is about.
+  named = [symbol for symbol in symbols if symbol.name not in CONSTRUCTOR_NAMES and not symbol.name.startswith("__")]
+  names = [symbol.name for symbol in named if not symbol.parent]
+  names += [symbol.name for symbol in named if symbol.parent and symbol.name not in names]
+  if not names:
+    return ""
+  more = ", ..." if len(names) > FILE_SUMMARY_NAMES else ""
+  return _truncate("defines " + ", ".join(names[:FILE_SUMMARY_NAMES]) + more)
+
+
+def file_terms(path, symbols, module_doc):
+  terms = Counter()
+  if symbols or module_doc:
+    # The file name without its extension or directories, which every sibling shares. Names
+    # of files with no code (READMEs, lock files) say little about a directory.
+    name = os.path.splitext(path.rsplit("/", 1)[-1])[0]
+    terms.update(term for term in tokenize(name) if term not in GENERIC_FILE_NAMES)
+  terms.update(tokenize(module_doc or ""))
+  for symbol in symbols:
+    terms.update(tokenize(symbol.name))
+    terms.update(tokenize(symbol.doc))
+  return terms
+
+
+def rank_terms(terms, document_frequency, total_files):
+  # Terms frequent in the file but rare in the rest of the repository say the most about it.
+  def weight(term):
+    return (1 + math.log(terms[term])) * math.log(1 + total_files / document_frequency[term])
+  return sorted(terms, key=lambda term: (-weight(term), term))[:DIRECTORY_SUMMARY_TERMS]
+
+
+def interleave_terms(ranked_lists):
+  """
+  Merge the ranked terms of a directory's children by taking each child's best term in
+  turn, so the summary covers what the directory holds rather than its largest file.
+  """
+  merged = []
+  for depth in range(DIRECTORY_SUMMARY_TERMS):
+    for ranked in ranked_lists:
+      if depth < len(ranked) and ranked[depth] not in merged:
+        merged.append(ranked[depth])
+        if len(merged) == DIRECTORY_SUMMARY_TERMS:
+          return merged
+  return merged
+
+
+def build_summaries(snapshot):
+  symbol_index = get_symbol_index(snapshot)
+  paths = list(snapshot_manifest(snapshot))
+  summaries = {}
+  file_terms_by_path = {}
+  document_frequency = Counter()
+  # Directory -> its children's paths (as an ordered set), and the number of files below each path.
+  children = {"": {}}
+  sizes = Counter()
+
+  for path in paths:
+    symbols = symbol_index.symbols(path)
+    module_doc = symbol_index.module_docs.get(path)
+    summary = summarize_file(symbols, module_doc)
+    if summary:
+      summaries[path] = summary
+    file_terms_by_path[path] = file_terms(path, symbols, module_doc)
+    document_frequency.update(file_terms_by_path[path].keys())
+
+    child = path
+    while child:
+      sizes[child] += 1
+      directory = child.rpartition("/")[0]
+      children.setdefault(directory, {})[child] = None
+      child = directory
+
+  ranked = {
+    path: rank_terms(terms, document_frequency, len(paths)) for path, terms in file_terms_by_path.items()
+  }
+  # Deepest directories first, so every child is ranked before its parent.
+  for directory in sorted(children, key=lambda d: -(d.count("/") + 1) if d else 0):
+    ordered = sorted(children[directory], key=lambda child: (-sizes[child], child))
+    # A subdirectory's own name is the best description of it that its parent can give.
+    ranked[directory] = interleave_terms([
+      tokenize(child.rsplit("/", 1)[-1]) + ranked[child] if child in children else ranked[child]
+      for child in ordered
+    ])
+
+    package_doc = None
+    for name in PACKAGE_FILES:
+      package_doc = package_doc or symbol_index.module_docs.get(f"{directory}/{name}".lstrip("/"))
+    if package_doc:
+      summaries[directory] = _truncate(package_doc)
+    elif ranked[directory]:
+      summaries[directory] = _truncate(", ".join(ranked[directory]))
+  return RepoSummaries(snapshot.sha, summaries)
+
+
+def _summaries_path(snapshot):
+  return os.path.join(INDEX_DIR, snapshot.owner, snapshot.repo, snapshot.sha, "summaries.json")
+
+
+def _write_summaries(path, summaries):
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  tmp_path = f"{path}.{os.getpid()}.tmp"
+  with open(tmp_path, "w") as f:
+    json.dump(summaries.to_json(), f, separators=(",", ":"))
+  os.replace(tmp_path, path)
+
+
+def _load_summaries(path):
+  try:
+    with open(path) as f:
+      data = json.load(f)
+  except (OSError, ValueError):
+    return None
+  if data.get("version") != SUMMARY_FORMAT_VERSION:
+    return None
+  return RepoSummaries(data["sha"], data["summaries"])
+
+
+def get_summaries(snapshot):
+  """
+  Return the summaries of a snapshot, loading them from disk or building them on first use.
+  """
+  key = (snapshot.owner, snapshot.repo, snapshot.sha)
+  with lock_for(("summaries",) + key):
+    with _summaries_lock:
+      if key in _loaded_summaries:
+        _loaded_summaries.move_to_end(key)
+        return _loaded_summaries[key]
+
+    path = _summaries_path(snapshot)
+    summaries = _load_summaries(path)
+    if summaries is None:
+      with span("summaries_build", repo=f"{snapshot.owner}/{snapshot.repo}"):
+        summaries = build_summaries(snapshot)
+      _write_summaries(path, summaries)
+
+    with _summaries_lock:
+      _loaded_summaries[key] = summaries
+      if len(_loaded_summaries) > MAX_LOADED_SUMMARIES:
+        _loaded_summaries.popitem(last=False)
+    return summaries
@@ -0,0 +1,176 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from retrieval.extractors import SymbolDefinition, extract_file_module, has_extractor
+from retrieval.metrics import Counter, span
+from retrieval.snapshot import DATA_DIR, lock_for, snapshot_manifest, snapshot_path
+
+INDEX_DIR = os.getenv("INDEX_DIR", os.path.join(DATA_DIR, "index"))
+INDEX_FORMAT_VERSION = 4
+# Number of parsed indexes kept in memory per process.
+MAX_LOADED_INDEXES = int(os.getenv("MAX_LOADED_INDEXES", "8"))
+
+_loaded_indexes = OrderedDict()
+_index_lock = threading.Lock()
+INDEXED_FILES = Counter("symbol_index_files_total", "Files parsed into symbol indexes, by build (full or incremental).", ["build"])
+
+
+class SymbolIndex:
+  def __init__(self, sha, files, module_docs=None, blobs=None):
+    self.sha = sha
+    # path -> [SymbolDefinition]
+    self.files = files
+    # path -> first line of the module docstring
+    self.module_docs = module_docs or {}
+    # path -> blob SHA of every indexed file, including those without symbols
+    self.blobs = blobs or {}
+
+  def symbols(self, path):
+    return self.files.get(path, [])
+
+  def to_json(self):
+    return {
+      "version": INDEX_FORMAT_VERSION,
+      "sha": self.sha,
+      "files": {
+        path: [[s.qualified_name, s.kind, s.line_start, s.line_end, s.parent, s.doc] for s in symbols]
+        for path, symbols in self.files.items()
+      },
+      "module_docs": self.module_docs,
+      "blobs": self.blobs,
+    }
+
+  @classmethod
+  def from_json(cls, data):
+    files = {
+      path: [SymbolDefinition(*entry) for entry in entries]
+      for path, entries in data["files"].items()
+    }
+    return cls(data["sha"], files, data.get("module_docs"), data.get("blobs"))
+
+
+def _index_path(snapshot):
+  return os.path.join(INDEX_DIR, snapshot.owner, snapshot.repo, snapshot.sha, "symbols.json")
+
+
+def _previous_index(snapshot):
+  """
+  The most recently written index of another commit of the same repository, if any.
+  """
+  repo_dir = os.path.join(INDEX_DIR, snapshot.owner, snapshot.repo)
+  try:
+    shas = os.listdir(repo_dir)
+  except OSError:
+    return None
+
+  candidates = []
+  for sha in shas:
+    path = os.path.join(repo_dir, sha, "symbols.json")
+    if sha != snapshot.sha and os.path.isfile(path):
+      candidates.append((os.path.getmtime(path), sha, path))
+  for _, sha, path in sorted(candidates, reverse=True):
+    index = _cached_index((snapshot.owner, snapshot.repo, sha)) or _load_index(path)
+    if index:
+      return index
+  return None
+
+
+def parse_file_module(path, full_path):
+  try:
+    with open(full_path, "rb") as f:
+      return extract_file_module(path, f.read())
+  except OSError:
+    return None
+
+
+def build_symbol_index(snapshot, previous=None):
+  """
+  Index the snapshot's files in every language with an extractor. Given the index of an earlier commit, only files whose
+  blob SHA differs from it are parsed; entries of unchanged files are carried over.
+  Returns the index and the number of files parsed.
+  """
+  blobs = {path: blob_sha for path, blob_sha in snapshot_manifest(snapshot).items() if has_extractor(path)}
+  previous = previous or SymbolIndex(None, {})
+  files = {path: symbols for path, symbols in previous.files.items() if path in blobs}
+  module_docs = {path: doc for path, doc in previous.module_docs.items() if path in blobs}
+
+  changed = [path for path, blob_sha in blobs.items() if previous.blobs.get(path) != blob_sha]
+  for path in changed:
+    files.pop(path, None)
+    module_docs.pop(path, None)
+    module = parse_file_module(path, snapshot_path(snapshot, path))
+    if not module:
+      continue
+    module_doc, symbols = module
+    if symbols:
+      files[path] = symbols
+    if module_doc:
+      module_docs[path] = module_doc
+  return SymbolIndex(snapshot.sha, files, module_docs, blobs), len(changed)
+
+
+def _write_index(path, index):
+  os.makedirs(os.path.dirname(path), exist_ok=True)
+  tmp_path = f"{path}.{os.getpid()}.tmp"
+  with open(tmp_path, "w") as f:
+    json.dump(index.to_json(), f, separators=(",", ":"))
+  os.replace(tmp_path, path)
+
+
+def _load_index(path):
+  try:
+    with open(path) as f:
+      data = json.load(f)
+  except (OSError, ValueError):
+    return None
+  if data.get("version") != INDEX_FORMAT_VERSION:
+    return None
+  return SymbolIndex.from_json(data)
+
+
+def _cached_index(key):
+  with _index_lock:
+    if key in _loaded_indexes:
+      _loaded_indexes.move_to_end(key)
+      return _loaded_indexes[key]
+  return None
+
+
+def _cache_index(key, index):
+  with _index_lock:
+    _loaded_indexes[key] = index
+    if len(_loaded_indexes) > MAX_LOADED_INDEXES:
+      _loaded_indexes.popitem(last=False)
+
+
+def get_symbol_index(snapshot):
+  """
+  Return the symbol index for a snapshot, loading it from disk or building it on first use.
+  """
+  key = (snapshot.owner, snapshot.repo, snapshot.sha)
+  index = _cached_index(key)
+  if index:
+    return index
+
+  with lock_for(("symbols",) + key):
+    index = _cached_index(key)
+    if index:
+      return index
+
+    path = _index_path(snapshot)
+    index = _load_index(path)
+    if index is None:
+      previous = _previous_index(snapshot)
+      build = "incremental" if previous else "full"
+      with span("symbol_index_build", repo=f"{snapshot.owner}/{snapshot.repo}", build=build) as attributes:
+        index, parsed = build_symbol_index(snapshot, previous)
+        attributes["files_parsed"] = parsed
+      INDEXED_FILES.inc(parsed, build=build)
+      since = f" ({parsed} changed files since {previous.sha[:12]})" if previous else ""
+      print(f"Indexed symbols of {snapshot.owner}/{snapshot.repo}@{snapshot.sha[:12]}{since}")
+      _write_index(path, index)
+
+    _cache_index(key, index)
+    return index
@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# retrieval reads its settings at import time, so they are set before any test imports it.
+os.environ.setdefault("FIREWORKS_API_KEY", "test")
+os.environ["ALLOW_LOCAL_REPOS"] = "1"
+os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="code-search-tests-")
+os.environ["MODEL_CACHE_DB"] = ""
+os.environ["MODEL_CACHE_SIZE"] = "0"
+os.environ["SEARCH_CACHE_SIZE"] = "0"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
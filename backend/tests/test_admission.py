@@ -0,0 +1,86 @@
+import threading
+import time
+
+import pytest
+
+from retrieval.admission import AdmissionController, AdmissionRejected
+
+
+def acquire_in_thread(controller):
+  result = {}
+
+  def acquire():
+    try:
+      result["admission"] = controller.acquire()
+    except AdmissionRejected as e:
+      result["error"] = e
+
+  thread = threading.Thread(target=acquire)
+  thread.start()
+  return thread, result
+
+
+def wait_until(condition, timeout=2):
+  deadline = time.monotonic() + timeout
+  while not condition():
+    assert time.monotonic() < deadline, "condition not reached"
+    time.sleep(0.01)
+
+
+def test_admits_up_to_max_active():
+  controller = AdmissionController(max_active=2, max_queued=0, queue_timeout=1)
+  first = controller.acquire()
+  controller.acquire()
+  assert controller.stats() == {"active": 2, "queued": 0}
+  with pytest.raises(AdmissionRejected):
+    controller.acquire()
+  first.release()
+  assert controller.stats() == {"active": 1, "queued": 0}
+
+
+def test_queued_request_is_admitted_when_a_slot_frees():
+  controller = AdmissionController(max_active=1, max_queued=1, queue_timeout=5)
+  admission = controller.acquire()
+  thread, result = acquire_in_thread(controller)
+  wait_until(lambda: controller.stats()["queued"] == 1)
+
+  admission.release()
+  thread.join(2)
+  assert "admission" in result
+  assert controller.stats() == {"active": 1, "queued": 0}
+
+
+def test_rejects_immediately_when_the_queue_is_full():
+  controller = AdmissionController(max_active=1, max_queued=1, queue_timeout=5)
+  admission = controller.acquire()
+  thread, result = acquire_in_thread(controller)
+  wait_until(lambda: controller.stats()["queued"] == 1)
+
+  started = time.monotonic()
+  with pytest.raises(AdmissionRejected) as rejected:
+    controller.acquire()
+  assert time.monotonic() - started < 1
+  assert rejected.value.retry_after == 5
+
+  admission.release()
+  thread.join(2)
+
+
+def test_queued_request_times_out():
+  controller = AdmissionController(max_active=1, max_queued=1, queue_timeout=0.1)
+  controller.acquire()
+  started = time.monotonic()
+  with pytest.raises(AdmissionRejected) as rejected:
+    controller.acquire()
+  assert time.monotonic() - started >= 0.1
+  assert rejected.value.retry_after == 1
+  assert controller.stats() == {"active": 1, "queued": 0}
+
+
+def test_release_is_idempotent():
+  controller = AdmissionController(max_active=1, max_queued=0, queue_timeout=1)
+  with controller.acquire() as admission:
+    pass
+  admission.release()
+  assert controller.stats() == {"active": 0, "queued": 0}
+  controller.acquire()
@@ -0,0 +1,25 @@
+import os
+import runpy
+import subprocess
+import sys
+
+from retrieval import jobs
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_importing_the_app_does_not_start_the_job_dispatcher():
+  # A fresh interpreter, as the reloader's watching parent process would be.
+  output = subprocess.run(
+    [sys.executable, "-c", "import app; from retrieval.jobs import job_runner; print(job_runner._pid)"],
+    cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+  ).stdout
+  assert output.split()[-1] == "None"
+
+
+def test_gunicorn_workers_start_the_job_dispatcher(monkeypatch):
+  started = []
+  monkeypatch.setattr(jobs.job_runner, "start", lambda: started.append(True))
+  config = runpy.run_path(os.path.join(BACKEND_DIR, "gunicorn.conf.py"))
+  config["post_worker_init"](None)
+  assert started == [True]
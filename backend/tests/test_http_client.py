@@ -0,0 +1,17 @@
+import os
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_github_settings_are_read_from_dotenv(tmp_path):
+  (tmp_path / ".env").write_text("GITHUB_TOKEN=from-dotenv\nGITHUB_API_URL=http://github.test/api/\n")
+  env = {key: value for key, value in os.environ.items() if key not in ("GITHUB_TOKEN", "GITHUB_API_URL")}
+  env["PYTHONPATH"] = BACKEND_DIR
+  # A fresh interpreter, so http_client is imported before anything else loads .env.
+  output = subprocess.run(
+    [sys.executable, "-c", "from retrieval import http_client; print(http_client.GITHUB_TOKEN, http_client.GITHUB_API_URL)"],
+    cwd=tmp_path, env=env, capture_output=True, text=True, check=True,
+  ).stdout
+  assert output.split() == ["from-dotenv", "http://github.test/api"]
@@ -0,0 +1,41 @@
+import os
+import time
+
+from retrieval.jobs import JOB_DONE, JOB_FAILED, JobQueue, JobRunner
+
+
+def crash_once(marker):
+  # Runs in a worker process: the first attempt dies the way an out-of-memory kill would.
+  if not os.path.exists(marker):
+    open(marker, "w").close()
+    os._exit(1)
+  return {"repo": marker}
+
+
+def wait_for(queue, job_id, timeout=60):
+  deadline = time.monotonic() + timeout
+  while time.monotonic() < deadline:
+    job = queue.get(job_id)
+    if job["status"] in (JOB_DONE, JOB_FAILED):
+      return job
+    time.sleep(0.1)
+  raise AssertionError(f"Job {job_id} did not finish: {queue.get(job_id)}")
+
+
+def test_job_whose_worker_dies_is_retried_and_later_jobs_run(tmp_path):
+  queue = JobQueue(str(tmp_path / "jobs.sqlite3"))
+  runner = JobRunner(queue, workers=1, target=crash_once)
+
+  crashing, _ = queue.enqueue(str(tmp_path / "crashing"))
+  runner.notify()
+  crashing = wait_for(queue, crashing["id"])
+  assert crashing["status"] == JOB_DONE
+  assert crashing["attempts"] == 2
+
+  # The next job runs on the replacement pool instead of inheriting the crash.
+  healthy, _ = queue.enqueue(str(tmp_path / "healthy"))
+  open(tmp_path / "healthy", "w").close()
+  runner.notify()
+  healthy = wait_for(queue, healthy["id"])
+  assert healthy["status"] == JOB_DONE
+  assert healthy["attempts"] == 1
@@ -0,0 +1,104 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+from fireworks.client.error import InvalidRequestError, RateLimitError
+
+from retrieval import http_client, model_call
+from retrieval.cache import LRUCache, SQLiteCache, TieredCache
+from retrieval.structured_output import extract_json
+
+MODEL = "test-model"
+JSON_FORMAT = {"type": "json_object"}
+
+
+def test_response_format_error_turns_off_response_format(monkeypatch):
+  monkeypatch.setattr(model_call, "_response_format_unsupported", set())
+  request = model_call.model_request(MODEL, "prompt", JSON_FORMAT)
+  error = InvalidRequestError("response_format is not supported for this model")
+
+  assert model_call.response_format_rejected(MODEL, request, error)
+  assert "response_format" not in model_call.model_request(MODEL, "prompt", JSON_FORMAT)
+
+
+def test_other_invalid_requests_keep_response_format(monkeypatch):
+  monkeypatch.setattr(model_call, "_response_format_unsupported", set())
+  request = model_call.model_request(MODEL, "prompt", JSON_FORMAT)
+  error = InvalidRequestError("The prompt is too long: 140000 tokens, the maximum context length is 131072")
+
+  assert not model_call.response_format_rejected(MODEL, request, error)
+  assert model_call.model_request(MODEL, "prompt", JSON_FORMAT)["response_format"] == JSON_FORMAT
+
+
+def test_retry_backoff_does_not_hold_a_concurrency_slot(monkeypatch):
+  finished = []
+  failed_once = set()
+
+  async def acreate(model, messages, **kwargs):
+    prompt = messages[0]["content"]
+    if prompt == "rate limited" and prompt not in failed_once:
+      failed_once.add(prompt)
+      raise RateLimitError("Too many requests")
+    finished.append(prompt)
+    return SimpleNamespace(
+      choices=[SimpleNamespace(message=SimpleNamespace(content=prompt))],
+      usage=SimpleNamespace(prompt_tokens=1, completion_tokens=1),
+    )
+
+  async def run():
+    # One slot: the second call only gets it if the first gives it up while backing off.
+    monkeypatch.setattr(model_call, "_model_semaphore", asyncio.Semaphore(1))
+    limited = asyncio.create_task(model_call.async_call_model(MODEL, "rate limited"))
+    await asyncio.sleep(0.05)
+    other = asyncio.create_task(model_call.async_call_model(MODEL, "other"))
+    return await asyncio.gather(limited, other)
+
+  monkeypatch.setattr(model_call.async_client.chat.completions, "acreate", acreate)
+  monkeypatch.setattr(http_client, "_next_delay", lambda target, limiter, attempt, e: 0.5)
+
+  assert asyncio.run(run()) == ["rate limited", "other"]
+  assert finished == ["other", "rate limited"]
+
+
+class RecordingDiskCache(SQLiteCache):
+  # Notes the thread each disk access runs on.
+  def __init__(self, path):
+    super().__init__(path)
+    self.threads = []
+
+  def get(self, key):
+    self.threads.append(threading.current_thread())
+    return super().get(key)
+
+  def set(self, key, value):
+    self.threads.append(threading.current_thread())
+    super().set(key, value)
+
+
+def test_only_usable_answers_are_cached_and_disk_is_used_off_the_loop(monkeypatch, tmp_path):
+  disk = RecordingDiskCache(str(tmp_path / "cache.sqlite3"))
+  monkeypatch.setattr(model_call, "response_cache", TieredCache(LRUCache(max_entries=16), disk))
+  answers = {"good": ['{"a": 1}'], "bad": ["not json", '{"a": 2}']}
+  calls = []
+
+  async def acreate(model, messages, **kwargs):
+    prompt = messages[0]["content"]
+    calls.append(prompt)
+    return SimpleNamespace(
+      choices=[SimpleNamespace(message=SimpleNamespace(content=answers[prompt].pop(0)))],
+      usage=SimpleNamespace(prompt_tokens=1, completion_tokens=1),
+    )
+
+  monkeypatch.setattr(model_call.async_client.chat.completions, "acreate", acreate)
+  is_json = lambda content: extract_json(content)[0] is not None
+
+  async def ask(prompt):
+    return await model_call.async_call_model(MODEL, prompt, cacheable=is_json)
+
+  async def run():
+    return [await ask("good"), await ask("good"), await ask("bad"), await ask("bad"), await ask("bad")]
+
+  assert asyncio.run(run()) == ['{"a": 1}', '{"a": 1}', "not json", '{"a": 2}', '{"a": 2}']
+  # The malformed answer was asked for again instead of being served from the cache.
+  assert calls == ["good", "bad", "bad"]
+  assert disk.threads and threading.main_thread() not in disk.threads
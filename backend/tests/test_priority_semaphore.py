@@ -0,0 +1,94 @@
+import asyncio
+
+from retrieval.multi_processor_utils import PrioritySemaphore
+
+
+def run(coro):
+  return asyncio.run(coro)
+
+
+def test_free_slots_are_taken_without_waiting():
+  async def main():
+    semaphore = PrioritySemaphore(2)
+    await semaphore.acquire(5)
+    await semaphore.acquire(1)
+    assert semaphore._value == 0
+    semaphore.release()
+    semaphore.release()
+    assert semaphore._value == 2
+
+  run(main())
+
+
+def test_waiters_get_slots_by_priority_then_arrival():
+  async def main():
+    semaphore = PrioritySemaphore(1)
+    await semaphore.acquire()
+    order = []
+
+    async def waiter(name, priority):
+      async with semaphore.slot(priority):
+        order.append(name)
+
+    tasks = []
+    for name, priority in (("c", 3), ("a1", 1), ("b", 2), ("a2", 1)):
+      tasks.append(asyncio.create_task(waiter(name, priority)))
+      await asyncio.sleep(0)
+    semaphore.release()
+    await asyncio.gather(*tasks)
+    assert order == ["a1", "a2", "b", "c"]
+    assert semaphore._value == 1
+
+  run(main())
+
+
+def test_waiter_cancelled_while_queued_is_skipped():
+  async def main():
+    semaphore = PrioritySemaphore(1)
+    await semaphore.acquire()
+    first = asyncio.create_task(semaphore.acquire(0))
+    second = asyncio.create_task(semaphore.acquire(1))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+
+    semaphore.release()
+    await asyncio.wait_for(second, 1)
+    assert first.cancelled()
+    semaphore.release()
+    assert semaphore._value == 1
+
+  run(main())
+
+
+def test_slot_handed_to_a_waiter_cancelled_before_it_ran_passes_on():
+  async def main():
+    semaphore = PrioritySemaphore(1)
+    await semaphore.acquire()
+    first = asyncio.create_task(semaphore.acquire(0))
+    second = asyncio.create_task(semaphore.acquire(1))
+    await asyncio.sleep(0)
+
+    # The slot goes to first, which is cancelled before it gets to run.
+    semaphore.release()
+    first.cancel()
+    await asyncio.wait_for(second, 1)
+    assert first.cancelled()
+    semaphore.release()
+    assert semaphore._value == 1
+    assert not semaphore._waiters
+
+  run(main())
+
+
+def test_slot_is_released_when_the_body_raises():
+  async def main():
+    semaphore = PrioritySemaphore(1)
+    try:
+      async with semaphore.slot():
+        raise ValueError()
+    except ValueError:
+      pass
+    assert semaphore._value == 1
+
+  run(main())
@@ -0,0 +1,28 @@
+from retrieval import repo_tree
+
+
+def count_tree_fetches(monkeypatch, tree):
+  fetches = []
+
+  def fetch(owner, repo, sha):
+    fetches.append(sha)
+    return tree
+
+  monkeypatch.setattr(repo_tree, "resolve_commit_sha", lambda source: "abc123")
+  monkeypatch.setattr(repo_tree, "fetch_repo_tree", fetch)
+  return fetches
+
+
+def test_tree_is_fetched_once_per_commit(monkeypatch):
+  tree = repo_tree.build_repo_tree("owner", "found", "abc123", [{"path": "a.py", "type": "blob", "sha": "1"}])
+  fetches = count_tree_fetches(monkeypatch, tree)
+  assert repo_tree.get_repo_tree("https://github.com/owner/found") is tree
+  assert repo_tree.get_repo_tree("https://github.com/owner/found") is tree
+  assert fetches == ["abc123"]
+
+
+def test_missing_or_truncated_tree_is_not_fetched_again(monkeypatch):
+  fetches = count_tree_fetches(monkeypatch, None)
+  assert repo_tree.get_repo_tree("https://github.com/owner/truncated") is None
+  assert repo_tree.get_repo_tree("https://github.com/owner/truncated") is None
+  assert fetches == ["abc123"]
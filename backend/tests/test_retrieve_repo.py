@@ -0,0 +1,60 @@
+from retrieval.extractors import extract_file_module
+from retrieval.retrieve_repo import index_symbols_by_name, match_symbol
+
+CODE = """
+def outer():
+  def run():
+    return "nested"
+  return run
+
+
+def run():
+  return "top level"
+
+
+class Parser:
+  def run(self):
+    return "method"
+
+  def parser(self):
+    return self
+
+
+def parse_config(path):
+  return path
+"""
+
+
+def by_kind():
+  _, symbols = extract_file_module("example.py", CODE)
+  return index_symbols_by_name(symbols)
+
+
+def test_bare_name_prefers_top_level_definition():
+  assert match_symbol(by_kind(), "run").qualified_name == "run"
+
+
+def test_qualified_name_finds_nested_definition():
+  names = by_kind()
+  assert match_symbol(names, "outer.run").qualified_name == "outer.run"
+  assert match_symbol(names, "Parser.run").qualified_name == "Parser.run"
+
+
+def test_call_syntax_and_case_are_tolerated():
+  names = by_kind()
+  assert match_symbol(names, "def parse_config(path)").qualified_name == "parse_config"
+  assert match_symbol(names, "parseConfig").qualified_name == "parse_config"
+
+
+def test_typo_resolves_within_cutoff():
+  assert match_symbol(by_kind(), "pasre_config").qualified_name == "parse_config"
+
+
+def test_prefix_of_another_name_does_not_resolve():
+  names = by_kind()
+  assert match_symbol(names, "parse") is None
+  assert match_symbol(names, "parse_configs") is None
+
+
+def test_unrelated_name_does_not_resolve():
+  assert match_symbol(by_kind(), "load_settings") is None
@@ -0,0 +1,105 @@
+import json
+
+import pytest
+from fireworks.client.error import InvalidRequestError
+
+from retrieval import routing, search
+from retrieval.prompts import (
+  RELEVANT_CLASSES_KEY,
+  RELEVANT_DIRECTORIES_KEY,
+  RELEVANT_FILES_KEY,
+  RELEVANT_FUNCTIONS_KEY,
+)
+
+UNUSABLE = "Sorry, I am not able to answer that."
+
+
+@pytest.fixture
+def repo(tmp_path):
+  (tmp_path / "a.py").write_text("def alpha():\n  return 1\n")
+  (tmp_path / "b.py").write_text("def beta():\n  return 2\n")
+  (tmp_path / "pkg").mkdir()
+  (tmp_path / "pkg" / "c.py").write_text("def gamma():\n  return 3\n")
+  return str(tmp_path)
+
+
+@pytest.fixture
+def stub_model(monkeypatch):
+  """
+  Answer prompts by the first key found in them, from a dict the test fills in. An answer
+  may be a function of the prompt. Files are searched one prompt each so every file gets
+  its own answer.
+  """
+  answers = {}
+
+  async def call_model(model, sys_msg, response_format=None, cacheable=None):
+    for key, answer in answers.items():
+      if key in sys_msg:
+        return answer(sys_msg) if callable(answer) else answer
+    return UNUSABLE
+
+  monkeypatch.setattr(routing, "async_call_model", call_model)
+  monkeypatch.setattr(search, "BATCH_SMALL_FILE_TOKENS", 0)
+  return answers
+
+
+def triage(directories=(), files=()):
+  return json.dumps({RELEVANT_DIRECTORIES_KEY: list(directories), RELEVANT_FILES_KEY: list(files)})
+
+
+def picks(*functions):
+  return json.dumps({RELEVANT_FUNCTIONS_KEY: list(functions), RELEVANT_CLASSES_KEY: []})
+
+
+def snippet_names(recommendations):
+  return {
+    file_recommendations.file_name: [snippet.name for snippet in file_recommendations.snippets]
+    for file_recommendations in recommendations.files
+  }
+
+
+def test_unusable_file_answer_skips_only_that_file(repo, stub_model):
+  stub_model["b.py"] = triage(files=["a.py", "b.py"])
+  stub_model["def alpha"] = picks("alpha")
+  # b.py gets an unusable answer from every model and from the repair.
+
+  recommendations = search.run_search(repo, "what returns one", deadline=30)
+
+  assert snippet_names(recommendations) == {"a.py": ["alpha"]}
+
+
+def test_unusable_directory_answer_skips_only_that_branch(repo, stub_model):
+  stub_model["b.py"] = triage(directories=["pkg"], files=["a.py"])
+  stub_model["def alpha"] = picks("alpha")
+  # The listing of pkg gets an unusable answer.
+
+  recommendations = search.run_search(repo, "what returns one", deadline=30)
+
+  assert snippet_names(recommendations) == {"a.py": ["alpha"]}
+
+
+def test_large_file_without_symbols_is_not_sent_to_the_model(repo, stub_model, monkeypatch, tmp_path):
+  (tmp_path / "data.py").write_text("VALUES = [\n" + "  1,\n" * 200 + "]\n")
+  monkeypatch.setattr(search, "FILE_TOKEN_BUDGET", 100)
+  stub_model["b.py"] = triage(files=["a.py", "data.py"])
+  stub_model["def alpha"] = picks("alpha")
+  prompts = []
+  stub_model["VALUES"] = lambda prompt: prompts.append(prompt) or picks("VALUES")
+
+  recommendations = search.run_search(repo, "what returns one", deadline=30)
+
+  assert snippet_names(recommendations) == {"a.py": ["alpha"]}
+  assert prompts == []
+
+
+def test_model_error_on_one_file_skips_only_that_file(repo, stub_model):
+  stub_model["b.py"] = triage(files=["a.py", "b.py"])
+  stub_model["def alpha"] = picks("alpha")
+
+  def reject(prompt):
+    raise InvalidRequestError("The prompt is too long")
+  stub_model["def beta"] = reject
+
+  recommendations = search.run_search(repo, "what returns one", deadline=30)
+
+  assert snippet_names(recommendations) == {"a.py": ["alpha"]}
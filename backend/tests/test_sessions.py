@@ -0,0 +1,45 @@
+from types import SimpleNamespace
+
+from retrieval.sessions import SnippetIndex
+
+
+def snippet(name, line_start, line_end):
+  return SimpleNamespace(name=name, line_start=line_start, line_end=line_end)
+
+
+SNIPPETS = [
+  snippet("helper", 60, 70),
+  snippet("Stack", 1, 50),
+  snippet("Stack.push", 10, 20),
+  snippet("Stack.pop", 30, 40),
+  snippet("everything", 5, 100),
+]
+
+
+def found(line):
+  match = SnippetIndex(SNIPPETS).find(line)
+  return match.name if match else None
+
+
+def test_finds_innermost_snippet():
+  assert found(15) == "Stack.push"
+  assert found(30) == "Stack.pop"
+  assert found(40) == "Stack.pop"
+
+
+def test_finds_enclosing_snippet_between_members():
+  assert found(25) == "Stack"
+  assert found(1) == "Stack"
+  assert found(50) == "Stack"
+
+
+def test_finds_snippet_that_started_long_before_the_line():
+  assert found(55) == "everything"
+  assert found(65) == "helper"
+  assert found(100) == "everything"
+
+
+def test_lines_outside_every_snippet_find_nothing():
+  assert found(101) is None
+  assert SnippetIndex([]).find(1) is None
+  assert SnippetIndex([snippet("late", 10, 20)]).find(5) is None
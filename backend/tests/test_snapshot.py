@@ -0,0 +1,83 @@
+import os
+
+from retrieval import repo_tree, snapshot
+from retrieval.snapshot import RepoSource, SNAPSHOT_DIR, _fetch_github_changes, git_blob_sha
+
+
+def make_previous_snapshot(owner, files):
+  root = os.path.join(SNAPSHOT_DIR, owner, "repo", "old")
+  os.makedirs(root)
+  for path, data in files.items():
+    with open(os.path.join(root, path), "wb") as f:
+      f.write(data)
+  snapshot._write_manifest(snapshot._manifest_path(owner, "repo", "old"),
+                           {path: git_blob_sha(data) for path, data in files.items()})
+  return root
+
+
+def serve_tree(monkeypatch, owner, files, unreadable=()):
+  entries = [{"path": path, "type": "blob", "sha": git_blob_sha(data)} for path, data in files.items()]
+  monkeypatch.setattr(repo_tree, "fetch_repo_tree", lambda owner, repo, sha: repo_tree.build_repo_tree(owner, repo, sha, entries))
+  fetched = []
+
+  async def read(tree, path):
+    fetched.append(path)
+    return None if path in unreadable else files[path]
+
+  monkeypatch.setattr(repo_tree, "async_read_tree_file", read)
+  return fetched
+
+
+def test_only_changed_files_are_downloaded(monkeypatch, tmp_path):
+  previous_root = make_previous_snapshot("incremental", {"same.py": b"same\n", "edited.py": b"old\n"})
+  files = {"same.py": b"same\n", "edited.py": b"new\n", "added.py": b"added\n"}
+  fetched = serve_tree(monkeypatch, "incremental", files)
+
+  dest = tmp_path / "new"
+  dest.mkdir()
+  source = RepoSource(owner="incremental", repo="repo", kind="github", location="")
+  manifest = _fetch_github_changes(source, "new", str(dest))
+
+  assert sorted(fetched) == ["added.py", "edited.py"]
+  assert manifest == {path: git_blob_sha(data) for path, data in files.items()}
+  assert {path: (dest / path).read_bytes() for path in files} == files
+  assert open(os.path.join(previous_root, "edited.py"), "rb").read() == b"old\n"
+
+
+def test_failed_blob_falls_back_to_the_archive_without_touching_dest(monkeypatch, tmp_path):
+  make_previous_snapshot("failing", {"same.py": b"same\n"})
+  files = {"same.py": b"same\n", "added.py": b"added\n", "broken.py": b"broken\n"}
+  serve_tree(monkeypatch, "failing", files, unreadable={"broken.py"})
+
+  dest = tmp_path / "new"
+  dest.mkdir()
+  source = RepoSource(owner="failing", repo="repo", kind="github", location="")
+  assert _fetch_github_changes(source, "new", str(dest)) is None
+  assert os.listdir(dest) == []
+
+
+def test_large_changes_download_the_archive(monkeypatch, tmp_path):
+  make_previous_snapshot("large", {"same.py": b"same\n"})
+  files = {f"file{i}.py": str(i).encode() for i in range(snapshot.SNAPSHOT_INCREMENTAL_MAX_FILES + 1)}
+  fetched = serve_tree(monkeypatch, "large", files)
+
+  source = RepoSource(owner="large", repo="repo", kind="github", location="")
+  assert _fetch_github_changes(source, "new", str(tmp_path)) is None
+  assert fetched == []
+
+
+def test_directory_fingerprint_is_reused_for_a_short_time(monkeypatch, tmp_path):
+  (tmp_path / "a.py").write_text("one\n")
+  source = RepoSource(owner="local", repo=tmp_path.name, kind="dir", location=str(tmp_path))
+  walks = []
+  fingerprint = snapshot._directory_fingerprint
+  monkeypatch.setattr(snapshot, "_directory_fingerprint", lambda path: walks.append(path) or fingerprint(path))
+
+  first = snapshot.resolve_commit_sha(source)
+  (tmp_path / "a.py").write_text("two, and longer\n")
+  assert snapshot.resolve_commit_sha(source) == first
+  assert len(walks) == 1
+
+  monkeypatch.setattr(snapshot, "SNAPSHOT_DIR_TTL", 0)
+  assert snapshot.resolve_commit_sha(source) != first
+  assert len(walks) == 2
@@ -0,0 +1,57 @@
+from retrieval import structured_output
+from retrieval.prompts import RELEVANT_CLASSES_KEY, RELEVANT_FUNCTIONS_KEY
+from retrieval.structured_output import (
+  DIRECTORY_ANSWER_SCHEMA,
+  FILE_ANSWER_SCHEMA,
+  MULTI_FILE_ANSWER_SCHEMA,
+  extract_json,
+  response_format,
+  schema_problem,
+)
+
+
+def test_plain_json_is_exact():
+  assert extract_json('{"a": [1, 2]}') == ({"a": [1, 2]}, True)
+
+
+def test_fenced_json_with_prose_is_extracted():
+  text = 'Here is my answer:\n```json\n{"a": [1]}\n```\nLet me know if you need more.'
+  assert extract_json(text) == ({"a": [1]}, False)
+
+
+def test_trailing_commas_are_dropped():
+  assert extract_json('{"a": [1, 2,], "b": {"c": 3,},}') == ({"a": [1, 2], "b": {"c": 3}}, False)
+
+
+def test_first_complete_object_in_prose_wins():
+  assert extract_json('Sure {not json} then {"a": 1} and {"b": 2}') == ({"a": 1}, False)
+
+
+def test_text_without_an_object_is_rejected():
+  assert extract_json("I could not find anything relevant.") == (None, False)
+  assert extract_json('{"a": [1, 2') == (None, False)
+  assert extract_json("") == (None, False)
+
+
+def test_matching_answers_have_no_problem():
+  assert schema_problem({RELEVANT_FUNCTIONS_KEY: ["a"], RELEVANT_CLASSES_KEY: []}, FILE_ANSWER_SCHEMA) is None
+  # Missing lists count as empty.
+  assert schema_problem({}, DIRECTORY_ANSWER_SCHEMA) is None
+  assert schema_problem({"a.py": {RELEVANT_FUNCTIONS_KEY: ["f"]}}, MULTI_FILE_ANSWER_SCHEMA) is None
+
+
+def test_schema_mismatches_name_the_first_bad_value():
+  assert schema_problem([], FILE_ANSWER_SCHEMA) == "$ is not an object"
+  assert schema_problem({RELEVANT_FUNCTIONS_KEY: "f"}, FILE_ANSWER_SCHEMA) == f"$.{RELEVANT_FUNCTIONS_KEY} is not an array"
+  assert schema_problem({RELEVANT_FUNCTIONS_KEY: ["f", 2]}, FILE_ANSWER_SCHEMA) == f"$.{RELEVANT_FUNCTIONS_KEY}[1] is not a string"
+  assert schema_problem({"a.py": ["f"]}, MULTI_FILE_ANSWER_SCHEMA) == "$.a.py is not an object"
+
+
+def test_response_format_follows_the_setting(monkeypatch):
+  monkeypatch.setattr(structured_output, "MODEL_RESPONSE_FORMAT", "schema")
+  assert response_format(FILE_ANSWER_SCHEMA) == {"type": "json_object", "schema": FILE_ANSWER_SCHEMA}
+  assert response_format(None) is None
+  monkeypatch.setattr(structured_output, "MODEL_RESPONSE_FORMAT", "json")
+  assert response_format(FILE_ANSWER_SCHEMA) == {"type": "json_object"}
+  monkeypatch.setattr(structured_output, "MODEL_RESPONSE_FORMAT", "off")
+  assert response_format(FILE_ANSWER_SCHEMA) is None
@@ -20,12 +20,26 @@ type SearchResult = {
   [filename: string]: Array<{ [lineRange: string]: string }>;
 };
 
+type SearchEvent =
+  | { type: "directory"; path: string }
+  | {
+      type: "file";
+      file_name: string;
+      snippets: Array<{ [lineRange: string]: string }>;
+    }
+  | { type: "done"; files: number; seconds: number; session_id?: string }
+  | { type: "error"; message: string };
+
 export default function Home() {
   const [githubUrl, setGithubUrl] = useState("");
   const [question, setQuestion] = useState("");
   const [isLoading, setIsLoading] = useState(false);
   const [searchResults, setSearchResults] = useState<SearchResult | null>(null);
+  const [sessionId, setSessionId] = useState<string | null>(null);
   const [error, setError] = useState<string | null>(null);
+  const [currentDirectory, setCurrentDirectory] = useState<string | null>(
+    null
+  );
   const [comments, setComments] = useState<{
     [key: string]: { [key: number]: { comment: string; response: string }[] };
   }>({});
@@ -37,13 +51,32 @@ export default function Home() {
     console.log("Comments updated:", comments);
   }, [comments]);
   console.log("comments", comments);
+  const handleSearchEvent = (event: SearchEvent) => {
+    if (event.type === "directory") {
+      setCurrentDirectory(event.path || "/");
+    } else if (event.type === "file") {
+      setSearchResults((prevResults) => ({
+        ...(prevResults || {}),
+        [event.file_name]: event.snippets,
+      }));
+    } else if (event.type === "done") {
+      // Show the empty results section when nothing was found.
+      setSearchResults((prevResults) => prevResults || {});
+      setSessionId(event.session_id || null);
+    } else if (event.type === "error") {
+      throw new Error(event.message);
+    }
+  };
+
   const handleSearch = async () => {
     setIsLoading(true);
     setSearchResults(null);
+    setSessionId(null);
+    setCurrentDirectory(null);
     setError(null);
 
     try {
-      const response = await fetch("/api/search", {
+      const response = await fetch("/api/search/stream", {
         method: "POST",
         headers: {
           "Content-Type": "application/json",
@@ -54,17 +87,37 @@ export default function Home() {
         }),
       });
 
-      if (!response.ok) {
+      if (!response.ok || !response.body) {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
-      const data = await response.json();
-      setSearchResults(data);
+      // The backend streams one JSON event per line; render files as they arrive.
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = "";
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) {
+          break;
+        }
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split("\n");
+        buffered = lines.pop() || "";
+        for (const line of lines) {
+          if (line.trim()) {
+            handleSearchEvent(JSON.parse(line));
+          }
+        }
+      }
+      if (buffered.trim()) {
+        handleSearchEvent(JSON.parse(buffered));
+      }
     } catch (e) {
       console.error("An error occurred during the search:", e);
       setError("An error occurred while searching. Please try again.");
     } finally {
       setIsLoading(false);
+      setCurrentDirectory(null);
     }
   };
 
@@ -176,12 +229,23 @@ export default function Home() {
         </ShimmerButton>
       </main>
 
-      {isLoading && (
+      {isLoading && searchResults && (
+        <div className="mt-4 text-center text-sm text-gray-600">
+          Searching{currentDirectory ? ` ${currentDirectory}` : ""}...
+        </div>
+      )}
+
+      {isLoading && !searchResults && (
         <div className="mt-4 text-center">
           <div className="relative flex size-full max-w-lg items-center justify-center overflow-hidden rounded-lg border bg-background px-40 pb-40 pt-8 md:pb-60 md:shadow-xl">
             <span className="pointer-events-none whitespace-pre-wrap bg-gradient-to-b from-black to-gray-300/80 bg-clip-text text-center text-5xl font-semibold leading-none text-transparent dark:from-white dark:to-slate-900/10">
               Searching...
             </span>
+            {currentDirectory && (
+              <span className="pointer-events-none absolute top-24 text-sm text-gray-500">
+                {currentDirectory}
+              </span>
+            )}
             <Globe className="top-28" />
             <div className="pointer-events-none absolute inset-0 h-full bg-[radial-gradient(circle_at_50%_200%,rgba(0,0,0,0.2),rgba(255,255,255,0))]" />
           </div>
@@ -284,6 +348,7 @@ export default function Home() {
         onSubmit={handleCommentSubmit}
         onClose={handleCommentClose}
         searchResults={searchResults}
+        sessionId={sessionId}
         currentFile={currentFile}
         currentLine={currentLine}
         isOpen={showCommentPopup}
@@ -19,6 +19,7 @@ interface CommentPopupProps {
   onSubmit: (comment: string, response: string) => void;
   onClose: () => void;
   searchResults: SearchResult | null;
+  sessionId: string | null;
   currentFile: string | null;
   currentLine: number | null;
   isOpen: boolean;
@@ -28,6 +29,7 @@ export function CommentPopup({
   onSubmit,
   onClose,
   searchResults,
+  sessionId,
   currentFile,
   currentLine,
   isOpen,
@@ -41,18 +43,27 @@ export function CommentPopup({
     setCommentResponse(null);
 
     try {
-      const response = await fetch("/api/comment", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({
-          query: comment,
-          current_context: searchResults,
-          current_file: currentFile,
-          current_line: currentLine,
-        }),
-      });
+      const ask = (context: object) =>
+        fetch("/api/comment", {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+          },
+          body: JSON.stringify({
+            query: comment,
+            ...context,
+            current_file: currentFile,
+            current_line: currentLine,
+          }),
+        });
+
+      // The backend keeps the search results; only send them if it no longer has them.
+      let response = sessionId
+        ? await ask({ session_id: sessionId })
+        : await ask({ current_context: searchResults });
+      if (sessionId && response.status === 404) {
+        response = await ask({ current_context: searchResults });
+      }
 
       if (!response.ok) {
         throw new Error(`HTTP error! status: ${response.status}`);